@@ -0,0 +1,220 @@
+import os
+import shutil
+import tempfile
+import itertools
+import cPickle as pkl
+import numpy as np
+from harness import case
+from data import write_synthetic_mnist, synthetic_semi_supervised
+
+# The mnist architecture of run_adgmssl_mnist.py.
+CONFIG = dict(n_x=784, n_a=100, n_z=100, n_y=10, a_hidden=[500, 500], z_hidden=[500, 500],
+              xhat_hidden=[500, 500], y_hidden=[500, 500], x_dist='bernoulli')
+
+_compiled = {}
+
+
+def build_model(**kwargs):
+    """
+    Build a seeded model of the benchmark architecture, kwargs override the architecture.
+    """
+    import lasagne
+    from models import ADGMSSL
+    lasagne.random.set_rng(np.random.RandomState(1234))
+    config = dict(CONFIG)
+    config.update(kwargs)
+    model = ADGMSSL(**config)
+    model.reseed(1234)
+    return model
+
+
+def get_compiled(**kwargs):
+    """
+    Build and compile the model once for all cases using the same architecture.
+    """
+    key = repr(sorted(kwargs.items()))
+    if key not in _compiled:
+        model = build_model(**kwargs)
+        f_train, f_test, f_validate, train_args, test_args, validate_args = model.build_model(
+            *synthetic_semi_supervised(n_x=model.n_x, n_y=model.n_y))
+        _compiled[key] = (model, f_train, train_args)
+    return _compiled[key]
+
+
+def _mnist_loader_case(load):
+    def setup():
+        cwd, tmp = os.getcwd(), tempfile.mkdtemp()
+        write_synthetic_mnist(tmp)
+        os.chdir(tmp)  # the mnist loader uses the mnist.pkl.gz in the working directory.
+
+        def teardown():
+            os.chdir(cwd)
+            shutil.rmtree(tmp)
+
+        return {'fn': load, 'teardown': teardown, 'warmup': 0}
+
+    return setup
+
+
+def _load_semi_supervised():
+    from data_preparation import mnist
+    return mnist.load_semi_supervised(n_batches=600, n_labeled=100, n_samples=100, filter_std=0.0,
+                                      seed=123456, train_valid_combine=True)
+
+
+def _load_semi_supervised_split():
+    from data_preparation import mnist
+    return mnist.load_semi_supervised_split(n_labeled=100, filter_std=0.0, seed=123456, train_valid_combine=True)
+
+
+case('load_semi_supervised', repeat=3)(_mnist_loader_case(_load_semi_supervised))
+case('load_semi_supervised_split', repeat=3)(_mnist_loader_case(_load_semi_supervised_split))
+
+
+@case('compile', repeat=1)
+def compile_model():
+    data = synthetic_semi_supervised()
+    return {'fn': lambda: build_model().build_model(*data), 'warmup': 0}
+
+
+def _f_train_case(batchsize, samples, **kwargs):
+    def setup():
+        model, f_train, train_args = get_compiled(**kwargs)
+        inputs = train_args['inputs'].copy()
+        inputs['batchsize'] = batchsize
+        inputs['batchsize_labeled'] = batchsize / 2
+        inputs['samples'] = samples
+        return {'fn': lambda: f_train(0, *inputs.values()), 'items': batchsize}
+
+    return setup
+
+
+for batchsize, samples in itertools.product([100, 200], [1, 10]):
+    case('f_train_bs%i_samples%i' % (batchsize, samples), repeat=5, number=5)(_f_train_case(batchsize, samples))
+    case('f_train_fused_bs%i_samples%i' % (batchsize, samples), repeat=5, number=5)(
+        _f_train_case(batchsize, samples, fuse_projections=True))
+
+
+def _rng_case(backend, batchsize=200, samples=10, n_x=784, n_a=100):
+    """
+    The sampling cost of a batch: seeding the streams from the batch position, binarizing the inputs and drawing
+    the normal samples of q(a|x).
+    """
+    def setup():
+        import theano
+        from lasagne_extensions.random import get_random_streams, counter_seed
+        srng = get_random_streams(backend, 1234)
+        x = theano.shared(np.random.uniform(size=(batchsize, n_x)).astype(theano.config.floatX))
+        outputs = [srng.binomial(size=x.shape, n=1, p=x, dtype=theano.config.floatX).sum(),
+                   srng.normal((batchsize, samples, n_a), dtype=theano.config.floatX).sum()]
+        f = theano.function([], outputs)
+        batch = itertools.count()
+
+        def fn():
+            srng.seed(counter_seed(1234, 1, next(batch)))
+            return f()
+
+        return {'fn': fn, 'items': batchsize}
+
+    return setup
+
+
+case('rng_shared', repeat=5, number=20)(_rng_case('shared'))
+case('rng_counter', repeat=5, number=20)(_rng_case('counter'))
+
+
+def _f_train_reseed_case(batchsize, samples, **kwargs):
+    def setup():
+        model, f_train, train_args = get_compiled(**kwargs)
+        inputs = train_args['inputs'].copy()
+        inputs['batchsize'] = batchsize
+        inputs['batchsize_labeled'] = batchsize / 2
+        inputs['samples'] = samples
+        batch = itertools.count()
+
+        def fn():
+            model.reseed_counter(1234, 1, next(batch))
+            return f_train(0, *inputs.values())
+
+        return {'fn': fn, 'items': batchsize}
+
+    return setup
+
+
+for backend in ['shared', 'counter']:
+    case('f_train_reseed_%s_bs200_samples10' % backend, repeat=5, number=5)(
+        _f_train_reseed_case(200, 10, rng_backend=backend))
+
+
+@case('f_y', repeat=5, number=5)
+def f_y():
+    model = get_compiled()[0]
+    x = np.random.uniform(size=(1000, model.n_x)).astype('float32')
+    return {'fn': lambda: model.f_y(x, 1), 'items': x.shape[0]}
+
+
+@case('f_xhat', repeat=5, number=5)
+def f_xhat():
+    model = get_compiled()[0]
+    z = np.random.standard_normal((1000, model.n_z)).astype('float32')
+    y = np.eye(model.n_y, dtype='float32')[np.arange(1000) % model.n_y]
+    return {'fn': lambda: model.f_xhat(z, y, 1), 'items': z.shape[0]}
+
+
+@case('checkpoint_save', repeat=5)
+def checkpoint_save():
+    from utils import env_paths
+    model = get_compiled()[0]
+    # The run directory and the run registry of the checkpoints are created in a temporary output root.
+    root_path, get_output_path, tmp = model.root_path, env_paths.get_output_path, tempfile.mkdtemp()
+    model.root_path = None
+    env_paths.get_output_path = lambda: tmp
+
+    def teardown():
+        model.root_path = root_path
+        env_paths.get_output_path = get_output_path
+        shutil.rmtree(tmp)
+
+    return {'fn': model.dump_model, 'teardown': teardown}
+
+
+@case('checkpoint_load', repeat=5)
+def checkpoint_load():
+    model = get_compiled()[0]
+    tmp = tempfile.mkdtemp()
+    p = os.path.join(tmp, 'model.pkl')
+    pkl.dump(model.get_param_values(), open(p, 'wb'), protocol=pkl.HIGHEST_PROTOCOL)
+    return {'fn': lambda: model.set_param_values(pkl.load(open(p, 'rb'))), 'teardown': lambda: shutil.rmtree(tmp)}
+
+
+def _embeddings(n=50000, n_queries=1000, d=100, n_clusters=100, seed=1234):
+    """
+    Synthetic clustered float32 embeddings and queries.
+    """
+    rng = np.random.RandomState(seed)
+    centers = rng.standard_normal((n_clusters, d)) * 3
+    x = centers[rng.randint(0, n_clusters, n)] + rng.standard_normal((n, d))
+    queries = centers[rng.randint(0, n_clusters, n_queries)] + rng.standard_normal((n_queries, d))
+    return x.astype('float32'), queries.astype('float32')
+
+
+@case('nn_brute_force', repeat=3)
+def nn_brute_force():
+    from utils.neighbours import brute_force
+    x, queries = _embeddings()
+    return {'fn': lambda: brute_force(queries, x, 10), 'items': queries.shape[0]}
+
+
+def _nn_index_case(**kwargs):
+    def setup():
+        from utils.neighbours import NearestNeighbourIndex
+        x, queries = _embeddings()
+        index = NearestNeighbourIndex(x, **kwargs)
+        return {'fn': lambda: index.search(queries, 10), 'items': queries.shape[0]}
+
+    return setup
+
+
+case('nn_blocked', repeat=3)(_nn_index_case())
+case('nn_random_projection', repeat=3)(_nn_index_case(partitioning='random_projection'))
+case('nn_ivf', repeat=3)(_nn_index_case(partitioning='ivf'))
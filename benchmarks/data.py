@@ -0,0 +1,47 @@
+import os
+import gzip
+import cPickle
+import numpy as np
+
+
+def synthetic_mnist(n_train=50000, n_valid=10000, n_test=10000, n_x=784, n_y=10, seed=1234):
+    """
+    Create a synthetic dataset in the format of mnist.pkl.gz, so that benchmarks run offline.
+    :return: The train, validation and test sets, each a tuple of x (n x n_x float32 in [0,1]) and int labels.
+    """
+    rng = np.random.RandomState(seed)
+    sets = []
+    for n in [n_train, n_valid, n_test]:
+        x = rng.uniform(size=(n, n_x)).astype('float32')
+        x[x < 0.8] = 0.  # sparse as the mnist digits.
+        # Ensure that every class is present, as required by the semi-supervised split.
+        y = np.arange(n, dtype='int64') % n_y
+        rng.shuffle(y)
+        sets.append((x, y))
+    return tuple(sets)
+
+
+def write_synthetic_mnist(path, **kwargs):
+    """
+    Write a synthetic mnist.pkl.gz into the directory path. The mnist loader uses a mnist.pkl.gz in the
+    current working directory before trying to download the dataset.
+    :return: The path of the written file.
+    """
+    p = os.path.join(path, 'mnist.pkl.gz')
+    f = gzip.open(p, 'wb')
+    cPickle.dump(synthetic_mnist(**kwargs), f, protocol=cPickle.HIGHEST_PROTOCOL)
+    f.close()
+    return p
+
+
+def synthetic_semi_supervised(n_batches=50, batchsize=200, n_labeled=100, n_x=784, n_y=10, seed=1234):
+    """
+    Create a synthetic train and test set in the interleaved format of mnist.load_semi_supervised.
+    """
+    rng = np.random.RandomState(seed)
+    n = n_batches * batchsize
+    x = rng.uniform(size=(n, n_x)).astype('float32')
+    t = np.eye(n_y)[rng.randint(0, n_y, n)].astype('float32')
+    x_test = rng.uniform(size=(1000, n_x)).astype('float32')
+    t_test = np.eye(n_y)[rng.randint(0, n_y, 1000)].astype('float32')
+    return (x, t), (x_test, t_test), None
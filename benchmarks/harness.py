@@ -0,0 +1,103 @@
+import sys
+import json
+import time
+import platform
+import numpy as np
+from collections import OrderedDict
+from utils import runtime
+
+# Registered benchmark cases by name.
+CASES = OrderedDict()
+
+
+def case(name, repeat=5, number=1):
+    """
+    Register a benchmark case. The decorated function sets up the case and returns a dict with the timed
+    function 'fn', optionally the number of 'items' processed per call and a 'teardown' function.
+    :param name: The name of the case.
+    :param repeat: The number of timings.
+    :param number: The number of calls per timing.
+    """
+
+    def decorator(setup):
+        CASES[name] = {'setup': setup, 'repeat': repeat, 'number': number}
+        return setup
+
+    return decorator
+
+
+def time_fn(fn, repeat=5, number=1, warmup=1):
+    """
+    Time a function.
+    :return: Dict of the min, median, mean and std of the time per call in seconds.
+    """
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeat):
+        start_time = time.time()
+        for _ in range(number):
+            fn()
+        timings.append((time.time() - start_time) / number)
+    timings = np.array(timings)
+    return OrderedDict([('min', float(timings.min())), ('median', float(np.median(timings))),
+                        ('mean', float(timings.mean())), ('std', float(timings.std())),
+                        ('repeat', repeat), ('number', number)])
+
+
+def run_cases(pattern=None, logger=None):
+    """
+    Run the registered benchmark cases.
+    :param pattern: Only run the cases with this substring in their name.
+    :param logger: Optional function taking a string.
+    :return: Dict of the results and the environment.
+    """
+    results = OrderedDict()
+    for name, c in CASES.items():
+        if pattern is not None and pattern not in name:
+            continue
+        np.random.seed(1234)
+        spec = c['setup']()
+        warmup = spec.get('warmup', 1)
+        result = time_fn(spec['fn'], c['repeat'], c['number'], warmup)
+        if spec.get('items') is not None:
+            result['items'] = spec['items']
+            result['items_per_sec'] = spec['items'] / result['median']
+        if spec.get('teardown') is not None:
+            spec['teardown']()
+        results[name] = result
+        if logger is not None:
+            s = "%s: %0.6fs (median of %i)" % (name, result['median'], result['repeat'])
+            if 'items_per_sec' in result:
+                s += ", %0.1f items/s" % result['items_per_sec']
+            logger(s)
+    environment = OrderedDict([('python', sys.version.split()[0]), ('numpy', np.__version__),
+                               ('platform', platform.platform()), ('runtime', runtime.describe())])
+    return OrderedDict([('environment', environment), ('results', results)])
+
+
+def save_results(results, path):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+def load_results(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def compare(results, baseline, tolerance=0.1):
+    """
+    Compare results against a baseline.
+    :param tolerance: The relative slowdown of the median time that counts as a regression.
+    :return: List of (name, baseline median, median, relative change) of the regressed cases.
+    """
+    regressions = []
+    for name, result in results['results'].items():
+        if name not in baseline['results']:
+            continue
+        base = baseline['results'][name]['median']
+        change = (result['median'] - base) / base
+        if change > tolerance:
+            regressions.append((name, base, result['median'], change))
+    return regressions
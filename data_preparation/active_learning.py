@@ -0,0 +1,115 @@
+import heapq
+import multiprocessing
+import numpy as np
+
+_worker = {}
+
+
+def predictive_uncertainty(p, eps=1e-8):
+    """
+    The predictive entropy and the mutual information between y and the auxiliary a from MC samples of q(y|a,x).
+    :param p: Class probabilities of each sample (n x samples x n_y).
+    :return: The entropy of the mean prediction H[E[y]] (n), the mutual information H[E[y]] - E[H[y]] (n) and the
+    mean prediction (n x n_y).
+    """
+    p_mean = p.mean(axis=1)
+    entropy = -(p_mean * np.log(p_mean + eps)).sum(axis=1)
+    expected_entropy = -(p * np.log(p + eps)).sum(axis=2).mean(axis=1)
+    return entropy, entropy - expected_entropy, p_mean
+
+
+class TopK(object):
+    """
+    The k highest scoring indices of each class, kept in a bounded min-heap per class.
+    """
+
+    def __init__(self, k):
+        self.k = k
+        self.heaps = {}
+
+    def push(self, c, score, idx):
+        heap = self.heaps.setdefault(c, [])
+        if len(heap) < self.k:
+            heapq.heappush(heap, (score, idx))
+        elif score > heap[0][0]:
+            heapq.heapreplace(heap, (score, idx))
+
+    def merge(self, other):
+        for c, heap in other.heaps.items():
+            for score, idx in heap:
+                self.push(c, score, idx)
+
+    def indices(self):
+        """
+        :return: Dict of class to the indices sorted by decreasing score.
+        """
+        return dict((c, [idx for score, idx in sorted(heap, reverse=True)]) for c, heap in self.heaps.items())
+
+
+def _init_worker(classifier_path, pool, exclude):
+    from serving.quantized import QuantizedClassifier
+    _worker['classifier'] = QuantizedClassifier.load(classifier_path)
+    _worker['pool'] = np.load(pool, mmap_mode='r') if isinstance(pool, basestring) else pool
+    _worker['exclude'] = exclude
+
+
+def _score_chunk(args):
+    start, stop, k, measure, samples, batch_size, seed = args
+    x = _worker['pool'][start:stop]
+    p = _worker['classifier'].predict_samples(x, samples, batch_size, seed)
+    entropy, mi, p_mean = predictive_uncertainty(p)
+    scores = mi if measure == 'mi' else entropy
+    top = TopK(k)
+    exclude = _worker['exclude']
+    for i, (c, score) in enumerate(zip(p_mean.argmax(axis=1), scores)):
+        if exclude is None or (start + i) not in exclude:
+            top.push(int(c), float(score), start + i)
+    return top
+
+
+def select(classifier_path, pool, k, measure='mi', samples=10, chunk_size=10000, batch_size=1000, n_workers=None,
+           exclude=None, seed=1234):
+    """
+    Stream an unlabeled pool through the classifier in chunks across a process pool and select the k most
+    uncertain data points of each predicted class. Each worker returns the top k of its chunk, so the memory
+    is bounded by the chunk size and k regardless of the size of the pool.
+    :param classifier_path: The path of a classifier saved by serving.quantized.QuantizedClassifier.save.
+    :param pool: The path of an .npy file of the pool (n x n_x), which is memory-mapped by the workers, or an array.
+    :param k: The number of data points per class.
+    :param measure: 'mi' for the mutual information between y and a, or 'entropy' for the predictive entropy.
+    :param samples: The number of MC samples of a.
+    :param chunk_size: The number of rows of the pool per task.
+    :param batch_size: The number of rows per batch of the classifier.
+    :param n_workers: The number of worker processes, defaults to the number of CPUs.
+    :param exclude: Optional indices of the pool that are not selected, e.g. the labeled data points.
+    :param seed: The seed of the samples, each chunk is seeded by its offset.
+    :return: Dict of class to the selected indices sorted by decreasing score.
+    """
+    if measure not in ['mi', 'entropy']:
+        raise ValueError("Unknown measure %s, expected 'mi' or 'entropy'." % measure)
+    n = (np.load(pool, mmap_mode='r') if isinstance(pool, basestring) else pool).shape[0]
+    exclude = None if exclude is None else set(int(i) for i in exclude)
+    tasks = [(start, min(start + chunk_size, n), k, measure, samples, batch_size, seed + start)
+             for start in xrange(0, n, chunk_size)]
+    top = TopK(k)
+    workers = multiprocessing.Pool(n_workers, _init_worker, (classifier_path, pool, exclude))
+    try:
+        for chunk_top in workers.imap_unordered(_score_chunk, tasks):
+            top.merge(chunk_top)
+    finally:
+        workers.terminate()
+    return top.indices()
+
+
+def save_index(path, selected):
+    """
+    Save the selected indices of all classes as the labeled set, cf. mnist.load_semi_supervised(labeled_idx=...).
+    :param selected: Dict of class to indices, or array of indices.
+    """
+    if isinstance(selected, dict):
+        selected = np.concatenate([selected[c] for c in sorted(selected)])
+    np.save(path, np.asarray(selected, dtype='int64'))
+
+
+def load_index(path):
+    return np.load(path)
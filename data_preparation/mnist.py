@@ -3,6 +3,7 @@ import gzip
 import cPickle
 import numpy as np
 from utils import env_paths
+import preprocessing
 
 
 def _download():
@@ -52,15 +53,20 @@ def _pad_targets(xy):
     return x, y
 
 
-def _create_semi_supervised(xy, n_labeled, rng):
+def _create_semi_supervised(xy, n_labeled, rng, labeled_idx=None):
     """
     Divide the dataset into labeled and unlabeled data.
     :param xy: The training set of the mnist data.
     :param n_labeled: The number of labeled data points.
     :param rng: NumPy random generator.
+    :param labeled_idx: Optional indices of the labeled data points in the training set, instead of a random
+    selection of n_labeled data points, e.g. selected by active_learning.select.
     :return: labeled x, labeled y, unlabeled x, unlabeled y.
     """
     x, y = xy
+    if labeled_idx is not None:
+        labeled_idx = np.asarray(labeled_idx, dtype='int64')
+        x_l, y_l = x[labeled_idx], np.eye(10)[y[labeled_idx]]
 
     def _split_by_class(x, y, num_classes):
         result_x = [0] * num_classes
@@ -83,6 +89,8 @@ def _create_semi_supervised(xy, n_labeled, rng):
         y[i] = binarize_labels(y[i])
 
     n_classes = y[0].shape[0]
+    if labeled_idx is not None:
+        return x_l, y_l, np.hstack(x).T, np.hstack(y).T
     if n_labeled % n_classes != 0:
         raise ("n_labeled (wished number of labeled samples) not divisible by n_classes (number of classes)")
     n_labels_per_class = n_labeled / n_classes
@@ -100,10 +108,24 @@ def _create_semi_supervised(xy, n_labeled, rng):
     return np.hstack(x_labeled).T, np.hstack(y_labeled).T, np.hstack(x_unlabeled).T, np.hstack(y_unlabeled).T
 
 
-def load_supervised(filter_std=0.1, train_valid_combine=False):
+def _filter_features(x, filter_std, column_mask):
+    """
+    The column mask of the features with a standard deviation above filter_std, computed in a streaming pass over x.
+    :return: Boolean column mask, or None if no features are filtered.
+    """
+    if column_mask is not None:
+        return np.asarray(column_mask, dtype=bool)
+    if filter_std > .0:
+        return preprocessing.std_mask(x, filter_std)
+    return None
+
+
+def load_supervised(filter_std=0.1, train_valid_combine=False, column_mask=None, return_mask=False):
     """
     Load the mnist dataset.
     :param shared_variables: True if the data shall be embedded in a shared variable.
+    :param column_mask: Boolean mask of the features to keep, e.g. saved with a model, instead of filter_std.
+    :param return_mask: If the column mask (None if no features are filtered) is returned as well.
     :return: The train, test and validation sets.
     """
     train_set, test_set, valid_set = _download()
@@ -112,23 +134,23 @@ def load_supervised(filter_std=0.1, train_valid_combine=False):
         train_set = np.append(train_set[0], valid_set[0], axis=0), np.append(train_set[1], valid_set[1], axis=0)
 
     # Filter out the features with a low standard deviation.
-    if filter_std > .0:
-        train_x, train_t = train_set
-        idx_keep = np.std(train_x, axis=0) > filter_std
-        train_x = train_x[:, idx_keep]
-        valid_set = (valid_set[0][:, idx_keep], valid_set[1])
-        test_set = (test_set[0][:, idx_keep], test_set[1])
-        train_set = (train_x, train_t)
+    idx_keep = _filter_features(train_set[0], filter_std, column_mask)
+    if idx_keep is not None:
+        train_set = (preprocessing.gather_columns(train_set[0], idx_keep), train_set[1])
+        valid_set = (preprocessing.gather_columns(valid_set[0], idx_keep), valid_set[1])
+        test_set = (preprocessing.gather_columns(test_set[0], idx_keep), test_set[1])
 
     test_set = _pad_targets(test_set)
     valid_set = _pad_targets(valid_set)
     train_set = _pad_targets(train_set)
 
+    if return_mask:
+        return train_set, test_set, valid_set, idx_keep
     return train_set, test_set, valid_set
 
 
 def load_semi_supervised(n_batches=100, n_labeled=100, n_samples=100, filter_std=0.1, seed=123456,
-                         train_valid_combine=False):
+                         train_valid_combine=False, column_mask=None, return_mask=False, labeled_idx=None):
     """
     Load the mnist dataset where only a fraction of data points are labeled. The amount
     of labeled data will be evenly distributed accross classes.
@@ -138,6 +160,10 @@ def load_semi_supervised(n_batches=100, n_labeled=100, n_samples=100, filter_std
     :param filter_std: the standard deviation threshold for keeping features.
     :param seed: the seed for the pseudo random shuffle of data points.
     :param train_valid_combine: if the train set and validation set should be combined.
+    :param column_mask: boolean mask of the features to keep, e.g. saved with a model, instead of filter_std.
+    :param return_mask: if the column mask (None if no features are filtered) is returned as well.
+    :param labeled_idx: indices of the labeled data points in the (combined) train set instead of a random
+    selection, e.g. saved by active_learning.save_index. n_labeled is the number of indices.
     :return: train set, test set, validation set.
     """
     train_set, test_set, valid_set = _download()
@@ -145,6 +171,8 @@ def load_semi_supervised(n_batches=100, n_labeled=100, n_samples=100, filter_std
     if train_valid_combine:
         train_set = np.append(train_set[0], valid_set[0], axis=0), np.append(train_set[1], valid_set[1], axis=0)
 
+    if labeled_idx is not None:
+        n_labeled = len(labeled_idx)
     # number of data points in train set including the replicated labeled data.
     n = (train_set[0].shape[0]) + (n_samples * n_batches)
     # the frequency for the labeled data points to appear in the data set.
@@ -152,14 +180,14 @@ def load_semi_supervised(n_batches=100, n_labeled=100, n_samples=100, filter_std
     rng = np.random.RandomState(seed=seed)
 
     # Create the labeled and unlabeled data evenly distributed across classes.
-    x_l, y_l, x_u, y_u = _create_semi_supervised(train_set, n_labeled, rng)
+    x_l, y_l, x_u, y_u = _create_semi_supervised(train_set, n_labeled, rng, labeled_idx)
 
     # Filter out the features with a low standard deviation.
-    if filter_std > .0:
-        idx_keep = np.std(x_u, axis=0) > filter_std
-        x_l, x_u = x_l[:, idx_keep], x_u[:, idx_keep]
-        valid_set = (valid_set[0][:, idx_keep], valid_set[1])
-        test_set = (test_set[0][:, idx_keep], test_set[1])
+    idx_keep = _filter_features(x_u, filter_std, column_mask)
+    if idx_keep is not None:
+        x_l, x_u = preprocessing.gather_columns(x_l, idx_keep), preprocessing.gather_columns(x_u, idx_keep)
+        valid_set = (preprocessing.gather_columns(valid_set[0], idx_keep), valid_set[1])
+        test_set = (preprocessing.gather_columns(test_set[0], idx_keep), test_set[1])
 
     # Interleave labelled and unlabelled datasets
     col_x, col_y = np.zeros((n, x_l.shape[1])), np.zeros((n, y_l.shape[1]))
@@ -187,4 +215,47 @@ def load_semi_supervised(n_batches=100, n_labeled=100, n_samples=100, filter_std
     valid_set = _pad_targets(valid_set)
     test_set = _pad_targets(test_set)
 
+    if return_mask:
+        return train_set, test_set, valid_set, idx_keep
+    return train_set, test_set, valid_set
+
+
+def load_semi_supervised_split(n_labeled=100, filter_std=0.1, seed=123456, train_valid_combine=False,
+                               column_mask=None, return_mask=False, labeled_idx=None):
+    """
+    Load the mnist dataset where only a fraction of data points are labeled, keeping the labeled and unlabeled
+    data points in separate stores. In contrast to load_semi_supervised the labeled data points are stored only
+    once, the labeled part of each batch is sampled from the labeled store during training.
+    :param n_labeled: number of labeled data points.
+    :param filter_std: the standard deviation threshold for keeping features.
+    :param seed: the seed for the pseudo random selection of labeled data points.
+    :param train_valid_combine: if the train set and validation set should be combined.
+    :param column_mask: boolean mask of the features to keep, e.g. saved with a model, instead of filter_std.
+    :param return_mask: if the column mask (None if no features are filtered) is returned as well.
+    :param labeled_idx: indices of the labeled data points in the (combined) train set instead of a random
+    selection, e.g. saved by active_learning.save_index.
+    :return: train set (x_u, x_l, t_l), test set, validation set.
+    """
+    train_set, test_set, valid_set = _download()
+    # Combine the train set and validation set.
+    if train_valid_combine:
+        train_set = np.append(train_set[0], valid_set[0], axis=0), np.append(train_set[1], valid_set[1], axis=0)
+    rng = np.random.RandomState(seed=seed)
+
+    # Create the labeled and unlabeled data evenly distributed across classes.
+    x_l, y_l, x_u, y_u = _create_semi_supervised(train_set, n_labeled, rng, labeled_idx)
+
+    # Filter out the features with a low standard deviation.
+    idx_keep = _filter_features(x_u, filter_std, column_mask)
+    if idx_keep is not None:
+        x_l, x_u = preprocessing.gather_columns(x_l, idx_keep), preprocessing.gather_columns(x_u, idx_keep)
+        valid_set = (preprocessing.gather_columns(valid_set[0], idx_keep), valid_set[1])
+        test_set = (preprocessing.gather_columns(test_set[0], idx_keep), test_set[1])
+
+    train_set = (x_u, x_l, y_l)
+    valid_set = _pad_targets(valid_set)
+    test_set = _pad_targets(test_set)
+
+    if return_mask:
+        return train_set, test_set, valid_set, idx_keep
     return train_set, test_set, valid_set
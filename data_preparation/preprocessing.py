@@ -0,0 +1,82 @@
+import numpy as np
+
+
+def _chunks(x, chunk_size):
+    """
+    Iterate over the row chunks of an array, e.g. a memory-mapped .npy file, or over an iterable of chunks.
+    """
+    if not hasattr(x, 'shape'):
+        for chunk in x:
+            yield chunk
+        return
+    for i in xrange(0, x.shape[0], chunk_size):
+        yield x[i:i + chunk_size]
+
+
+def column_moments(x, chunk_size=10000):
+    """
+    Compute the column means and sums of squared deviations in a single streaming pass over row chunks,
+    combining the chunks with the parallel variant of Welford's algorithm (Chan et al., 1979).
+    :param x: Array (n x d), e.g. memory-mapped, or an iterable of chunks (n_i x d).
+    :param chunk_size: The number of rows per chunk if x is an array.
+    :return: The number of rows n, the column means and the column sums of squared deviations.
+    """
+    n, mean, m2 = 0, None, None
+    for chunk in _chunks(x, chunk_size):
+        chunk = np.asarray(chunk, dtype='float64')
+        n_b = chunk.shape[0]
+        if n_b == 0:
+            continue
+        mean_b = chunk.mean(axis=0)
+        m2_b = ((chunk - mean_b) ** 2).sum(axis=0)
+        if mean is None:
+            n, mean, m2 = n_b, mean_b, m2_b
+            continue
+        delta = mean_b - mean
+        total = n + n_b
+        mean = mean + delta * (float(n_b) / total)
+        m2 = m2 + m2_b + delta ** 2 * (float(n) * n_b / total)
+        n = total
+    return n, mean, m2
+
+
+def column_std(x, chunk_size=10000):
+    """
+    The column standard deviations of x, equal to np.std(x, axis=0), computed in a streaming pass.
+    """
+    n, mean, m2 = column_moments(x, chunk_size)
+    return np.sqrt(m2 / n)
+
+
+def std_mask(x, filter_std, chunk_size=10000):
+    """
+    Select the columns with a standard deviation above a threshold.
+    :return: Boolean column mask.
+    """
+    return column_std(x, chunk_size) > filter_std
+
+
+def gather_columns(x, mask, chunk_size=10000, out=None):
+    """
+    Copy the selected columns of x chunk by chunk into a single output, so that only the filtered matrix is
+    materialized.
+    :param x: Array (n x d), e.g. memory-mapped.
+    :param mask: Boolean column mask (d).
+    :param chunk_size: The number of rows per chunk.
+    :param out: Optional output (n x mask.sum()), e.g. created by np.lib.format.open_memmap.
+    :return: The filtered matrix.
+    """
+    idx = np.where(mask)[0]
+    if out is None:
+        out = np.empty((x.shape[0], len(idx)), dtype=x.dtype)
+    for i in xrange(0, x.shape[0], chunk_size):
+        out[i:i + chunk_size] = np.take(x[i:i + chunk_size], idx, axis=1)
+    return out
+
+
+def save_mask(mask, path):
+    np.save(path, np.asarray(mask, dtype=bool))
+
+
+def load_mask(path):
+    return np.load(path)
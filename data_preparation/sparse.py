@@ -0,0 +1,66 @@
+import numpy as np
+import scipy.sparse as sp
+
+
+def save_csr(path, x, t):
+    """
+    Save a sparse dataset, e.g. bag-of-words counts, in the CSR format.
+    :param path: The path of the .npz file.
+    :param x: Sparse or dense matrix of data points (n x n_x).
+    :param t: Vector of class labels (n).
+    """
+    x = sp.csr_matrix(x)
+    np.savez(path, data=x.data, indices=x.indices, indptr=x.indptr, shape=x.shape, t=np.asarray(t, dtype='int32'))
+
+
+def load_csr(path):
+    """
+    Load a sparse dataset saved by save_csr.
+    :param path: The path of the .npz file.
+    :return: CSR matrix x and vector of class labels t.
+    """
+    f = np.load(path)
+    x = sp.csr_matrix((f['data'], f['indices'], f['indptr']), shape=tuple(f['shape']))
+    return x, f['t']
+
+
+def _one_hot(t, n_classes):
+    y = np.zeros((len(t), n_classes))
+    y[np.arange(len(t)), t] = 1
+    return y
+
+
+def load_semi_supervised(train_path, test_path, valid_path=None, n_labeled=100, seed=123456, labeled_idx=None):
+    """
+    Load a sparse dataset where only a fraction of data points are labeled, keeping the labeled and unlabeled
+    data points in separate stores (cf. mnist.load_semi_supervised_split). The amount of labeled data will be
+    evenly distributed across classes. The inputs stay CSR matrices, so the model must use sparse_x. The values
+    are used as bernoulli probabilities and must be in [0, 1], e.g. binarized counts.
+    :param train_path: The path of the train set saved by save_csr.
+    :param test_path: The path of the test set saved by save_csr.
+    :param valid_path: The path of the validation set saved by save_csr.
+    :param n_labeled: number of labeled data points.
+    :param seed: the seed for the pseudo random selection of labeled data points.
+    :param labeled_idx: indices of the labeled data points instead of a random selection, e.g. saved by
+    active_learning.save_index.
+    :return: train set (x_u, x_l, t_l), test set, validation set.
+    """
+    x, t = load_csr(train_path)
+    n_classes = int(t.max()) + 1
+    if labeled_idx is not None:
+        idx_l = np.asarray(labeled_idx, dtype='int64')
+    elif n_labeled % n_classes != 0:
+        raise ValueError("n_labeled (wished number of labeled samples) not divisible by n_classes.")
+    else:
+        rng = np.random.RandomState(seed=seed)
+        idx_l = np.concatenate([rng.permutation(np.where(t == i)[0])[:n_labeled / n_classes]
+                                for i in range(n_classes)])
+    train_set = (x, x[idx_l], _one_hot(t[idx_l], n_classes))
+
+    x_test, t_test = load_csr(test_path)
+    test_set = (x_test, _one_hot(t_test, n_classes))
+    valid_set = None
+    if valid_path is not None:
+        x_valid, t_valid = load_csr(valid_path)
+        valid_set = (x_valid, _one_hot(t_valid, n_classes))
+    return train_set, test_set, valid_set
@@ -2,3 +2,4 @@ from . import layers
 from . import objectives
 from . import updates
 from . import nonlinearities
+from . import random
@@ -1,3 +1,5 @@
 from .variationallayer import *
 from lasagne.layers import *
-from parmesan.layers import *
\ No newline at end of file
+from parmesan.layers import *
+from .dense import *
+from .ensemble import *
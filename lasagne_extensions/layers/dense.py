@@ -0,0 +1,84 @@
+import lasagne
+import theano.sparse
+import theano.tensor as T
+from lasagne import init
+from lasagne import nonlinearities
+from lasagne.utils import floatX
+
+__all__ = ["DenseLayer", "DenseGroup"]
+
+
+class DenseLayer(lasagne.layers.DenseLayer):
+    """
+    A :class:'lasagne.layers.DenseLayer' that keeps its initializers, so that the params
+    can be re-initialized in place without rebuilding or recompiling the model.
+    Sparse inputs, e.g. CSR bag-of-words data, are multiplied with the weights over their nonzeros only.
+    """
+
+    def __init__(self, incoming, num_units, W=init.GlorotUniform(), b=init.Constant(0.),
+                 nonlinearity=nonlinearities.rectify, **kwargs):
+        super(DenseLayer, self).__init__(incoming, num_units, W, b, nonlinearity, **kwargs)
+        self.W_init = W
+        self.b_init = b
+        self.group = None  # The DenseGroup of the layer, if any.
+
+    def reset_params(self):
+        """
+        Draw new values for the params from the initializers, using the lasagne random generator.
+        """
+        for param, spec in [(self.W, self.W_init), (self.b, self.b_init)]:
+            if param is not None and isinstance(spec, init.Initializer):
+                param.set_value(floatX(spec(param.get_value(borrow=True).shape)), borrow=True)
+
+    def get_output_for(self, input, **kwargs):
+        if self.group is not None:
+            activation = self.group.get_activation(self, input)
+        elif isinstance(input.type, theano.sparse.SparseType):
+            activation = _dot(input, self.W)
+        else:
+            return super(DenseLayer, self).get_output_for(input, **kwargs)
+        if self.b is not None:
+            activation = activation + self.b.dimshuffle('x', 0)
+        return self.nonlinearity(activation)
+
+
+class DenseGroup(object):
+    """
+    Dense layers on the same input layer that compute their activations from one matrix product of the input with
+    their concatenated weights (n_in x sum(num_units)), instead of a matrix product per layer. Which layers share
+    the product is declared per input variable by fuse, since a graph may only consume some of the layers on an
+    input, and the product is then built once per input variable, so the backward pass is a single matrix product
+    as well. The layers keep their own params, hence the param order and saved models are unchanged.
+    """
+
+    def __init__(self, layers):
+        self.layers = list(layers)
+        self.input_layer = self.layers[0].input_layer
+        for layer in self.layers:
+            layer.group = self
+        self._members = {}
+        self._products = {}
+
+    def fuse(self, input, layers):
+        """
+        Compute the activations of the given layers on an input variable from one product. The other layers of
+        the group compute their own product on that variable, as do all layers on variables without a fuse.
+        :param input: The variable of the input layer, e.g. the inputs given to get_output.
+        :param layers: The layers of the group that are consumed on that variable.
+        """
+        self._members[input] = tuple(l for l in self.layers if l in layers)
+
+    def get_activation(self, layer, input):
+        members = self._members.get(input, ())
+        if len(members) < 2 or layer not in members:
+            return _dot(input, layer.W)
+        if (input, members) not in self._products:
+            self._products[(input, members)] = _dot(input, T.concatenate([l.W for l in members], axis=1))
+        offset = sum(l.num_units for l in members[:members.index(layer)])
+        return self._products[(input, members)][:, offset:offset + layer.num_units]
+
+
+def _dot(input, W):
+    if isinstance(input.type, theano.sparse.SparseType):
+        return theano.sparse.structured_dot(input, W)
+    return T.dot(input, W)
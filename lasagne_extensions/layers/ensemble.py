@@ -0,0 +1,87 @@
+import numpy as np
+import theano.tensor as T
+from lasagne import init
+from lasagne import nonlinearities
+from lasagne.layers.base import Layer
+from lasagne.utils import floatX
+
+__all__ = ["EnsembleDenseLayer", "ReplicateLayer"]
+
+
+class EnsembleDenseLayer(Layer):
+    """
+    Independent dense layers of n_replicas replicas of a model, computed in a single layer. The replicas are
+    stacked along the batch axis in replica-major order, i.e. rows [r * n, (r + 1) * n) belong to replica r.
+    The weights have a leading replica axis, W (n_replicas x n_in x n_out) and b (n_replicas x n_out).
+    If expand is True, the input is shared by all replicas (n x n_in) and is multiplied with all replica weights
+    in a single wide matrix product. Otherwise the input holds all replicas (n_replicas * n x n_in) and a batched
+    matrix product is used.
+    """
+
+    def __init__(self, incoming, num_units, n_replicas, W=init.GlorotUniform(), b=init.Constant(0.),
+                 nonlinearity=nonlinearities.rectify, expand=False, **kwargs):
+        super(EnsembleDenseLayer, self).__init__(incoming, **kwargs)
+        self.nonlinearity = nonlinearities.identity if nonlinearity is None else nonlinearity
+        self.num_units = num_units
+        self.n_replicas = n_replicas
+        self.expand = expand
+        self.W_init = W
+        self.b_init = b
+        num_inputs = int(np.prod(self.input_shape[1:]))
+        self.W = self.add_param(self._replicated(W), (n_replicas, num_inputs, num_units), name="W")
+        if b is None:
+            self.b = None
+        else:
+            self.b = self.add_param(self._replicated(b), (n_replicas, num_units), name="b", regularizable=False)
+
+    @staticmethod
+    def _replicated(spec):
+        """
+        Initialize each replica separately, so that e.g. the Glorot scaling uses the shape of a single replica.
+        """
+        if not isinstance(spec, init.Initializer):
+            return spec
+        return lambda shape: np.asarray([spec(shape[1:]) for _ in range(shape[0])])
+
+    def reset_params(self):
+        for param, spec in [(self.W, self.W_init), (self.b, self.b_init)]:
+            if param is not None and isinstance(spec, init.Initializer):
+                param.set_value(floatX(self._replicated(spec)(param.get_value(borrow=True).shape)), borrow=True)
+
+    def get_output_shape_for(self, input_shape):
+        n = input_shape[0]
+        if self.expand and n is not None:
+            n *= self.n_replicas
+        return (n, self.num_units)
+
+    def get_output_for(self, input, **kwargs):
+        if input.ndim > 2:
+            input = input.flatten(2)
+        if self.expand:
+            # One matrix product of the shared input with the weights of all replicas (n_in x n_replicas * n_out).
+            W = self.W.dimshuffle(1, 0, 2).reshape((self.W.shape[1], -1))
+            activation = T.dot(input, W).reshape((input.shape[0], self.n_replicas, self.num_units))
+            activation = activation.dimshuffle(1, 0, 2)
+        else:
+            activation = T.batched_dot(input.reshape((self.n_replicas, -1, input.shape[1])), self.W)
+        if self.b is not None:
+            activation = activation + self.b.dimshuffle(0, 'x', 1)
+        return self.nonlinearity(activation.reshape((-1, self.num_units)))
+
+
+class ReplicateLayer(Layer):
+    """
+    Repeat the input for each replica of an ensemble in replica-major order along the batch axis,
+    e.g. for the targets of the density layers.
+    """
+
+    def __init__(self, incoming, n_replicas, **kwargs):
+        super(ReplicateLayer, self).__init__(incoming, **kwargs)
+        self.n_replicas = n_replicas
+
+    def get_output_shape_for(self, input_shape):
+        n = input_shape[0] * self.n_replicas if input_shape[0] is not None else None
+        return (n,) + tuple(input_shape[1:])
+
+    def get_output_for(self, input, **kwargs):
+        return T.tile(input, (self.n_replicas,) + (1,) * (input.ndim - 1))
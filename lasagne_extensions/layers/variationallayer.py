@@ -1,10 +1,20 @@
 import numpy as np
+import theano.sparse
 import theano.tensor as T
 import lasagne
 from lasagne.layers.base import Layer
 import math
 
 
+def _float32(x):
+    """
+    Cast float16 inputs to float32, so that the log-densities are reduced in float32 (cf. ADGMSSL mixed_precision).
+    """
+    if isinstance(x, T.Variable) and x.dtype == 'float16':
+        return T.cast(x, 'float32')
+    return x
+
+
 class GaussianLogDensityLayer(lasagne.layers.MergeLayer):
     def __init__(self, x, mu, var, **kwargs):
         self.x, self.mu, self.var = None, None, None
@@ -24,6 +34,7 @@ class GaussianLogDensityLayer(lasagne.layers.MergeLayer):
         x = self.x if self.x is not None else input.pop(0)
         mu = self.mu if self.mu is not None else input.pop(0)
         logvar = self.var if self.var is not None else input.pop(0)
+        x, mu, logvar = _float32(x), _float32(mu), _float32(logvar)
 
         c = - 0.5 * math.log(2 * math.pi)
         density = c - logvar / 2 - (x - mu) ** 2 / (2 * T.exp(logvar))
@@ -46,6 +57,7 @@ class GaussianMarginalLogDensityLayer(lasagne.layers.MergeLayer):
     def get_output_for(self, input, **kwargs):
         mu = self.mu if self.mu is not None else input.pop(0)
         logvar = self.var if self.var is not None else input.pop(0)
+        mu, logvar = _float32(mu), _float32(logvar)
 
         if mu == 1:
             density = -0.5 * (T.log(2 * np.pi) + 1 + logvar)
@@ -72,14 +84,33 @@ class BernoulliLogDensityLayer(lasagne.layers.MergeLayer):
     def get_output_for(self, input, **kwargs):
         x_mu = input.pop(0)
         x = self.x if self.x is not None else input.pop(0)
+        x_mu, x = _float32(x_mu), _float32(x)
+        x_mu = T.clip(x_mu, self.eps, 1 - self.eps)
+        if isinstance(x.type, theano.sparse.SparseType):
+            return self._sparse_density(x_mu, x)
 
         if x_mu.ndim > x.ndim:  # Check for sample dimensions.
             x = x.dimshuffle((0, 'x', 'x', 1))
 
-        x_mu = T.clip(x_mu, self.eps, 1 - self.eps)
         density = T.sum(-T.nnet.binary_crossentropy(x_mu, x), axis=-1, keepdims=True)
         return density
 
+    @staticmethod
+    def _sparse_density(x_mu, x):
+        """
+        The log-density of a sparse x, sum(log(1 - mu)) + sum(x * logit(mu)), where the second sum is only
+        computed at the nonzeros of x.
+        """
+        ndim, shape = x_mu.ndim, x_mu.shape
+        if ndim > 2:  # Repeat the rows of x for each sample, the rows of x_mu are ordered by data point.
+            x_mu = x_mu.reshape((-1, shape[-1]))
+            x = theano.sparse.basic.get_item_list(x, T.arange(x.shape[0]).repeat(x_mu.shape[0] // x.shape[0]))
+        log_1m_mu = T.log1p(-x_mu)
+        logit_mu = T.log(x_mu) - log_1m_mu
+        density = log_1m_mu.sum(axis=1) + theano.sparse.sp_sum(theano.sparse.mul(x, logit_mu), axis=1,
+                                                               sparse_grad=True)
+        return density.reshape([shape[i] for i in range(ndim - 1)] + [1], ndim=ndim)
+
 
 class MultinomialLogDensityLayer(lasagne.layers.MergeLayer):
     def __init__(self, x_mu, x, eps=1e-8, **kwargs):
@@ -98,6 +129,7 @@ class MultinomialLogDensityLayer(lasagne.layers.MergeLayer):
     def get_output_for(self, input, **kwargs):
         x_mu = input.pop(0)
         x = self.x if self.x is not None else input.pop(0)
+        x_mu, x = _float32(x_mu), _float32(x)
 
         # Avoid Nans
         x_mu += self.eps
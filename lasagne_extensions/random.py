@@ -0,0 +1,118 @@
+import numpy as np
+import theano
+import theano.tensor as T
+from theano.tensor.shared_randomstreams import RandomStreams
+
+_MASK = 0xFFFFFFFF
+
+
+def _mul32(x, c):
+    """
+    (x * c) mod 2 ** 32 for 0 <= x < 2 ** 32, with the constant split in 16 bit halves, so that the int64
+    products never overflow.
+    """
+    return (x * (c & 0xFFFF) + ((x * (c >> 16)) & 0xFFFF) * 0x10000) & _MASK
+
+
+def hash32(x):
+    """
+    Integer hash of 32 bit values in int64 (lowbias32 by C. Wellons), using only operations of the same semantics
+    for NumPy arrays and Theano tensors. Right shifts are divisions, as the values are non-negative.
+    """
+    x = x ^ (x // 0x10000)
+    x = _mul32(x, 0x7feb352d)
+    x = x ^ (x // 0x8000)
+    x = _mul32(x, 0x846ca68b)
+    return x ^ (x // 0x10000)
+
+
+def counter_seed(seed, *counters):
+    """
+    Seed of a unit of work, e.g. counter_seed(seed, epoch, batch, worker), so that its samples only depend on
+    the seed and the counters, and not on the work done before or in other processes.
+    """
+    s = hash32(np.int64(seed & _MASK))
+    for c in counters:
+        s = hash32(s ^ np.int64(c & _MASK))
+    return int(s)
+
+
+class CounterRandomStreams(object):
+    """
+    Counter-based random streams computed in the graph, as a replacement of the RandomStreams of the sampling
+    layers and the input binarization. Each element is a hash of the seed, a call counter, the draw and the
+    element index, so there is no generator state on the host and no state transfer per call. The counter is
+    a shared variable that is incremented by every call of a function using the streams, and it is reset by
+    seed, e.g. to counter_seed(seed, epoch, batch, worker) before each batch.
+    The interface is the subset of RandomStreams used by the models: uniform, normal, binomial with n=1 and
+    random_integers.
+    """
+
+    def __init__(self, seed=123):
+        self.sh_seed = theano.shared(np.int64(0), name='rng_seed')
+        self.sh_counter = theano.shared(np.int64(0), name='rng_counter')
+        self.sh_counter.default_update = self.sh_counter + 1
+        self.n_draws = 0
+        self.seed(seed)
+
+    def seed(self, seed):
+        self.sh_seed.set_value(np.int64(hash32(np.int64(seed & _MASK))))
+        self.sh_counter.set_value(np.int64(0))
+
+    def _bits(self, size, ndim=None):
+        """
+        :return: 32 bit hashes of the shape size, flattened, and the shape.
+        """
+        if ndim is None:
+            ndim = len(size) if isinstance(size, (tuple, list)) else T.get_vector_length(size)
+        size = T.as_tensor_variable(size, ndim=1) if isinstance(size, (tuple, list)) else size
+        self.n_draws += 1
+        key = hash32(hash32(self.sh_seed ^ (self.n_draws & _MASK)) ^ (self.sh_counter & _MASK))
+        index = T.arange(T.prod(size), dtype='int64')
+        return hash32(hash32(index ^ key) ^ hash32(key ^ 0x5bd1e995)), size, ndim
+
+    @staticmethod
+    def _uniform01(bits, dtype):
+        # The upper 24 bits as a float in the open interval (0, 1). The top value 1 - 2 ** -25 would round to 1 in
+        # float32, so it is clamped to the largest float32 below 1 before the cast.
+        u = (bits // 0x100).astype('float64') * 2. ** -24 + 2. ** -25
+        return T.cast(T.minimum(u, 1. - 2. ** -24), dtype)
+
+    def uniform(self, size, low=0.0, high=1.0, ndim=None, dtype=None):
+        dtype = theano.config.floatX if dtype is None else dtype
+        bits, size, ndim = self._bits(size, ndim)
+        u = self._uniform01(bits, dtype).reshape(size, ndim=ndim)
+        return T.cast(low + (high - low) * u, dtype)
+
+    def normal(self, size, avg=0.0, std=1.0, ndim=None, dtype=None):
+        """
+        Normal samples by the Box-Muller transform of two uniform samples.
+        """
+        dtype = theano.config.floatX if dtype is None else dtype
+        bits, size, ndim = self._bits(size, ndim)
+        u1 = self._uniform01(bits, dtype)
+        u2 = self._uniform01(hash32(bits ^ 0x27d4eb2d), dtype)
+        z = (T.sqrt(-2. * T.log(u1)) * T.cos(np.float32(2. * np.pi) * u2)).reshape(size, ndim=ndim)
+        return T.cast(avg + std * z, dtype)
+
+    def binomial(self, size, n=1, p=0.5, ndim=None, dtype='int64'):
+        if n != 1:
+            raise ValueError("CounterRandomStreams only samples binomials with n=1.")
+        return T.cast(T.lt(self.uniform(size, ndim=ndim, dtype=theano.config.floatX), p), dtype)
+
+    def random_integers(self, size, low=0, high=1, ndim=None, dtype='int64'):
+        u = self.uniform(size, ndim=ndim, dtype='float64')
+        return T.cast(T.floor(u * (high - low + 1)), dtype) + low
+
+
+def get_random_streams(backend='shared', seed=None):
+    """
+    :param backend: 'shared' for the host RandomStreams of Theano, 'counter' for CounterRandomStreams.
+    :param seed: The initial seed, None leaves the RandomStreams unseeded and the CounterRandomStreams at their
+    default seed.
+    """
+    if backend == 'shared':
+        return RandomStreams(seed)
+    if backend == 'counter':
+        return CounterRandomStreams() if seed is None else CounterRandomStreams(seed)
+    raise ValueError("Unknown random streams backend %s, expected 'shared' or 'counter'." % backend)
@@ -1,10 +1,127 @@
 import theano
 import theano.tensor as T
 import numpy as np
+from collections import OrderedDict
 from lasagne.updates import get_or_compute_grads
 from lasagne.updates import *
 
 
+def fused_adam(grads, params, learning_rate=0.001, beta1=0.9, beta2=0.999, epsilon=1e-8, gamma=1.,
+               grad_scale=1., prior_grads=None, grad_divisor=1., max_norm=None, clip_grad=None,
+               correct_epsilon=False, replica_norm=False, return_norm=False):
+    """
+    ADAM update rules where the gradient preprocessing is folded into the update expression of each parameter.
+    The effective gradient of a parameter is
+
+        g = clip(((grad * grad_scale + prior_grad) / grad_divisor) * m, -clip_grad, clip_grad)
+
+    where m rescales all effective gradients to a total norm of at most max_norm (cf. total_norm_constraint).
+    Since g is never materialised on its own, Theano fuses it with the moment and parameter updates into
+    elementwise operations performed in place, instead of allocating a temporary for each preprocessing step.
+
+    :param grads: The raw gradients of the params.
+    :param params: The shared variables to update.
+    :param learning_rate: The learning rate.
+    :param beta1: The exponential decay rate of the first moment estimate.
+    :param beta2: The exponential decay rate of the second moment estimate.
+    :param epsilon: Constant for numerical stability.
+    :param gamma: Decay of beta1, beta1_t = beta1 * gamma ** (t - 1) [Kingma2014].
+    :param grad_scale: Scalar multiplied onto the raw gradients.
+    :param prior_grads: List of gradients (or None) added to the scaled gradients, e.g. weight priors.
+    :param grad_divisor: Scalar that the scaled gradients plus priors are divided by.
+    :param max_norm: The maximum total norm of the effective gradients, None to disable.
+    :param clip_grad: The elementwise clipping value of the effective gradients, None to disable.
+    :param correct_epsilon: If epsilon is added to the bias corrected second moment as in [Kingma2014].
+    :param replica_norm: If the leading axis of all params indexes independent replicas of a model, so that the
+    total norm is computed and constrained for each replica separately.
+    :param return_norm: If the total norm of the effective gradients before clipping is returned as well, e.g.
+    to monitor divergence. It is a vector of the norm of each replica if replica_norm is set.
+    :return: OrderedDict of updates, and the norm if return_norm is set.
+    """
+    if prior_grads is None:
+        prior_grads = [None] * len(params)
+    dtype = np.dtype(theano.config.floatX).type
+
+    def effective_grad(g, prior_g):
+        g = g * grad_scale
+        if prior_g is not None:
+            g += prior_g
+        return g / grad_divisor
+
+    eff_grads = [effective_grad(g, prior_g) for g, prior_g in zip(grads, prior_grads)]
+    norm = None
+    if max_norm is not None or return_norm:
+        if replica_norm:
+            norm = T.sqrt(sum(T.sum(g ** 2, axis=range(1, g.ndim)) for g in eff_grads))
+        else:
+            norm = T.sqrt(sum(T.sum(g ** 2) for g in eff_grads))
+    if max_norm is not None:
+        multiplier = T.clip(norm, 0, dtype(max_norm)) / (dtype(1e-7) + norm)
+        if replica_norm:
+            eff_grads = [g * multiplier.dimshuffle([0] + ['x'] * (g.ndim - 1)) for g in eff_grads]
+        else:
+            eff_grads = [g * multiplier for g in eff_grads]
+    if clip_grad is not None:
+        eff_grads = [T.clip(g, -clip_grad, clip_grad) for g in eff_grads]
+
+    updates = OrderedDict()
+    one = T.constant(1)
+    t_prev = theano.shared(dtype(0.), name='t')
+    t = t_prev + 1
+    beta1_t = beta1 * gamma ** (t - 1)
+    a_t = learning_rate * T.sqrt(one - beta2 ** t) / (one - beta1 ** t)
+    epsilon_t = epsilon * T.sqrt(one - beta2 ** t) if correct_epsilon else epsilon
+
+    for param, g in zip(params, eff_grads):
+        value = param.get_value(borrow=True)
+        m_prev = theano.shared(np.zeros(value.shape, dtype=value.dtype), broadcastable=param.broadcastable)
+        v_prev = theano.shared(np.zeros(value.shape, dtype=value.dtype), broadcastable=param.broadcastable)
+
+        m_t = beta1_t * m_prev + (one - beta1_t) * g
+        v_t = beta2 * v_prev + (one - beta2) * g ** 2
+        updates[m_prev] = m_t
+        updates[v_prev] = v_t
+        updates[param] = param - a_t * m_t / (T.sqrt(v_t) + epsilon_t)
+    updates[t_prev] = t
+    if return_norm:
+        return updates, norm
+    return updates
+
+
+def is_finite(x):
+    """
+    Symbolic flag that a scalar is neither NaN nor infinite, e.g. a norm that any non-finite element propagates to.
+    """
+    return T.eq(T.isnan(x) + T.isinf(x), 0)
+
+
+def loss_scaled_updates(updates, grads, loss_scale, factor=2., interval=1000):
+    """
+    Dynamic loss scaling for updates computed from the gradients of a loss multiplied by the shared scalar
+    loss_scale, e.g. so that small gradients do not underflow in float16 activations. If any gradient is not
+    finite the updates are skipped and the loss scale is divided by factor. After interval consecutive finite
+    steps the loss scale is multiplied by factor.
+
+    :param updates: OrderedDict of updates of the params and optimizer states.
+    :param grads: The unscaled gradients that the updates are computed from.
+    :param loss_scale: The shared scalar variable that the loss is multiplied by.
+    :param factor: The factor the loss scale is decreased and increased by.
+    :param interval: The number of consecutive finite steps before the loss scale is increased.
+    :return: OrderedDict of updates and the symbolic flag of finite gradients.
+    """
+    dtype = np.dtype(theano.config.floatX).type
+    finite = is_finite(sum(T.sum(T.sqr(g)) for g in grads))
+    guarded = OrderedDict((var, T.switch(finite, update, var)) for var, update in updates.items())
+
+    n_finite_prev = theano.shared(dtype(0.), name='n_finite')
+    n_finite = n_finite_prev + 1
+    grow = T.ge(n_finite, interval)
+    factor = dtype(factor)
+    guarded[loss_scale] = T.switch(finite, T.switch(grow, loss_scale * factor, loss_scale), loss_scale / factor)
+    guarded[n_finite_prev] = T.switch(finite * (1 - grow), n_finite, dtype(0.))
+    return guarded, finite
+
+
 def adam_kingma(loss_or_grads, params, learning_rate=0.001, b1=0.9, b2=0.999, e=1e-8, gamma=1-1e-8):
     """
     ADAM update rules
@@ -17,24 +134,5 @@ def adam_kingma(loss_or_grads, params, learning_rate=0.001, b1=0.9, b2=0.999, e=
     http://arxiv.org/pdf/1412.6980v4.pdf
 
     """
-    updates = []
     all_grads = get_or_compute_grads(loss_or_grads, params)
-    alpha = learning_rate
-    t = theano.shared(np.float32(1))
-    b1_t = b1*gamma**(t-1)  # Decay the first moment running average coefficient
-
-    for theta_previous, g in zip(params, all_grads):
-        m_previous = theano.shared(np.zeros(theta_previous.get_value().shape, dtype=theano.config.floatX))
-        v_previous = theano.shared(np.zeros(theta_previous.get_value().shape, dtype=theano.config.floatX))
-
-        m = b1_t*m_previous + (1 - b1_t)*g  # Update biased first moment estimate
-        v = b2*v_previous + (1 - b2)*g**2   # Update biased second raw moment estimate
-        m_hat = m / (1-b1**t)   # Compute bias-corrected first moment estimate
-        v_hat = v / (1-b2**t)   # Compute bias-corrected second raw moment estimate
-        theta = theta_previous - (alpha * m_hat) / (T.sqrt(v_hat) + e)  # Update parameters
-
-        updates.append((m_previous, m))
-        updates.append((v_previous, v))
-        updates.append((theta_previous, theta))
-    updates.append((t, t + 1.))
-    return updates
\ No newline at end of file
+    return fused_adam(all_grads, params, learning_rate, b1, b2, e, gamma=gamma, correct_epsilon=True)
@@ -1,17 +1,20 @@
+import numpy as np
+from collections import OrderedDict
 import theano
+import theano.sparse
 import theano.tensor as T
 from lasagne import init
 from base import Model
 from lasagne_extensions.layers import (SampleLayer, GaussianMarginalLogDensityLayer, MultinomialLogDensityLayer,
                                        GaussianLogDensityLayer, BernoulliLogDensityLayer, InputLayer, DenseLayer,
                                        DimshuffleLayer, ElemwiseSumLayer, ReshapeLayer, NonlinearityLayer,
-                                       get_all_params, get_output)
+                                       EnsembleDenseLayer, ReplicateLayer, ExpressionLayer, DenseGroup,
+                                       get_all_layers, get_all_params, get_output)
 from lasagne_extensions.objectives import categorical_crossentropy
 from lasagne_extensions.nonlinearities import rectify, sigmoid, softmax
-from lasagne_extensions.updates import total_norm_constraint
-from lasagne_extensions.updates import adam
+from lasagne_extensions.updates import fused_adam, loss_scaled_updates, is_finite
+from lasagne_extensions.random import get_random_streams
 from parmesan.distributions import log_normal
-from theano.tensor.shared_randomstreams import RandomStreams
 
 
 class ADGMSSL(Model):
@@ -21,7 +24,8 @@ class ADGMSSL(Model):
     """
 
     def __init__(self, n_x, n_a, n_z, n_y, a_hidden, z_hidden, xhat_hidden, y_hidden, trans_func=rectify,
-                 x_dist='bernoulli'):
+                 x_dist='bernoulli', flat_params=False, n_replicas=1, mixed_precision=False, sparse_x=False,
+                 fuse_projections=False, rng_backend='shared'):
         """
         Initialize an auxiliary deep generative model consisting of
         discriminative classifier q(y|a,x),
@@ -38,6 +42,21 @@ class ADGMSSL(Model):
         :param y_hidden: List of number of deterministic hidden q(y|a,x).
         :param trans_func: The transfer function used in the deterministic layers.
         :param x_dist: The x distribution, 'bernoulli' or 'gaussian'.
+        :param flat_params: Store all params and optimizer states in contiguous flat buffers.
+        :param n_replicas: Number of independently initialized replicas of the model trained together in the same
+        compiled functions. The replicas are stacked along the batch axis and each dense layer holds the weights
+        of all replicas. The predictions are averaged over the replicas.
+        :param mixed_precision: Store the datasets and hidden activations in float16, while the params, the
+        log-densities and the lower bound are computed in float32 with dynamic loss scaling of the gradients.
+        :param sparse_x: The inputs x are CSR matrices, e.g. high-dimensional bag-of-words data. The first dense
+        layers and the bernoulli log-density are then computed over the nonzeros of x. The values of x are the
+        bernoulli probabilities of the binarization and must be in [0, 1], e.g. binarized or normalized counts.
+        :param fuse_projections: Compute the dense layers on the input x, and those on the input y, that a graph
+        consumes from a single matrix product with their concatenated weights (cf. DenseGroup). The params and saved
+        models are unchanged.
+        :param rng_backend: 'shared' for the RandomStreams of Theano, or 'counter' for a single counter-based
+        CounterRandomStreams shared by the binarization and all sampling layers, which is seeded per batch in O(1),
+        e.g. by reseed_counter(seed, epoch, batch, worker) (cf. lasagne_extensions.random).
         """
         super(ADGMSSL, self).__init__(n_x, a_hidden + z_hidden + xhat_hidden, n_a + n_z, trans_func)
         self.y_hidden = y_hidden
@@ -46,28 +65,66 @@ class ADGMSSL(Model):
         self.n_x = n_x
         self.n_a = n_a
         self.n_z = n_z
-
-        self._srng = RandomStreams()
+        self.n_replicas = n_replicas
+        if flat_params and n_replicas > 1:
+            raise ValueError("Flat params are not supported for ensembles of replicas.")
+        if fuse_projections and n_replicas > 1:
+            raise ValueError("Fused projections are not supported for ensembles of replicas.")
+        self.sparse_x = sparse_x
+        if sparse_x and (n_replicas > 1 or mixed_precision or x_dist != 'bernoulli'):
+            raise ValueError("Sparse x is only supported for a single bernoulli model in floatX.")
+        self.sh_loss_scale = None
+        if mixed_precision:
+            if theano.config.floatX != 'float32':
+                raise ValueError("Mixed precision requires floatX to be float32.")
+            self.storage_dtype = 'float16'
+            self.sh_loss_scale = theano.shared(np.asarray(2. ** 12, dtype=theano.config.floatX), name='loss_scale')
+
+        self.rng_backend = rng_backend
+        self._srng = get_random_streams(rng_backend)
 
         self.sym_beta = T.scalar('beta')  # symbolic upscaling of the discriminative term.
-        self.sym_x_l = T.matrix('x')  # symbolic labeled inputs
+        self.sym_warmup = T.scalar('warmup')  # symbolic weight of the KL terms, e.g. for warm-up.
+        x_type = theano.sparse.csr_matrix if sparse_x else T.matrix
+        self.sym_x_l = x_type('x')  # symbolic labeled inputs
         self.sym_t_l = T.matrix('t')  # symbolic labeled targets
-        self.sym_x_u = T.matrix('x')  # symbolic unlabeled inputs
+        self.sym_x_u = x_type('x')  # symbolic unlabeled inputs
         self.sym_bs_l = T.iscalar('bs_l')  # symbolic number of labeled data_preparation points in batch
         self.sym_samples = T.iscalar('samples')  # symbolic number of Monte Carlo samples
         self.sym_y = T.matrix('y')
         self.sym_z = T.matrix('z')
 
+        projections = {}  # The dense layers on each input layer.
+
+        def dense(incoming, num_units, W, b, nonlinearity, expand=False, hidden=False):
+            """
+            Dense layer of a single model or of all replicas, expand is True for layers on the shared inputs.
+            The outputs of hidden layers are stored in float16 for mixed precision, the dot products of the
+            subsequent layers with the float32 weights are still accumulated in float32.
+            """
+            if n_replicas == 1:
+                l = DenseLayer(incoming, num_units, W, b, nonlinearity)
+                if expand:
+                    projections.setdefault(incoming, []).append(l)
+            else:
+                l = EnsembleDenseLayer(incoming, num_units, n_replicas, W, b, nonlinearity, expand=expand)
+            if hidden and mixed_precision:
+                l = ExpressionLayer(l, lambda x: T.cast(x, 'float16'))
+            return l
+
         ### Input layers ###
         l_x_in = InputLayer((None, n_x))
         l_y_in = InputLayer((None, n_y))
 
         ### Auxiliary q(a|x) ###
         l_a_x = l_x_in
+        l_a_x_hidden = []
         for hid in a_hidden:
-            l_a_x = DenseLayer(l_a_x, hid, init.GlorotNormal('relu'), init.Normal(1e-3), self.transf)
-        l_a_x_mu = DenseLayer(l_a_x, n_a, init.GlorotNormal(), init.Normal(1e-3), None)
-        l_a_x_logvar = DenseLayer(l_a_x, n_a, init.GlorotNormal(), init.Normal(1e-3), None)
+            l_a_x = dense(l_a_x, hid, init.GlorotNormal('relu'), init.Normal(1e-3), self.transf, l_a_x is l_x_in,
+                          hidden=True)
+            l_a_x_hidden.append(l_a_x)
+        l_a_x_mu = dense(l_a_x, n_a, init.GlorotNormal(), init.Normal(1e-3), None, l_a_x is l_x_in)
+        l_a_x_logvar = dense(l_a_x, n_a, init.GlorotNormal(), init.Normal(1e-3), None, l_a_x is l_x_in)
         l_a_x = SampleLayer(l_a_x_mu, l_a_x_logvar, eq_samples=self.sym_samples)
         # Reshape all layers to align them for multiple samples in the lower bound calculation.
         l_a_x_reshaped = ReshapeLayer(l_a_x, (-1, self.sym_samples, 1, n_a))
@@ -76,33 +133,35 @@ class ADGMSSL(Model):
 
         ### Classifier q(y|a,x) ###
         # Concatenate the input x and the output of the auxiliary MLP.
-        l_a_to_y = DenseLayer(l_a_x, y_hidden[0], init.GlorotNormal('relu'), init.Normal(1e-3), None)
-        l_a_to_y = ReshapeLayer(l_a_to_y, (-1, self.sym_samples, 1, y_hidden[0]))
-        l_x_to_y = DenseLayer(l_x_in, y_hidden[0], init.GlorotNormal('relu'), init.Normal(1e-3), None)
-        l_x_to_y = DimshuffleLayer(l_x_to_y, (0, 'x', 'x', 1))
+        l_a_to_y_dense = dense(l_a_x, y_hidden[0], init.GlorotNormal('relu'), init.Normal(1e-3), None, hidden=True)
+        l_a_to_y = ReshapeLayer(l_a_to_y_dense, (-1, self.sym_samples, 1, y_hidden[0]))
+        l_x_to_y_dense = dense(l_x_in, y_hidden[0], init.GlorotNormal('relu'), init.Normal(1e-3), None, True, True)
+        l_x_to_y = DimshuffleLayer(l_x_to_y_dense, (0, 'x', 'x', 1))
         l_y_xa = ReshapeLayer(ElemwiseSumLayer([l_a_to_y, l_x_to_y]), (-1, y_hidden[0]))
         l_y_xa = NonlinearityLayer(l_y_xa, self.transf)
 
+        l_y_xa_hidden = []
         if len(y_hidden) > 1:
             for hid in y_hidden[1:]:
-                l_y_xa = DenseLayer(l_y_xa, hid, init.GlorotUniform('relu'), init.Normal(1e-3), self.transf)
-        l_y_xa = DenseLayer(l_y_xa, n_y, init.GlorotUniform(), init.Normal(1e-3), softmax)
+                l_y_xa = dense(l_y_xa, hid, init.GlorotUniform('relu'), init.Normal(1e-3), self.transf, hidden=True)
+                l_y_xa_hidden.append(l_y_xa)
+        l_y_xa = dense(l_y_xa, n_y, init.GlorotUniform(), init.Normal(1e-3), softmax)
         l_y_xa_reshaped = ReshapeLayer(l_y_xa, (-1, self.sym_samples, 1, n_y))
 
         ### Recognition q(z|x,y) ###
         # Concatenate the input x and y.
-        l_x_to_z = DenseLayer(l_x_in, z_hidden[0], init.GlorotNormal('relu'), init.Normal(1e-3), None)
+        l_x_to_z = dense(l_x_in, z_hidden[0], init.GlorotNormal('relu'), init.Normal(1e-3), None, True, True)
         l_x_to_z = DimshuffleLayer(l_x_to_z, (0, 'x', 'x', 1))
-        l_y_to_z = DenseLayer(l_y_in, z_hidden[0], init.GlorotNormal('relu'), init.Normal(1e-3), None)
+        l_y_to_z = dense(l_y_in, z_hidden[0], init.GlorotNormal('relu'), init.Normal(1e-3), None, True, True)
         l_y_to_z = DimshuffleLayer(l_y_to_z, (0, 'x', 'x', 1))
         l_z_xy = ReshapeLayer(ElemwiseSumLayer([l_x_to_z, l_y_to_z]), [-1, z_hidden[0]])
         l_z_xy = NonlinearityLayer(l_z_xy, self.transf)
 
         if len(z_hidden) > 1:
             for hid in z_hidden[1:]:
-                l_z_xy = DenseLayer(l_z_xy, hid, init.GlorotNormal('relu'), init.Normal(1e-3), self.transf)
-        l_z_axy_mu = DenseLayer(l_z_xy, n_z, init.GlorotNormal(), init.Normal(1e-3), None)
-        l_z_axy_logvar = DenseLayer(l_z_xy, n_z, init.GlorotNormal(), init.Normal(1e-3), None)
+                l_z_xy = dense(l_z_xy, hid, init.GlorotNormal('relu'), init.Normal(1e-3), self.transf, hidden=True)
+        l_z_axy_mu = dense(l_z_xy, n_z, init.GlorotNormal(), init.Normal(1e-3), None)
+        l_z_axy_logvar = dense(l_z_xy, n_z, init.GlorotNormal(), init.Normal(1e-3), None)
         l_z_xy = SampleLayer(l_z_axy_mu, l_z_axy_logvar, eq_samples=self.sym_samples)
         # Reshape all layers to align them for multiple samples in the lower bound calculation.
         l_z_axy_mu_reshaped = DimshuffleLayer(l_z_axy_mu, (0, 'x', 'x', 1))
@@ -111,37 +170,43 @@ class ADGMSSL(Model):
 
         ### Generative p(xhat|z,y) ###
         # Concatenate the input x and y.
-        l_y_to_xhat = DenseLayer(l_y_in, xhat_hidden[0], init.GlorotNormal('relu'), init.Normal(1e-3), None)
+        l_y_to_xhat = dense(l_y_in, xhat_hidden[0], init.GlorotNormal('relu'), init.Normal(1e-3), None, True, True)
         l_y_to_xhat = DimshuffleLayer(l_y_to_xhat, (0, 'x', 'x', 1))
-        l_z_to_xhat = DenseLayer(l_z_xy, xhat_hidden[0], init.GlorotNormal('relu'), init.Normal(1e-3), None)
+        l_z_to_xhat = dense(l_z_xy, xhat_hidden[0], init.GlorotNormal('relu'), init.Normal(1e-3), None, hidden=True)
         l_z_to_xhat = ReshapeLayer(l_z_to_xhat, (-1, self.sym_samples, 1, xhat_hidden[0]))
         l_xhat_zy = ReshapeLayer(ElemwiseSumLayer([l_z_to_xhat, l_y_to_xhat]), [-1, xhat_hidden[0]])
         l_xhat_zy = NonlinearityLayer(l_xhat_zy, self.transf)
         if len(xhat_hidden) > 1:
             for hid in xhat_hidden[1:]:
-                l_xhat_zy = DenseLayer(l_xhat_zy, hid, init.GlorotNormal('relu'), init.Normal(1e-3), self.transf)
+                l_xhat_zy = dense(l_xhat_zy, hid, init.GlorotNormal('relu'), init.Normal(1e-3), self.transf,
+                                  hidden=True)
         if x_dist == 'bernoulli':
             l_xhat_zy_mu_reshaped = None
             l_xhat_zy_logvar_reshaped = None
-            l_xhat_zy = DenseLayer(l_xhat_zy, n_x, init.GlorotNormal(), init.Normal(1e-3), sigmoid)
+            l_xhat_zy = dense(l_xhat_zy, n_x, init.GlorotNormal(), init.Normal(1e-3), sigmoid)
         elif x_dist == 'multinomial':
             l_xhat_zy_mu_reshaped = None
             l_xhat_zy_logvar_reshaped = None
-            l_xhat_zy = DenseLayer(l_xhat_zy, n_x, init.GlorotNormal(), init.Normal(1e-3), softmax)
+            l_xhat_zy = dense(l_xhat_zy, n_x, init.GlorotNormal(), init.Normal(1e-3), softmax)
         elif x_dist == 'gaussian':
-            l_xhat_zy_mu = DenseLayer(l_xhat_zy, n_x, init.GlorotNormal(), init.Normal(1e-3), None)
-            l_xhat_zy_logvar = DenseLayer(l_xhat_zy, n_x, init.GlorotNormal(), init.Normal(1e-3), None)
+            l_xhat_zy_mu = dense(l_xhat_zy, n_x, init.GlorotNormal(), init.Normal(1e-3), None)
+            l_xhat_zy_logvar = dense(l_xhat_zy, n_x, init.GlorotNormal(), init.Normal(1e-3), None)
             l_xhat_zy = SampleLayer(l_xhat_zy_mu, l_xhat_zy_logvar, eq_samples=1)
             l_xhat_zy_mu_reshaped = ReshapeLayer(l_xhat_zy_mu, (-1, self.sym_samples, 1, n_x))
             l_xhat_zy_logvar_reshaped = ReshapeLayer(l_xhat_zy_logvar, (-1, self.sym_samples, 1, n_x))
         l_xhat_zy_reshaped = ReshapeLayer(l_xhat_zy, (-1, self.sym_samples, 1, n_x))
 
+        self.dense_groups = []
+        if fuse_projections:
+            self.dense_groups = [DenseGroup(layers) for layers in projections.values() if len(layers) > 1]
+
         ### Various class variables ###
         self.l_x_in = l_x_in
         self.l_y_in = l_y_in
         self.l_a_mu = l_a_x_mu_reshaped
         self.l_a_logvar = l_a_x_logvar_reshaped
         self.l_a = l_a_x_reshaped
+        self.l_a_sample = l_a_x
         self.l_z_mu = l_z_axy_mu_reshaped
         self.l_z_logvar = l_z_axy_logvar_reshaped
         self.l_z = l_z_axy_reshaped
@@ -150,7 +215,22 @@ class ADGMSSL(Model):
         self.l_xhat_logvar = l_xhat_zy_logvar_reshaped
         self.l_xhat = l_xhat_zy_reshaped
 
-        self.model_params = get_all_params([self.l_xhat, self.l_y])
+        # The dense layers of the q(a|x) -> q(y|a,x) path, e.g. for the quantized classifier of serving.quantized.
+        unwrap = lambda l: l.input_layer if isinstance(l, ExpressionLayer) else l
+        self.classifier_layers = {'a_hidden': [unwrap(l) for l in l_a_x_hidden], 'a_mu': l_a_x_mu,
+                                  'a_logvar': l_a_x_logvar, 'a_to_y': unwrap(l_a_to_y_dense),
+                                  'x_to_y': unwrap(l_x_to_y_dense), 'y_hidden': [unwrap(l) for l in l_y_xa_hidden],
+                                  'y_out': l_y_xa}
+
+        self.output_layers = [self.l_xhat, self.l_y]
+        if rng_backend == 'counter':
+            # The sampling layers draw from the streams of the model, so one counter seeds all samples of a batch.
+            for layer in get_all_layers(self.output_layers):
+                if hasattr(layer, '_srng'):
+                    layer._srng = self._srng
+        self.model_params = get_all_params(self.output_layers)
+        if flat_params:
+            self.flatten_params()
 
         ### Calculate networks shapes for documentation ###
         self.qa_shapes = self.get_model_shape(get_all_params(l_a_x))
@@ -159,54 +239,79 @@ class ADGMSSL(Model):
         self.px_shapes = self.get_model_shape(get_all_params(l_xhat_zy))[(len(self.qz_shapes) - 1):]
 
         ### Predefined functions for generating xhat and y ###
-        inputs = {l_z_xy: self.sym_z, self.l_y_in: self.sym_y}
-        outputs = get_output(self.l_xhat, inputs, deterministic=True).mean(axis=(1, 2))
+        inputs = {l_z_xy: self._replicate(self.sym_z), self.l_y_in: self.sym_y}
+        outputs = self._ensemble_mean(self._get_output(self.l_xhat, inputs, deterministic=True).mean(axis=(1, 2)))
         inputs = [self.sym_z, self.sym_y, self.sym_samples]
-        self.f_xhat = theano.function(inputs, outputs)
+        self.f_xhat = self.compile_function(inputs, outputs)
 
         inputs = [self.sym_x_l, self.sym_samples]
-        outputs = get_output(self.l_y, self.sym_x_l, deterministic=True).mean(axis=(1, 2))
-        self.f_y = theano.function(inputs, outputs)
+        outputs = self._ensemble_mean(self._get_output(self.l_y, self.sym_x_l, deterministic=True).mean(axis=(1, 2)))
+        self.f_y = self.compile_function(inputs, outputs)
 
+        self.a_params = get_all_params(self.l_y, trainable=True)[:(len(a_hidden) + 2) * 2]
         self.y_params = get_all_params(self.l_y, trainable=True)[(len(a_hidden) + 2) * 2::]
         self.xhat_params = get_all_params(self.l_xhat, trainable=True)
 
-    def build_model(self, train_set, test_set, validation_set=None):
+    def build_model(self, train_set, test_set, validation_set=None, n_micro_batches=1):
         """
         Build the auxiliary deep generative model from the initialized hyperparameters.
         Define the lower bound term and compile it into a training function.
         :param train_set: Train set containing variables x, t.
-        for the unlabeled data_preparation in the train set, we define 0's in t.
+        for the unlabeled data_preparation in the train set, we define 0's in t. Alternatively the train set contains
+        variables x_u, x_l, t_l with separate stores of unlabeled and labeled data points.
         :param test_set: Test set containing variables x, t.
         :param validation_set: Validation set containing variables x, t.
+        :param n_micro_batches: Number of micro-batches that the labeled and unlabeled data points of a batch are
+        split into. The gradients of the micro-batches are accumulated and the update is applied once per batch,
+        so memory scales with the micro-batch while the update equals that of the full batch.
         :return: train, test, validation function and dicts of arguments.
         """
         super(ADGMSSL, self).build_model(train_set, test_set, validation_set)
+        if self.sparse_x:
+            self._check_sparse_range()
 
         # Define the layers for the density estimation used in the lower bound.
         l_log_pa = GaussianMarginalLogDensityLayer(self.l_a_mu, self.l_a_logvar)
         l_log_pz = GaussianMarginalLogDensityLayer(self.l_z_mu, self.l_z_logvar)
         l_log_qa_x = GaussianMarginalLogDensityLayer(1, self.l_a_logvar)
         l_log_qz_xy = GaussianMarginalLogDensityLayer(1, self.l_z_logvar)
-        l_log_qy_ax = MultinomialLogDensityLayer(self.l_y, self.l_y_in, eps=1e-8)
+        # The targets of the densities are repeated for each replica of an ensemble.
+        l_x_target, l_y_target = self.l_x_in, self.l_y_in
+        if self.n_replicas > 1:
+            l_x_target = ReplicateLayer(self.l_x_in, self.n_replicas)
+            l_y_target = ReplicateLayer(self.l_y_in, self.n_replicas)
+        l_log_qy_ax = MultinomialLogDensityLayer(self.l_y, l_y_target, eps=1e-8)
         if self.x_dist == 'bernoulli':
-            l_px_zy = BernoulliLogDensityLayer(self.l_xhat, self.l_x_in)
+            l_px_zy = BernoulliLogDensityLayer(self.l_xhat, l_x_target)
         elif self.x_dist == 'multinomial':
-            l_px_zy = MultinomialLogDensityLayer(self.l_xhat, self.l_x_in)
+            l_px_zy = MultinomialLogDensityLayer(self.l_xhat, l_x_target)
         elif self.x_dist == 'gaussian':
-            l_px_zy = GaussianLogDensityLayer(self.l_x_in, self.l_xhat_mu, self.l_xhat_logvar)
+            l_px_zy = GaussianLogDensityLayer(l_x_target, self.l_xhat_mu, self.l_xhat_logvar)
+
+        def grad(cost, wrt):
+            if self.sh_loss_scale is None:
+                return T.grad(cost, wrt)
+            # Scale the cost, so that small gradients do not underflow in the float16 activations.
+            return [g / self.sh_loss_scale for g in T.grad(cost * self.sh_loss_scale, wrt)]
 
         ### Compute lower bound for labeled data_preparation ###
         out_layers = [l_log_pa, l_log_pz, l_log_qa_x, l_log_qz_xy, l_px_zy, l_log_qy_ax]
         inputs = {self.l_x_in: self.sym_x_l, self.l_y_in: self.sym_t_l}
-        log_pa_l, log_pz_l, log_qa_x_l, log_qz_axy_l, log_px_zy_l, log_qy_ax_l = get_output(out_layers, inputs)
-        py_l = softmax(T.zeros((self.sym_x_l.shape[0], self.n_y)))  # non-informative prior
-        log_py_l = -categorical_crossentropy(py_l, self.sym_t_l).reshape((-1, 1)).dimshuffle((0, 'x', 'x', 1))
-        lb_l = log_pa_l + log_pz_l + log_py_l + log_px_zy_l - log_qa_x_l - log_qz_axy_l
+        log_pa_l, log_pz_l, log_qa_x_l, log_qz_axy_l, log_px_zy_l, log_qy_ax_l = self._get_output(out_layers, inputs)
+        t_l = self._replicate(self.sym_t_l)
+        py_l = softmax(T.zeros((t_l.shape[0], self.n_y)))  # non-informative prior
+        log_py_l = -categorical_crossentropy(py_l, t_l).reshape((-1, 1)).dimshuffle((0, 'x', 'x', 1))
+        lb_l = log_py_l + log_px_zy_l + self.sym_warmup * (log_pa_l + log_pz_l - log_qa_x_l - log_qz_axy_l)
+        # The mean of each term of the lower bound per data point, returned by f_train for diagnostics.
+        diagnostics = OrderedDict()
+        diagnostics['log_px_l'] = log_px_zy_l.mean()
+        diagnostics['kl_a_l'] = (log_qa_x_l - log_pa_l).mean()
+        diagnostics['kl_z_l'] = (log_qz_axy_l - log_pz_l).mean()
+        diagnostics['log_qy_l'] = log_qy_ax_l.mean()
         # Upscale the discriminative term with a weight.
         log_qy_ax_l *= self.sym_beta
-        xhat_grads_l = T.grad(lb_l.mean(axis=(1, 2)).sum(), self.xhat_params)
-        y_grads_l = T.grad(log_qy_ax_l.mean(axis=(1, 2)).sum(), self.y_params)
+        xhat_grads_l = grad(lb_l.mean(axis=(1, 2)).sum(), self.xhat_params)
+        y_grads_l = grad(log_qy_ax_l.mean(axis=(1, 2)).sum(), self.y_params)
         lb_l += log_qy_ax_l
         lb_l = lb_l.mean(axis=(1, 2))
 
@@ -216,22 +321,35 @@ class ADGMSSL(Model):
         # repeat unlabeled t the number of classes for integration (bs * n_y) x n_y.
         t_u = t_eye.reshape((self.n_y, 1, self.n_y)).repeat(bs_u, axis=1).reshape((-1, self.n_y))
         # repeat unlabeled x the number of classes for integration (bs * n_y) x n_x
-        x_u = self.sym_x_u.reshape((1, bs_u, self.n_x)).repeat(self.n_y, axis=0).reshape((-1, self.n_x))
+        if self.sparse_x:
+            x_u = self._take_rows(self.sym_x_u, T.tile(T.arange(bs_u), self.n_y))
+        else:
+            x_u = self.sym_x_u.reshape((1, bs_u, self.n_x)).repeat(self.n_y, axis=0).reshape((-1, self.n_x))
         out_layers = [l_log_pa, l_log_pz, l_log_qa_x, l_log_qz_xy, l_px_zy]
         inputs = {self.l_x_in: x_u, self.l_y_in: t_u}
-        log_pa_u, log_pz_u, log_qa_x_u, log_qz_axy_u, log_px_zy_u = get_output(out_layers, inputs)
-        py_u = softmax(T.zeros((bs_u * self.n_y, self.n_y)))  # non-informative prior.
-        log_py_u = -categorical_crossentropy(py_u, t_u).reshape((-1, 1)).dimshuffle((0, 'x', 'x', 1))
-        lb_u = log_pa_u + log_pz_u + log_py_u + log_px_zy_u - log_qa_x_u - log_qz_axy_u
-        lb_u = lb_u.reshape((self.n_y, self.sym_samples, 1, bs_u)).transpose(3, 1, 2, 0).mean(
-            axis=(1, 2))  # mean over samples.
-        y_ax_u = get_output(self.l_y, self.sym_x_u)
+        log_pa_u, log_pz_u, log_qa_x_u, log_qz_axy_u, log_px_zy_u = self._get_output(out_layers, inputs)
+        py_u = softmax(T.zeros((bs_u * self.n_y * self.n_replicas, self.n_y)))  # non-informative prior.
+        log_py_u = -categorical_crossentropy(py_u, self._replicate(t_u)).reshape((-1, 1)).dimshuffle((0, 'x', 'x', 1))
+        lb_u = log_py_u + log_px_zy_u + self.sym_warmup * (log_pa_u + log_pz_u - log_qa_x_u - log_qz_axy_u)
+
+        def per_class(term):
+            # mean over samples, (n_replicas * bs) x n_y.
+            return term.reshape((self.n_replicas, self.n_y, self.sym_samples, 1, bs_u)).transpose(0, 4, 2, 3, 1).mean(
+                axis=(2, 3)).reshape((-1, self.n_y))
+
+        lb_u = per_class(lb_u)
+        y_ax_u = self._get_output(self.l_y, self.sym_x_u)
         y_ax_u = y_ax_u.mean(axis=(1, 2))  # bs x n_y
         y_ax_u += 1e-8  # ensure that we get no NANs.
         y_ax_u /= T.sum(y_ax_u, axis=1, keepdims=True)
-        xhat_grads_u = T.grad((y_ax_u * lb_u).sum(axis=1).sum(), self.xhat_params)
+        # The terms of the unlabeled data points are expectations over q(y|a,x).
+        diagnostics['log_px_u'] = (y_ax_u * per_class(log_px_zy_u)).sum(axis=1).mean()
+        diagnostics['kl_a_u'] = (y_ax_u * per_class(log_qa_x_u - log_pa_u)).sum(axis=1).mean()
+        diagnostics['kl_z_u'] = (y_ax_u * per_class(log_qz_axy_u - log_pz_u)).sum(axis=1).mean()
+        diagnostics['entropy_y_u'] = -(y_ax_u * T.log(y_ax_u)).sum(axis=1).mean()
+        xhat_grads_u = grad((y_ax_u * lb_u).sum(axis=1).sum(), self.xhat_params)
         lb_u = (y_ax_u * (lb_u - T.log(y_ax_u))).sum(axis=1)
-        y_grads_u = T.grad(lb_u.sum(), self.y_params)
+        y_grads_u = grad(lb_u.sum(), self.y_params)
 
         # Loss - regularizing with weight priors p(theta|N(0,1)) and clipping gradients
         y_weight_priors = 0.0
@@ -248,49 +366,106 @@ class ADGMSSL(Model):
             xhat_weight_priors += log_normal(p, 0, 1).sum()
         xhat_weight_priors_grad = T.grad(xhat_weight_priors, self.xhat_params, disconnected_inputs='ignore')
 
-        n = self.sh_train_x.shape[0].astype(theano.config.floatX)  # no. of data_preparation points in train set
-        n_b = n / self.sym_batchsize.astype(theano.config.floatX)  # no. of batches in train set
-        y_grads = [T.zeros(p.shape) for p in self.y_params]
-        for i in range(len(y_grads)):
-            y_grads[i] = (y_grads_l[i] + y_grads_u[i])
-            y_grads[i] *= n_b
-            y_grads[i] += y_weight_priors_grad[i]
-            y_grads[i] /= -n
-
-        xhat_grads = [T.zeros(p.shape) for p in self.xhat_params]
-        for i in range(len(xhat_grads)):
-            xhat_grads[i] = (xhat_grads_l[i] + xhat_grads_u[i])
-            xhat_grads[i] *= n_b
-            xhat_grads[i] += xhat_weight_priors_grad[i]
-            xhat_grads[i] /= -n
-
         params = self.y_params + self.xhat_params
-        grads = y_grads + xhat_grads
-
-        # Collect the lower bound and scale it with the weight priors.
-        elbo = ((lb_l.sum() + lb_u.sum()) * n_b + y_weight_priors + xhat_weight_priors) / -n
-
-        # Avoid vanishing and exploding gradients.
-        clip_grad, max_norm = 1, 5
-        mgrads = total_norm_constraint(grads, max_norm=max_norm)
-        mgrads = [T.clip(g, -clip_grad, clip_grad) for g in mgrads]
+        grads = [g_l + g_u for g_l, g_u in zip(y_grads_l + xhat_grads_l, y_grads_u + xhat_grads_u)]
+        prior_grads = y_weight_priors_grad + xhat_weight_priors_grad
+        weight_priors = y_weight_priors + xhat_weight_priors
+        lb = lb_l.sum() + lb_u.sum()
+        diagnostics['weight_priors'] = weight_priors
+        self.diagnostics = diagnostics.keys()
+        if self.sh_flat_params is not None:
+            # A single update of the flat buffer, the norm of the gradients is then a single reduction.
+            grads = [self.flatten_grads(params, grads)]
+            prior_grads = [self.flatten_grads(params, prior_grads)]
+            params = [self.sh_flat_params]
         sym_beta1 = T.scalar('beta1')
         sym_beta2 = T.scalar('beta2')
-        updates = adam(mgrads, params, self.sym_lr, sym_beta1, sym_beta2)
+
+        def elbo_and_updates(lb, grads):
+            # Collect the lower bound and scale it with the weight priors.
+            elbo = (lb * n_b + weight_priors) / -n
+            elbo /= self.n_replicas  # mean over the replicas of an ensemble.
+            # Scale the gradients with the weight priors, avoid vanishing and exploding gradients and update.
+            # The gradients are scaled as ((grads * n_b) + prior_grads) / -n within the fused update.
+            clip_grad, max_norm = 1, 5
+            updates, gnorm = fused_adam(grads, params, self.sym_lr, sym_beta1, sym_beta2, grad_scale=n_b,
+                                        prior_grads=prior_grads, grad_divisor=-n, max_norm=max_norm,
+                                        clip_grad=clip_grad, replica_norm=self.n_replicas > 1, return_norm=True)
+            gnorm = gnorm.max()  # The largest norm of the replicas of an ensemble.
+            # Flag a diverged step, so that the training can roll back (cf. TrainModel).
+            finite = is_finite(elbo)
+            if self.sh_loss_scale is not None:
+                # Skip the update and decrease the loss scale if the gradients overflow, which is not divergence.
+                updates, _ = loss_scaled_updates(updates, grads, self.sh_loss_scale)
+            else:
+                finite *= is_finite(gnorm)
+            self.register_optimizer_state(updates, params)
+            return [elbo, gnorm, finite], updates
 
         ### Compile training function ###
-        x_batch_l = self.sh_train_x[self.batch_slice][:self.sym_bs_l]
-        x_batch_u = self.sh_train_x[self.batch_slice][self.sym_bs_l:]
-        t_batch_l = self.sh_train_t[self.batch_slice][:self.sym_bs_l]
+        if self.sh_train_x_l is None:
+            # The labeled data points are interleaved with the unlabeled data points in the train set.
+            n = self.sh_train_x.shape[0].astype(theano.config.floatX)  # no. of data_preparation points in train set
+            n_b = n / self.sym_batchsize.astype(theano.config.floatX)  # no. of batches in train set
+            x_batch_l = self.sh_train_x[self.batch_slice][:self.sym_bs_l]
+            x_batch_u = self.sh_train_x[self.batch_slice][self.sym_bs_l:]
+            t_batch_l = self.sh_train_t[self.batch_slice][:self.sym_bs_l]
+        else:
+            # The unlabeled data points are sliced from the unlabeled store and the labeled data points are sampled
+            # with replacement from the labeled store, so the ratio can be changed through batchsize_labeled.
+            sym_bs_u = self.sym_batchsize - self.sym_bs_l
+            n_u = self.sh_train_x.shape[0].astype(theano.config.floatX)  # no. of unlabeled data points in train set
+            n_b = n_u / sym_bs_u.astype(theano.config.floatX)  # no. of batches in train set
+            # no. of data points of an epoch including the sampled labeled data points, i.e. the size of the
+            # interleaved train set, so that the lower bound and the gradients are scaled as with that layout.
+            n = n_b * self.sym_batchsize.astype(theano.config.floatX)
+            idx_l = self._srng.random_integers(size=(self.sym_bs_l,), low=0, high=self.sh_train_x_l.shape[0] - 1)
+            x_batch_l = self._take_rows(self.sh_train_x_l, idx_l)
+            t_batch_l = self.sh_train_t_l[idx_l]
+            x_batch_u = self.sh_train_x[self.sym_index * sym_bs_u:(self.sym_index + 1) * sym_bs_u]
+        # The datasets may be stored in a smaller dtype than the computations.
+        x_batch_l, x_batch_u = self._as_input(x_batch_l), self._as_input(x_batch_u)
+        t_batch_l = T.cast(t_batch_l, theano.config.floatX)
+        if n_micro_batches > 1:
+            # Slice a micro-batch of the labeled and unlabeled data points of the batch.
+            sym_l_start, sym_l_stop, sym_u_start, sym_u_stop = T.iscalars('l_start', 'l_stop', 'u_start', 'u_stop')
+            x_batch_l = x_batch_l[sym_l_start:sym_l_stop]
+            t_batch_l = t_batch_l[sym_l_start:sym_l_stop]
+            x_batch_u = x_batch_u[sym_u_start:sym_u_stop]
         if self.x_dist == 'bernoulli':  # Sample bernoulli input.
-            x_batch_u = self._srng.binomial(size=x_batch_u.shape, n=1, p=x_batch_u, dtype=theano.config.floatX)
-            x_batch_l = self._srng.binomial(size=x_batch_l.shape, n=1, p=x_batch_l, dtype=theano.config.floatX)
+            x_batch_u, x_batch_l = self._binarize(x_batch_u), self._binarize(x_batch_l)
         givens = {self.sym_x_l: x_batch_l,
                   self.sym_x_u: x_batch_u,
                   self.sym_t_l: t_batch_l}
-        inputs = [self.sym_index, self.sym_batchsize, self.sym_bs_l, self.sym_beta,
-                  self.sym_lr, sym_beta1, sym_beta2, self.sym_samples]
-        f_train = theano.function(inputs=inputs, outputs=[elbo], givens=givens, updates=updates)
+        if n_micro_batches == 1:
+            outputs, updates = elbo_and_updates(lb, grads)
+            inputs = [self.sym_index, self.sym_batchsize, self.sym_bs_l, self.sym_beta,
+                      self.sym_lr, sym_beta1, sym_beta2, self.sym_samples, self.sym_warmup]
+            outputs += diagnostics.values()
+            f_train = self.compile_function(inputs=inputs, outputs=outputs, givens=givens, updates=updates)
+        else:
+            # Sum the lower bound and the unscaled gradients of the micro-batches into persistent buffers.
+            sh_lb = theano.shared(np.asarray(0., dtype=theano.config.floatX))
+            sh_grads = [theano.shared(np.zeros(p.get_value(borrow=True).shape, dtype=theano.config.floatX),
+                                      broadcastable=p.broadcastable) for p in params]
+            # The diagnostics of a batch are the mean of the diagnostics of its micro-batches.
+            sh_diagnostics = theano.shared(np.zeros(len(diagnostics), dtype=theano.config.floatX))
+            diagnostics = T.stack([T.cast(d, theano.config.floatX) for d in diagnostics.values()])
+            updates = [(sh_lb, sh_lb + lb)] + [(sh_g, sh_g + g) for sh_g, g in zip(sh_grads, grads)]
+            updates += [(sh_diagnostics, sh_diagnostics + diagnostics / n_micro_batches)]
+            inputs = [self.sym_index, self.sym_batchsize, self.sym_bs_l, sym_l_start, sym_l_stop, sym_u_start,
+                      sym_u_stop, self.sym_beta, self.sym_samples, self.sym_warmup]
+            f_accumulate = self.compile_function(inputs=inputs, outputs=[], givens=givens, updates=updates)
+            # Apply the scaling, clipping and update once per batch and reset the buffers.
+            outputs, updates = elbo_and_updates(sh_lb, sh_grads)
+            outputs += [sh_diagnostics[i] for i in xrange(len(self.diagnostics))]
+            for sh_var in [sh_lb, sh_diagnostics] + sh_grads:
+                updates[sh_var] = T.zeros_like(sh_var)
+            # The number of batches of the split store also depends on the labeled batchsize.
+            split = self.sh_train_x_l is not None
+            inputs = [self.sym_batchsize] + ([self.sym_bs_l] if split else []) + [self.sym_lr, sym_beta1, sym_beta2]
+            f_apply = self.compile_function(inputs=inputs, outputs=outputs, updates=updates)
+            f_train = self._micro_batched(f_accumulate, f_apply, n_micro_batches, split)
         # Default training args. Note that these can be changed during or prior to training.
         self.train_args['inputs']['batchsize'] = 200
         self.train_args['inputs']['batchsize_labeled'] = 100
@@ -299,13 +474,18 @@ class ADGMSSL(Model):
         self.train_args['inputs']['beta1'] = 0.9
         self.train_args['inputs']['beta2'] = 0.999
         self.train_args['inputs']['samples'] = 1
+        self.train_args['inputs']['warmup'] = 1.
         self.train_args['outputs']['lb'] = '%0.4f'
+        self.train_args['outputs']['gnorm'] = '%0.4f'
+        self.train_args['outputs']['finite'] = '%0.2f'
+        for key in self.diagnostics:
+            self.train_args['outputs'][key] = '%0.4f'
 
         ### Compile testing function ###
         class_err_test = self._classification_error(self.sym_x_l, self.sym_t_l)
-        givens = {self.sym_x_l: self.sh_test_x,
-                  self.sym_t_l: self.sh_test_t}
-        f_test = theano.function(inputs=[self.sym_samples], outputs=[class_err_test], givens=givens)
+        givens = {self.sym_x_l: self._as_input(self.sh_test_x),
+                  self.sym_t_l: T.cast(self.sh_test_t, theano.config.floatX)}
+        f_test = self.compile_function(inputs=[self.sym_samples], outputs=[class_err_test], givens=givens)
         # Testing args.  Note that these can be changed during or prior to training.
         self.test_args['inputs']['samples'] = 1
         self.test_args['outputs']['err'] = '%0.2f%%'
@@ -314,18 +494,104 @@ class ADGMSSL(Model):
         f_validate = None
         if validation_set is not None:
             class_err_valid = self._classification_error(self.sym_x_l, self.sym_t_l)
-            givens = {self.sym_x_l: self.sh_valid_x,
-                      self.sym_t_l: self.sh_valid_t}
+            givens = {self.sym_x_l: self._as_input(self.sh_valid_x),
+                      self.sym_t_l: T.cast(self.sh_valid_t, theano.config.floatX)}
             inputs = [self.sym_samples]
-            f_validate = theano.function(inputs=[self.sym_samples], outputs=[class_err_valid], givens=givens)
+            f_validate = self.compile_function(inputs=[self.sym_samples], outputs=[class_err_valid], givens=givens)
         # Default validation args. Note that these can be changed during or prior to training.
         self.validate_args['inputs']['samples'] = 1
         self.validate_args['outputs']['err'] = '%0.2f%%'
 
         return f_train, f_test, f_validate, self.train_args, self.test_args, self.validate_args
 
+    @staticmethod
+    def _micro_batched(f_accumulate, f_apply, n_micro_batches, split=False):
+        """
+        Training function with the signature of the single-shot f_train, accumulating the gradients of the
+        micro-batches before applying the update.
+        :param split: If f_apply takes the labeled batchsize, as for the split labeled and unlabeled store.
+        """
+
+        def f_train(index, batchsize, batchsize_labeled, beta, learningrate, beta1, beta2, samples, warmup):
+            bs_l, bs_u = batchsize_labeled, batchsize - batchsize_labeled
+            for k in xrange(n_micro_batches):
+                f_accumulate(index, batchsize, bs_l, k * bs_l // n_micro_batches, (k + 1) * bs_l // n_micro_batches,
+                             k * bs_u // n_micro_batches, (k + 1) * bs_u // n_micro_batches, beta, samples, warmup)
+            if split:
+                return f_apply(batchsize, batchsize_labeled, learningrate, beta1, beta2)
+            return f_apply(batchsize, learningrate, beta1, beta2)
+
+        return f_train
+
+    def _take_rows(self, x, idx):
+        """
+        The rows idx of x. Theano only indexes CSR matrices with a symbolic vector through get_item_list.
+        """
+        if self.sparse_x:
+            return theano.sparse.basic.get_item_list(x, idx)
+        return x[idx]
+
+    def _check_sparse_range(self):
+        """
+        Check that the values of sparse train sets are bernoulli probabilities, e.g. not raw counts.
+        """
+        for sh_x in [self.sh_train_x, self.sh_train_x_l]:
+            if sh_x is None:
+                continue
+            values = sh_x.get_value(borrow=True).data
+            if len(values) > 0 and (values.min() < 0 or values.max() > 1):
+                raise ValueError("The values of a sparse x must be in [0, 1], e.g. binarize or normalize counts.")
+
+    def _as_input(self, x):
+        """
+        Cast the stored x to floatX, the datasets may be stored in a smaller dtype than the computations.
+        """
+        if self.sparse_x:
+            return x
+        return T.cast(x, theano.config.floatX)
+
+    def _binarize(self, x):
+        """
+        Sample a binary x with the probabilities given by x. For a CSR x only the nonzeros are sampled.
+        """
+        if not self.sparse_x:
+            return self._srng.binomial(size=x.shape, n=1, p=x, dtype=theano.config.floatX)
+        data, indices, indptr, shape = theano.sparse.csm_properties(x)
+        data = self._srng.binomial(size=data.shape, n=1, p=data, dtype=theano.config.floatX)
+        return theano.sparse.CSR(data, indices, indptr, shape)
+
+    def _replicate(self, x):
+        """
+        Repeat x for each replica of the ensemble along the batch axis.
+        """
+        if self.n_replicas == 1:
+            return x
+        return T.tile(x, (self.n_replicas,) + (1,) * (x.ndim - 1))
+
+    def _get_output(self, layer_or_layers, inputs, **kwargs):
+        """
+        get_output of the model layers, where the fused products on each input only hold the dense layers that
+        the outputs consume, e.g. not x_to_y on the repeated unlabeled x of the lower bound (cf. DenseGroup).
+        """
+        if not isinstance(inputs, dict):
+            inputs = {self.l_x_in: inputs}
+        consumed = get_all_layers(layer_or_layers, treat_as_input=inputs.keys())
+        for group in self.dense_groups:
+            if group.input_layer in inputs:
+                group.fuse(inputs[group.input_layer], consumed)
+        return get_output(layer_or_layers, inputs, **kwargs)
+
+    def _ensemble_mean(self, y):
+        """
+        Average the (n_replicas * n) x d outputs of the replicas of the ensemble.
+        """
+        if self.n_replicas == 1:
+            return y
+        return y.reshape((self.n_replicas, -1, y.shape[1])).mean(axis=0)
+
     def _classification_error(self, x, t):
-        y = get_output(self.l_y, x, deterministic=True).mean(axis=(1, 2))  # Mean over samples.
+        y = self._get_output(self.l_y, x, deterministic=True).mean(axis=(1, 2))  # Mean over samples.
+        y = self._ensemble_mean(y)
         t_class = T.argmax(t, axis=1)
         y_class = T.argmax(y, axis=1)
         missclass = T.sum(T.neq(y_class, t_class))
@@ -334,6 +600,65 @@ class ADGMSSL(Model):
     def get_output(self, x, samples=1):
         return self.f_y(x, samples)
 
+    def _labels_from_spec(self, spec):
+        """
+        Translate a class and count specification into a vector of class labels.
+        :param spec: A dict {class: count} or a list containing the count for each class.
+        :return: Vector of class labels.
+        """
+        if isinstance(spec, dict):
+            classes, counts = zip(*sorted(spec.items()))
+        else:
+            classes, counts = range(len(spec)), spec
+        return np.repeat(np.asarray(classes, dtype='int32'), np.asarray(counts, dtype='int64'))
+
+    def iter_generate(self, spec, chunk_size=10000, seed=None):
+        """
+        Stream samples from the generative model p(xhat|z,y) in chunks of fixed size. The latent variables
+        z are drawn from N(0,1) for a full chunk at a time.
+        :param spec: A dict {class: count}, a list of counts per class or a y matrix (n x n_y).
+        :param chunk_size: The number of samples run through f_xhat per call.
+        :param seed: The seed for drawing z.
+        :return: Generator yielding (start, stop, xhat) where xhat is the float chunk of rows start:stop.
+        """
+        rng = np.random.RandomState(seed)
+        y = None
+        if isinstance(spec, np.ndarray) and spec.ndim == 2:
+            y = np.asarray(spec, dtype=theano.config.floatX)
+            n = y.shape[0]
+        else:
+            labels = self._labels_from_spec(spec)
+            eye = np.eye(self.n_y, dtype=theano.config.floatX)
+            n = labels.shape[0]
+        for start in xrange(0, n, chunk_size):
+            stop = min(start + chunk_size, n)
+            y_chunk = y[start:stop] if y is not None else eye[labels[start:stop]]
+            z_chunk = rng.standard_normal((stop - start, self.n_z)).astype(theano.config.floatX)
+            yield start, stop, self.f_xhat(z_chunk, y_chunk, 1)
+
+    def generate(self, spec, chunk_size=10000, seed=None, out=None):
+        """
+        Generate samples from p(xhat|z,y) into a preallocated uint8 array, e.g. for data augmentation.
+        :param spec: A dict {class: count}, a list of counts per class or a y matrix (n x n_y).
+        :param chunk_size: The number of samples run through f_xhat per call.
+        :param seed: The seed for drawing z.
+        :param out: Optional preallocated uint8 array (n x n_x), e.g. a memory-mapped file.
+        :return: The generated samples as an uint8 array (n x n_x).
+        """
+        if isinstance(spec, np.ndarray) and spec.ndim == 2:
+            n = spec.shape[0]
+        else:
+            n = self._labels_from_spec(spec).shape[0]
+        if out is None:
+            out = np.empty((n, self.n_x), dtype='uint8')
+        scratch = np.empty((min(chunk_size, n), self.n_x), dtype=theano.config.floatX)
+        for start, stop, xhat in self.iter_generate(spec, chunk_size, seed):
+            buf = scratch[:stop - start]
+            np.multiply(xhat, 255., out=buf)
+            buf += .5
+            out[start:stop] = buf
+        return out
+
     def model_info(self):
         s = ""
         s += 'model q(a|x): %s.\n' % str(self.qa_shapes)[1:-1]
@@ -1,9 +1,14 @@
+import os
 import cPickle as pkl
 import lasagne
 import numpy as np
+import scipy.sparse as sp
 import theano
+import theano.sparse
 import theano.tensor as T
+from lasagne_extensions.random import counter_seed
 from utils import env_paths as paths
+from utils import run_registry
 from collections import OrderedDict
 
 
@@ -30,6 +35,12 @@ class Model(object):
         self.transf = trans_func
 
         self.model_params = None
+        self.output_layers = None  # The output layers of the model, used to find all layers.
+        self.optimizer_state = []  # Pairs of optimizer state shared variables and their initial values.
+        self.sh_flat_params = None  # Contiguous buffer holding all model params if flatten_params is called.
+        self.param_givens = OrderedDict()
+        self.storage_dtype = theano.config.floatX  # The dtype of the shared datasets, e.g. float16 to save memory.
+        self.column_mask = None  # Boolean mask of the input features kept by the data preparation, if any.
 
         # Model state serialisation and logging variables.
         self.model_name = self.__class__.__name__
@@ -72,24 +83,195 @@ class Model(object):
         self.sym_lr = T.scalar('learningrate')
         self.batch_slice = slice(self.sym_index * self.sym_batchsize, (self.sym_index + 1) * self.sym_batchsize)
 
-        self.sh_train_x = theano.shared(np.asarray(train_set[0], dtype=theano.config.floatX), borrow=True)
-        self.sh_train_t = theano.shared(np.asarray(train_set[1], dtype=theano.config.floatX), borrow=True)
-        self.sh_test_x = theano.shared(np.asarray(test_set[0], dtype=theano.config.floatX), borrow=True)
-        self.sh_test_t = theano.shared(np.asarray(test_set[1], dtype=theano.config.floatX), borrow=True)
+        self.sh_train_x = self._shared_data(train_set[0])
+        self.sh_train_t, self.sh_train_x_l, self.sh_train_t_l = None, None, None
+        if len(train_set) == 3:
+            # Separate store of the labeled data points (cf. mnist.load_semi_supervised_split).
+            self.sh_train_x_l = self._shared_data(train_set[1])
+            self.sh_train_t_l = self._shared_data(train_set[2])
+        else:
+            self.sh_train_t = self._shared_data(train_set[1])
+        self.sh_test_x = self._shared_data(test_set[0])
+        self.sh_test_t = self._shared_data(test_set[1])
         if validation_set is not None:
-            self.sh_valid_x = theano.shared(np.asarray(validation_set[0], dtype=theano.config.floatX), borrow=True)
-            self.sh_valid_t = theano.shared(np.asarray(validation_set[1], dtype=theano.config.floatX), borrow=True)
+            self.sh_valid_x = self._shared_data(validation_set[0])
+            self.sh_valid_t = self._shared_data(validation_set[1])
 
-    def dump_model(self, epoch=None):
+    def _shared_data(self, data):
+        """
+        Store a dataset in a shared variable of the storage dtype. Sparse datasets are stored as CSR matrices.
+        """
+        if sp.issparse(data):
+            return theano.sparse.shared(sp.csr_matrix(data, dtype=theano.config.floatX), borrow=True)
+        return theano.shared(np.asarray(data, dtype=self.storage_dtype), borrow=True)
+
+    def flatten_params(self):
+        """
+        Store all model params as views into one contiguous shared buffer. The original shared variables are
+        replaced by their views in every function compiled through compile_function, so updates, norms,
+        checkpoints and transfers of the params only need to touch the single buffer.
+        """
+        values = [param.get_value(borrow=True) for param in self.model_params]
+        self.param_shapes = [v.shape for v in values]
+        self.param_offsets = np.cumsum([0] + [v.size for v in values])
+        flat = np.concatenate([v.flatten() for v in values]).astype(theano.config.floatX)
+        self.sh_flat_params = theano.shared(flat, name='flat_params', borrow=True)
+        self.param_givens = OrderedDict()
+        for param, shape, a, b in zip(self.model_params, self.param_shapes, self.param_offsets[:-1],
+                                      self.param_offsets[1:]):
+            self.param_givens[param] = self.sh_flat_params[a:b].reshape(shape)
+
+    def flatten_grads(self, params, grads):
+        """
+        Concatenate gradients into a vector aligned with the flat parameter buffer.
+        Params without a gradient are given a zero gradient.
+        :param params: The params that the gradients belong to.
+        :param grads: The gradients.
+        :return: The flat gradient vector.
+        """
+        lookup = dict(zip(params, grads))
+        flat_grads = []
+        for param, a, b in zip(self.model_params, self.param_offsets[:-1], self.param_offsets[1:]):
+            if param in lookup and lookup[param] is not None:
+                flat_grads.append(lookup[param].flatten())
+            else:
+                flat_grads.append(T.zeros((b - a,), dtype=theano.config.floatX))
+        return T.concatenate(flat_grads)
+
+    def compile_function(self, inputs, outputs, givens=None, updates=None):
+        """
+        Compile a Theano function of the model, substituting the params with their views into the flat
+        parameter buffer if it is used.
+        """
+        all_givens = OrderedDict(self.param_givens)
+        if givens is not None:
+            all_givens.update(givens)
+        return theano.function(inputs=inputs, outputs=outputs, givens=all_givens, updates=updates)
+
+    def get_param_values(self):
+        """
+        Get the values of the model params. If the params are flattened, the values are views into the flat
+        buffer and no data is copied.
+        :return: List of the param values.
+        """
+        if self.sh_flat_params is None:
+            return [param.get_value() for param in self.model_params]
+        return self._split_flat(self.sh_flat_params.get_value(borrow=True))
+
+    def set_param_values(self, values):
+        """
+        Set the values of the model params.
+        :param values: List of param values or a flat vector of all param values.
+        """
+        if self.sh_flat_params is not None:
+            if not isinstance(values, np.ndarray):
+                values = np.concatenate([np.asarray(v).flatten() for v in values])
+            self.sh_flat_params.set_value(np.asarray(values, dtype=theano.config.floatX), borrow=True)
+            return
+        if isinstance(values, np.ndarray):
+            values = self._split_flat(values)
+        for param, value in zip(self.model_params, values):
+            param.set_value(np.asarray(value, dtype=theano.config.floatX), borrow=True)
+
+    def _split_flat(self, flat):
+        shapes = [param.get_value(borrow=True).shape for param in self.model_params]
+        offsets = np.cumsum([0] + [int(np.prod(shape)) for shape in shapes])
+        return [flat[a:b].reshape(shape) for shape, a, b in zip(shapes, offsets[:-1], offsets[1:])]
+
+    def register_optimizer_state(self, updates, params):
+        """
+        Register the shared variables updated by the optimizer that are not params, e.g. the moment estimates
+        of Adam, so that they can be reset in place.
+        :param updates: The updates returned by the update function.
+        :param params: The params that are optimized.
+        """
+        params = set(params)
+        self.optimizer_state = [(var, var.get_value().copy()) for var in updates.keys() if var not in params]
+
+    def reset_optimizer(self):
+        """
+        Reset the optimizer state to its initial values.
+        """
+        for var, value in self.optimizer_state:
+            var.set_value(value.copy(), borrow=True)
+
+    def snapshot(self):
+        """
+        Copy the params and the optimizer state into memory, e.g. to roll back a diverged training step.
+        :return: Tuple of the param values and the optimizer state values.
+        """
+        return ([np.copy(v) for v in self.get_param_values()],
+                [var.get_value() for var, _ in self.optimizer_state])
+
+    def restore(self, snapshot):
+        """
+        Restore the params and the optimizer state from a snapshot.
+        """
+        param_values, optimizer_values = snapshot
+        self.set_param_values([np.copy(v) for v in param_values])
+        for (var, _), value in zip(self.optimizer_state, optimizer_values):
+            var.set_value(value.copy(), borrow=True)
+
+    def reset_params(self, seed=None):
+        """
+        Re-initialize the model params in place from the initializers of the layers.
+        :param seed: The seed for the lasagne random generator.
+        """
+        if seed is not None:
+            lasagne.random.set_rng(np.random.RandomState(seed))
+        for layer in lasagne.layers.get_all_layers(self.output_layers):
+            if hasattr(layer, 'reset_params'):
+                layer.reset_params()
+        if self.sh_flat_params is not None:
+            self.set_param_values([param.get_value(borrow=True) for param in self.model_params])
+
+    def reseed(self, seed):
+        """
+        Seed all random streams of the model, i.e. of the model itself and of its sampling layers.
+        """
+        srng = getattr(self, '_srng', None)
+        if srng is not None:
+            srng.seed(seed)
+        for i, layer in enumerate(lasagne.layers.get_all_layers(self.output_layers)):
+            if hasattr(layer, '_srng') and layer._srng is not srng:
+                layer._srng.seed(seed + i + 1)
+
+    def reseed_counter(self, seed, epoch, batch, worker=0):
+        """
+        Seed the random streams for a batch from its position, so the samples of the batch do not depend on the
+        batches drawn before it or in other workers, e.g. of a resumed or a multi-process run.
+        """
+        self.reseed(counter_seed(seed, epoch, batch, worker))
+
+    def reset(self, seed):
+        """
+        Reset the model to a new initial state without recompiling, i.e. re-initialize the params and the
+        optimizer state and seed the random streams.
+        """
+        self.reset_params(seed)
+        self.reset_optimizer()
+        self.reseed(seed)
+
+    def dump_model(self, epoch=None, tag=None):
         """
         Dump the model into a pickled version in the model path formulated in the initialisation method.
+        If the params are flattened, the flat buffer is dumped in a single write.
+        :param epoch: Optional epoch appended to the file name.
+        :param tag: Optional tag appended to the file name, e.g. 'best'.
         """
         p = paths.get_model_path(self.get_root_path(), self.model_name, self.n_in, self.n_hidden, self.n_out)
         if not epoch is None: p += "_epoch_%i" % epoch
+        if not tag is None: p += "_%s" % tag
         if self.model_params is None:
             raise ("Model params are not set and can therefore not be pickled.")
-        model_params = [param.get_value() for param in self.model_params]
+        if self.sh_flat_params is not None:
+            model_params = self.sh_flat_params.get_value(borrow=True)
+        else:
+            model_params = [param.get_value() for param in self.model_params]
         pkl.dump(model_params, open(p, "wb"), protocol=pkl.HIGHEST_PROTOCOL)
+        run_registry.record(run_registry.register_checkpoint, self.get_root_path(), p, epoch, tag)
+        if self.column_mask is not None:
+            np.save(paths.get_column_mask_path(self.get_root_path()), self.column_mask)
 
     def load_model(self, id):
         """
@@ -97,11 +279,14 @@ class Model(object):
         :param id: The model ID is constructed from the timestamp when the model was defined.
         """
         model_params = (self.model_name, self.n_in, self.n_hidden, self.n_out, id)
-        root = paths.get_root_output_path(*model_params)
+        # Look up the root path in the run registry, the root path of older runs is derived from the model.
+        run = run_registry.record(run_registry.find_run, id, self.model_name)
+        root = run['root_path'] if run is not None else paths.get_root_output_path(*model_params)
         p = paths.get_model_path(root, *model_params[:-1])
         model_params = pkl.load(open(p, "rb"))
-        for i in range(len(self.model_params)):
-            self.model_params[i].set_value(np.asarray(model_params[i], dtype=theano.config.floatX), borrow=True)
+        self.set_param_values(model_params)
+        if os.path.exists(paths.get_column_mask_path(root)):
+            self.column_mask = np.load(paths.get_column_mask_path(root))
 
     def get_output(self, x):
         """
@@ -120,9 +305,9 @@ class Model(object):
         w_params = [w for w in params if 'W' in str(w)]
         shapes = []
         for i in range(len(w_params)):
-            shapes += [int(w_params[i].shape[0].eval())]
+            shapes += [int(w_params[i].shape[-2].eval())]
             if i == len(w_params) - 1:
-                shapes += [int(w_params[i].shape[1].eval())]
+                shapes += [int(w_params[i].shape[-1].eval())]
         return shapes
 
     def model_info(self):
@@ -0,0 +1,56 @@
+import os
+import argparse
+import tempfile
+import time
+import numpy as np
+from data_preparation import active_learning, mnist
+
+
+def run_active_learning():
+    """
+    Select the data points of an unlabeled pool to label next by the uncertainty of a quantized classifier
+    (cf. run_quantized_accuracy.py --output) and save their indices as the labeled set, which is loaded by
+    mnist.load_semi_supervised(labeled_idx=...).
+    """
+    parser = argparse.ArgumentParser(description=run_active_learning.__doc__)
+    parser.add_argument('classifier', help="The path of the .npz file of the quantized classifier.")
+    parser.add_argument('output', help="The path of the .npy index file.")
+    parser.add_argument('--pool', default=None, help="The path of an .npy file of the pool, defaults to the mnist "
+                                                     "train and validation set.")
+    parser.add_argument('--k', type=int, default=10, help="The number of data points per class.")
+    parser.add_argument('--measure', choices=['mi', 'entropy'], default='mi')
+    parser.add_argument('--samples', type=int, default=10, help="The number of MC samples of the auxiliary a.")
+    parser.add_argument('--chunk_size', type=int, default=10000)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--exclude', default=None, help="The path of an index file of the current labeled set.")
+    parser.add_argument('--seed', type=int, default=1234)
+    args = parser.parse_args()
+
+    pool, tmp = args.pool, None
+    if pool is None:
+        train_set = mnist.load_supervised(filter_std=0.0, train_valid_combine=True)[0]
+        tmp = tempfile.mkdtemp()
+        pool = os.path.join(tmp, 'pool.npy')
+        np.save(pool, train_set[0].astype('float32'))
+    exclude = active_learning.load_index(args.exclude) if args.exclude is not None else None
+    try:
+        start_time = time.time()
+        selected = active_learning.select(args.classifier, pool, args.k, args.measure, args.samples,
+                                          args.chunk_size, n_workers=args.workers, exclude=exclude, seed=args.seed)
+        n = np.load(pool, mmap_mode='r').shape[0]
+    finally:
+        if tmp is not None:
+            os.remove(pool)
+            os.rmdir(tmp)
+    print "scored %i data points in %0.2fs." % (n, time.time() - start_time)
+    for c in sorted(selected):
+        print "class %i;%i selected" % (c, len(selected[c]))
+    idx = np.concatenate([selected[c] for c in sorted(selected)])
+    if exclude is not None:
+        idx = np.concatenate([exclude, idx])  # Extend the current labeled set.
+    active_learning.save_index(args.output, idx)
+    print "saved %i indices to %s." % (len(idx), args.output)
+
+
+if __name__ == "__main__":
+    run_active_learning()
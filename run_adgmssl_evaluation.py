@@ -1,8 +1,8 @@
-import theano
 from lasagne_extensions.nonlinearities import rectify
 from data_preparation import mnist
 from models import ADGMSSL
 from lasagne_extensions.layers import get_output
+from utils.image import tile_images
 import matplotlib.pyplot as plt
 import numpy as np
 
@@ -32,7 +32,8 @@ def run_adgmssl_mnist():
     print "test set 100-samples: %0.2f%%." % class_err
 
     # Evaluate the active units in the auxiliary and latent distribution.
-    f_a_mu_logvar = theano.function([model.sym_x_l], get_output([model.l_a_mu, model.l_a_logvar], model.sym_x_l))
+    f_a_mu_logvar = model.compile_function([model.sym_x_l],
+                                           get_output([model.l_a_mu, model.l_a_logvar], model.sym_x_l))
     q_a_mu, q_a_logvar = f_a_mu_logvar(test_x)
     log_pa = -0.5 * (np.log(2 * np.pi) + (q_a_mu ** 2 + np.exp(q_a_logvar)))
     log_qa_x = -0.5 * (np.log(2 * np.pi) + 1 + q_a_logvar)
@@ -40,8 +41,8 @@ def run_adgmssl_mnist():
     mean_diff_pa_qa_x = np.abs(np.mean(diff_pa_qa_x, axis=0))
 
     inputs = {model.l_x_in: model.sym_x_l, model.l_y_in: model.sym_t_l}
-    f_z_mu_logvar = theano.function([model.sym_x_l, model.sym_t_l],
-                                    get_output([model.l_z_mu, model.l_z_logvar], inputs))
+    f_z_mu_logvar = model.compile_function([model.sym_x_l, model.sym_t_l],
+                                           get_output([model.l_z_mu, model.l_z_logvar], inputs))
     q_z_mu, q_z_logvar = f_z_mu_logvar(test_x, test_t)
     log_pz = -0.5 * (np.log(2 * np.pi) + (q_z_mu ** 2 + np.exp(q_z_logvar)))
     log_qz_x = -0.5 * (np.log(2 * np.pi) + 1 + q_z_logvar)
@@ -61,21 +62,10 @@ def run_adgmssl_mnist():
 
     # Sample 100 random normal distributed samples with fixed class y in the latent space and generate xhat.
     table_size = 10
-    samples = 1
-    z = np.random.random_sample((table_size ** 2, 100))
-    y = np.eye(10, k=0).reshape(10, 1, 10).repeat(10, axis=1).reshape((-1, 10))
-    xhat = model.f_xhat(z, y, samples)
+    xhat = model.generate([table_size] * 10, seed=1234)
 
     plt.figure(figsize=(20, 20), dpi=300)
-    i = 0
-    img_out = np.zeros((28 * table_size, 28 * table_size))
-    for x in range(table_size):
-        for y in range(table_size):
-            xa, xb = x * 28, (x + 1) * 28
-            ya, yb = y * 28, (y + 1) * 28
-            im = np.reshape(xhat[i], (28, 28))
-            img_out[xa:xb, ya:yb] = im
-            i += 1
+    img_out = tile_images(xhat, table_size, table_size)
     plt.matshow(img_out, cmap=plt.cm.binary)
     plt.xticks(np.array([]))
     plt.yticks(np.array([]))
@@ -0,0 +1,69 @@
+from utils import runtime
+runtime.configure()  # The thread counts and Theano flags must be set before Theano is imported.
+import argparse
+import time
+import numpy as np
+import theano
+from data_preparation import mnist, active_learning
+from lasagne_extensions.nonlinearities import rectify
+from models import ADGMSSL
+from training.finetune import EncoderCache, build_finetune
+from utils import env_paths as paths
+
+
+def run_adgmssl_finetune():
+    """
+    Fine-tune the classifier q(y|a,x) of a trained mnist auxiliary deep generative model on a labeled set, with
+    the moments of the frozen q(a|x) cached over the train set.
+    """
+    parser = argparse.ArgumentParser(description=run_adgmssl_finetune.__doc__)
+    parser.add_argument('id', help="The id of the trained model.")
+    parser.add_argument('--labeled_idx', default=None, help="The path of an index file of the labeled set, "
+                                                            "defaults to n_labeled random data points.")
+    parser.add_argument('--n_labeled', type=int, default=100)
+    parser.add_argument('--epochs', type=int, default=100)
+    parser.add_argument('--batchsize', type=int, default=100)
+    parser.add_argument('--samples', type=int, default=10, help="The number of MC samples of the auxiliary a.")
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--n_x', type=int, default=784)
+    args = parser.parse_args()
+
+    model = ADGMSSL(n_x=args.n_x, n_a=100, n_z=100, n_y=10, a_hidden=[500, 500],
+                    z_hidden=[500, 500], xhat_hidden=[500, 500], y_hidden=[500, 500],
+                    trans_func=rectify, x_dist='bernoulli')
+    model.load_model(args.id)
+    (x, t), (x_test, t_test), _ = mnist.load_supervised(filter_std=0.0, train_valid_combine=True,
+                                                        column_mask=model.column_mask)
+    x, x_test = x.astype(theano.config.floatX), x_test.astype(theano.config.floatX)
+
+    rng = np.random.RandomState(args.seed)
+    if args.labeled_idx is not None:
+        idx = active_learning.load_index(args.labeled_idx)
+    else:
+        idx = np.concatenate([rng.permutation(np.where(t[:, c] == 1)[0])[:args.n_labeled / t.shape[1]]
+                              for c in range(t.shape[1])])
+    idx = rng.permutation(idx)
+
+    start_time = time.time()
+    moments = EncoderCache(model, paths.get_cache_path()).load(x)
+    print "loaded the q(a|x) moments of %i data points in %0.2fs." % (x.shape[0], time.time() - start_time)
+
+    def test_err():
+        return 100. * np.mean(model.f_y(x_test, 100).argmax(axis=1) != t_test.argmax(axis=1))
+
+    print "test err %0.2f%% before fine-tuning." % test_err()
+    f_train, train_args = build_finetune(model, x[idx], t[idx], moments[idx])
+    train_args['inputs']['batchsize'] = args.batchsize
+    train_args['inputs']['samples'] = args.samples
+    n_batches = int(np.ceil(len(idx) / float(args.batchsize)))
+    for epoch in xrange(1, args.epochs + 1):
+        start_time = time.time()
+        outputs = np.mean([f_train(i, *train_args['inputs'].values()) for i in xrange(n_batches)], axis=0)
+        print "epoch %i;time %0.2fs;cost %0.4f;train err %0.2f%%" % (epoch, time.time() - start_time,
+                                                                     outputs[0], outputs[1])
+    print "test err %0.2f%% after fine-tuning." % test_err()
+    model.dump_model(tag='finetuned')
+
+
+if __name__ == "__main__":
+    run_adgmssl_finetune()
@@ -1,7 +1,10 @@
+from utils import runtime
+runtime.configure()  # The thread counts and Theano flags must be set before Theano is imported.
 from training.train import TrainModel
 from lasagne_extensions.nonlinearities import rectify
 from data_preparation import mnist
 from models import ADGMSSL
+from utils import memory
 import numpy as np
 
 
@@ -12,19 +15,26 @@ def run_adgmssl_mnist():
     n_labeled = 100  # The total number of labeled data points.
     n_samples = 100  # The number of sampled labeled data points for each batch.
     n_batches = 600  # The number of batches.
-    mnist_data = mnist.load_semi_supervised(n_batches=n_batches, n_labeled=n_labeled, n_samples=n_samples,
-                                            filter_std=0.0, seed=123456, train_valid_combine=True)
+    memory_budget_mb = None  # The memory budget of training in MB, None to keep the configured samples.
+    n_micro_batches = 1  # The number of micro-batches the gradients of a batch are accumulated over.
+    # The labeled data points are stored once and sampled for each batch during training.
+    mnist_data = mnist.load_semi_supervised_split(n_labeled=n_labeled, filter_std=0.0, seed=123456,
+                                                  train_valid_combine=True, return_mask=True)
+    mnist_data, column_mask = mnist_data[:3], mnist_data[3]
 
-    n, n_x = mnist_data[0][0].shape  # Datapoints in the dataset, input features.
-    bs = n / n_batches  # The batchsize.
+    n_u, n_x = mnist_data[0][0].shape  # Unlabeled datapoints in the dataset, input features.
+    bs = n_u / n_batches + n_samples  # The batchsize.
+    n = bs * n_batches  # Datapoints in an epoch including the sampled labeled data points.
 
     # Initialize the auxiliary deep generative model.
     model = ADGMSSL(n_x=n_x, n_a=100, n_z=100, n_y=10, a_hidden=[500, 500],
                     z_hidden=[500, 500], xhat_hidden=[500, 500], y_hidden=[500, 500],
-                    trans_func=rectify, x_dist='bernoulli')
+                    trans_func=rectify, x_dist='bernoulli', fuse_projections=True)
+    model.column_mask = column_mask  # Saved with the model to filter the features of new data.
 
     # Get the training functions.
-    f_train, f_test, f_validate, train_args, test_args, validate_args = model.build_model(*mnist_data)
+    f_train, f_test, f_validate, train_args, test_args, validate_args = model.build_model(
+        *mnist_data, n_micro_batches=n_micro_batches)
     # Update the default function arguments.
     train_args['inputs']['batchsize'] = bs
     train_args['inputs']['batchsize_labeled'] = n_samples
@@ -33,6 +43,12 @@ def run_adgmssl_mnist():
     train_args['inputs']['beta1'] = 0.9
     train_args['inputs']['beta2'] = 0.999
     train_args['inputs']['samples'] = 10  # if running a cpu: set this the no. of samples to 1.
+    if memory_budget_mb is not None:
+        # Pick the largest no. of samples of the memory profile that fits the budget (cf. run_memory_profile.py).
+        config = memory.pick_config(memory_budget_mb, memory.load_profile(), batchsize=bs,
+                                    batchsize_labeled=n_samples)
+        if config is not None:
+            train_args['inputs']['samples'] = config['samples']
     test_args['inputs']['samples'] = 1
     validate_args['inputs']['samples'] = 1
 
@@ -0,0 +1,39 @@
+import itertools
+from os.path import join
+from training.sweep import share_dataset, run_sweep
+from data_preparation import mnist
+from lasagne_extensions.nonlinearities import rectify
+from models import ADGMSSL
+from utils import env_paths as paths
+
+
+def run_adgmssl_sweep():
+    """
+    Run a hyperparameter sweep of the auxiliary deep generative model on the mnist dataset with 100 evenly
+    distributed labels. The training function is compiled once per architecture and process.
+    """
+    n_labeled = 100  # The total number of labeled data points.
+    n_samples = 100  # The number of sampled labeled data points for each batch.
+    n_batches = 600  # The number of batches.
+    mnist_data = mnist.load_semi_supervised(n_batches=n_batches, n_labeled=n_labeled, n_samples=n_samples,
+                                            filter_std=0.0, seed=123456, train_valid_combine=True)
+    n, n_x = mnist_data[0][0].shape  # Datapoints in the dataset, input features.
+    output_path = paths.path_exists(join(paths.get_output_path(), 'sweep'))
+    data_path = share_dataset(mnist_data, join(output_path, 'data'))
+
+    arch = dict(n_x=n_x, n_a=100, n_z=100, n_y=10, a_hidden=[500, 500], z_hidden=[500, 500],
+                xhat_hidden=[500, 500], y_hidden=[500, 500], trans_func=rectify, x_dist='bernoulli')
+    trials = []
+    for beta, lr, seed in itertools.product([0.01 * n, 0.1 * n], [3e-4, 1e-3], [1, 2]):
+        inputs = {'batchsize': n / n_batches, 'batchsize_labeled': n_samples, 'beta': beta, 'learningrate': lr,
+                  'samples': 1}
+        trials.append({'arch': arch, 'inputs': inputs, 'seed': seed, 'n_epochs': 10})
+
+    def logger(s):
+        print s
+
+    run_sweep(ADGMSSL, trials, data_path, join(output_path, 'results.csv'), n_processes=4, logger=logger)
+
+
+if __name__ == "__main__":
+    run_adgmssl_sweep()
@@ -0,0 +1,35 @@
+from utils import runtime
+runtime.configure()  # The thread counts and Theano flags must be set before Theano is imported.
+import sys
+import argparse
+from benchmarks import cases
+from benchmarks.harness import run_cases, save_results, load_results, compare
+
+
+def run_benchmarks():
+    """
+    Run the seeded benchmarks of the training and inference hot paths on synthetic data, save the results
+    as JSON and compare them against a baseline.
+    """
+    parser = argparse.ArgumentParser(description=run_benchmarks.__doc__)
+    parser.add_argument('--output', default='benchmark_results.json', help='path of the JSON results.')
+    parser.add_argument('--baseline', default=None, help='path of the JSON baseline results.')
+    parser.add_argument('--filter', default=None, help='only run the cases containing this string.')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='relative slowdown counted as regression.')
+    args = parser.parse_args()
+
+    def logger(s):
+        print s
+
+    results = run_cases(args.filter, logger)
+    save_results(results, args.output)
+    if args.baseline is not None:
+        regressions = compare(results, load_results(args.baseline), args.tolerance)
+        for name, base, median, change in regressions:
+            print "REGRESSION %s: %0.6fs -> %0.6fs (%+0.1f%%)." % (name, base, median, change * 100.)
+        if len(regressions) > 0:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    run_benchmarks()
@@ -0,0 +1,62 @@
+import sys
+import json
+import subprocess
+import multiprocessing
+from utils import runtime
+
+
+def time_f_train(n_threads, n_batches=20, batchsize=200, batchsize_labeled=100, samples=1):
+    """
+    Time f_train of the mnist auxiliary deep generative model with a given number of threads.
+    Synthetic data of the mnist shape is used, since the computation time does not depend on the values.
+    :return: The mean time per batch in seconds.
+    """
+    runtime.configure(n_threads=n_threads, openmp=n_threads > 1)
+    import time
+    import numpy as np
+    from lasagne_extensions.nonlinearities import rectify
+    from models import ADGMSSL
+
+    rng = np.random.RandomState(1234)
+    n, n_x, n_y = batchsize * n_batches, 784, 10
+    t = np.eye(n_y)[rng.randint(0, n_y, n)]
+    train_set = (rng.uniform(size=(n, n_x)), t)
+    test_set = (rng.uniform(size=(100, n_x)), t[:100])
+    model = ADGMSSL(n_x=n_x, n_a=100, n_z=100, n_y=n_y, a_hidden=[500, 500],
+                    z_hidden=[500, 500], xhat_hidden=[500, 500], y_hidden=[500, 500],
+                    trans_func=rectify, x_dist='bernoulli')
+    f_train, f_test, f_validate, train_args, test_args, validate_args = model.build_model(train_set, test_set)
+    train_args['inputs']['batchsize'] = batchsize
+    train_args['inputs']['batchsize_labeled'] = batchsize_labeled
+    train_args['inputs']['samples'] = samples
+    f_train(0, *train_args['inputs'].values())  # warm up
+    start_time = time.time()
+    for i in xrange(n_batches):
+        f_train(i, *train_args['inputs'].values())
+    return (time.time() - start_time) / n_batches
+
+
+def run_calibrate_threads():
+    """
+    Time f_train for a range of thread counts, each in a separate process since the thread counts must be
+    set before Theano is imported, and save the fastest setting in the runtime config.
+    """
+    n_cores = multiprocessing.cpu_count()
+    candidates = sorted(set([1, 2, 4, 8, 16, 32, n_cores / 2, n_cores]) & set(range(1, n_cores + 1)))
+    timings = {}
+    for n_threads in candidates:
+        out = subprocess.check_output([sys.executable, __file__, '--worker', str(n_threads)])
+        timings[n_threads] = json.loads(out.strip().split('\n')[-1])['time']
+        print "threads %i: %0.4fs per batch." % (n_threads, timings[n_threads])
+    best = min(timings, key=timings.get)
+    settings = runtime.load_config()
+    settings.update({'n_threads': best, 'openmp': best > 1,
+                     'calibration': dict((str(k), v) for k, v in timings.items())})
+    print "best: %i threads, saved in %s." % (best, runtime.save_config(settings))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == '--worker':
+        print json.dumps({'time': time_f_train(int(sys.argv[2]))})
+    else:
+        run_calibrate_threads()
@@ -0,0 +1,69 @@
+from utils import runtime
+runtime.configure()  # The thread counts and Theano flags must be set before Theano is imported.
+import argparse
+import time
+import numpy as np
+from data_preparation import mnist
+from lasagne_extensions.nonlinearities import rectify
+from models import ADGMSSL
+from utils.embeddings import EmbeddingExporter
+from utils.neighbours import NearestNeighbourIndex, brute_force, recall
+
+
+def benchmark_index(x, n_queries, k):
+    """
+    Compare the queries/sec and the recall of the index variants against a brute force search.
+    """
+    queries = np.asarray(x[:n_queries])
+    start_time = time.time()
+    exact = brute_force(queries, x, k)[1]
+    print "brute force;%0.1f queries/sec;recall 1.000" % (n_queries / (time.time() - start_time))
+    for name, kwargs in [('blocked', {}), ('random projection', {'partitioning': 'random_projection'}),
+                         ('ivf', {'partitioning': 'ivf'})]:
+        start_time = time.time()
+        index = NearestNeighbourIndex(x, **kwargs)
+        build_time = time.time() - start_time
+        start_time = time.time()
+        indices = index.search(queries, k)[1]
+        print "%s;%0.1f queries/sec;recall %0.3f;build %0.2fs" % (
+            name, n_queries / (time.time() - start_time), recall(indices, exact), build_time)
+
+
+def run_export_embeddings():
+    """
+    Export the q(a|x) and/or q(z|x,y) means of a trained mnist auxiliary deep generative model as float32
+    embeddings into a memory-mapped .npy file.
+    """
+    parser = argparse.ArgumentParser(description=run_export_embeddings.__doc__)
+    parser.add_argument('id', help="The id of the trained model.")
+    parser.add_argument('output', help="The path of the .npy file of the embeddings.")
+    parser.add_argument('--kind', choices=['a', 'z', 'az'], default='a')
+    parser.add_argument('--dataset', choices=['train', 'test'], default='train')
+    parser.add_argument('--labels', action='store_true', help="Compute the z means with the true labels instead "
+                                                             "of the most probable class.")
+    parser.add_argument('--samples', type=int, default=10, help="The number of MC samples of the auxiliary a.")
+    parser.add_argument('--chunk_size', type=int, default=10000)
+    parser.add_argument('--benchmark', type=int, default=0, help="The number of queries of an index benchmark.")
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--n_x', type=int, default=784)
+    args = parser.parse_args()
+
+    model = ADGMSSL(n_x=args.n_x, n_a=100, n_z=100, n_y=10, a_hidden=[500, 500],
+                    z_hidden=[500, 500], xhat_hidden=[500, 500], y_hidden=[500, 500],
+                    trans_func=rectify, x_dist='bernoulli')
+    model.load_model(args.id)
+    train_set, test_set, _ = mnist.load_supervised(filter_std=0.0, train_valid_combine=True,
+                                                   column_mask=model.column_mask)
+    x, t = train_set if args.dataset == 'train' else test_set
+
+    start_time = time.time()
+    embeddings = EmbeddingExporter(model, args.kind, args.samples).export(x, args.output, t if args.labels else None,
+                                                                          args.chunk_size)
+    print "exported %i x %i embeddings to %s in %0.2fs." % (embeddings.shape[0], embeddings.shape[1], args.output,
+                                                            time.time() - start_time)
+    if args.benchmark > 0:
+        benchmark_index(embeddings, args.benchmark, args.k)
+
+
+if __name__ == "__main__":
+    run_export_embeddings()
@@ -0,0 +1,41 @@
+import argparse
+from utils import run_registry
+
+
+def print_run(run):
+    metrics = ";".join("%s %0.4f" % (k, v) for k, v in sorted(run['metrics'].items()))
+    print "%s;%s;%s;%s" % (run['id'], run['model'], run['root_path'], metrics)
+
+
+def run_index_runs():
+    """
+    Query the run registry of the output root, or rebuild it from the existing run directories.
+    """
+    parser = argparse.ArgumentParser(description=run_index_runs.__doc__)
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.add_parser('rebuild', help="Index the existing run directories of the output root.")
+    find = subparsers.add_parser('find', help="Find a run by id.")
+    find.add_argument('id')
+    best = subparsers.add_parser('best', help="List the best runs by a final metric, e.g. test_err.")
+    best.add_argument('metric')
+    best.add_argument('--mode', choices=['min', 'max'], default='min')
+    best.add_argument('--limit', type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == 'rebuild':
+        print "indexed %i runs in %s." % (run_registry.rebuild(), run_registry.get_registry_path())
+    elif args.command == 'find':
+        run = run_registry.find_run(args.id)
+        if run is None:
+            print "no run with id %s." % args.id
+        else:
+            print_run(run)
+            for c in run['checkpoints']:
+                print "checkpoint;%s;epoch %s;tag %s" % (c['path'], str(c['epoch']), str(c['tag']))
+    elif args.command == 'best':
+        for run in run_registry.best_runs(args.metric, args.mode, args.limit):
+            print_run(run)
+
+
+if __name__ == "__main__":
+    run_index_runs()
@@ -0,0 +1,90 @@
+import os
+import sys
+import argparse
+from utils import runtime
+from utils import memory
+
+
+def profile_config(batchsize, batchsize_labeled, samples, synthetic=False, intermediates=False):
+    """
+    Compile f_train of the mnist auxiliary deep generative model as in run_adgmssl_mnist.py, i.e. with the full
+    train set in shared variables and the training Theano flags, and measure the peak RSS of a few calls.
+    :param synthetic: Use a synthetic mnist of the same size, e.g. offline. The memory does not depend on the
+    values of the data.
+    :param intermediates: Instead of the peak RSS, find the largest intermediate tensors, which requires the
+    intermediate results to be kept (allow_gc=False), so the peak RSS of this run does not reflect training.
+    """
+    runtime.configure()
+    if intermediates:
+        os.environ['THEANO_FLAGS'] = ','.join(
+            [f for f in os.environ.get('THEANO_FLAGS', '').split(',') if len(f) > 0] + ['allow_gc=False'])
+    if synthetic:
+        import tempfile
+        from benchmarks.data import write_synthetic_mnist
+        tmp = tempfile.mkdtemp()
+        write_synthetic_mnist(tmp)
+        os.chdir(tmp)  # the mnist loader uses the mnist.pkl.gz in the working directory.
+    from data_preparation import mnist
+    from lasagne_extensions.nonlinearities import rectify
+    from models import ADGMSSL
+
+    data = mnist.load_semi_supervised_split(n_labeled=100, filter_std=0.0, seed=123456, train_valid_combine=True)
+    model = ADGMSSL(n_x=data[0][0].shape[1], n_a=100, n_z=100, n_y=10, a_hidden=[500, 500],
+                    z_hidden=[500, 500], xhat_hidden=[500, 500], y_hidden=[500, 500],
+                    trans_func=rectify, x_dist='bernoulli', fuse_projections=True)
+    base_rss = memory.peak_rss_mb()
+    f_train, f_test, f_validate, train_args, test_args, validate_args = model.build_model(*data)
+    train_args['inputs']['batchsize'] = batchsize
+    train_args['inputs']['batchsize_labeled'] = batchsize_labeled
+    train_args['inputs']['samples'] = samples
+    for i in xrange(3):
+        f_train(i, *train_args['inputs'].values())
+    result = {'batchsize': batchsize, 'batchsize_labeled': batchsize_labeled, 'samples': samples}
+    if intermediates:
+        result['largest'] = memory.largest_intermediates(f_train)
+    else:
+        result.update({'base_rss_mb': base_rss, 'peak_rss_mb': memory.peak_rss_mb()})
+    return result
+
+
+def run_memory_profile():
+    """
+    Profile the memory footprint of f_train for a grid of (batchsize, batchsize_labeled, samples) and recommend
+    the largest configuration that fits a memory budget.
+    """
+    parser = argparse.ArgumentParser(description=run_memory_profile.__doc__)
+    parser.add_argument('--batchsize', type=int, nargs='+', default=[100, 200, 400])
+    parser.add_argument('--batchsize_labeled', type=int, nargs='+', default=[50, 100])
+    parser.add_argument('--samples', type=int, nargs='+', default=[1, 5, 10])
+    parser.add_argument('--budget_mb', type=float, default=None)
+    parser.add_argument('--synthetic', action='store_true', help="Profile on a synthetic mnist of the same size.")
+    parser.add_argument('--intermediates', action='store_true', help="Also find the largest intermediate "
+                                                                     "tensors in a separate run.")
+    args = parser.parse_args()
+
+    flags = (['--synthetic'] if args.synthetic else [])
+    profile = memory.profile_grid(args.batchsize, args.batchsize_labeled, args.samples, __file__, flags=flags,
+                                  intermediates=args.intermediates)
+    for c in profile:
+        s = "bs %i;bs_l %i;samples %i;peak %0.1fMB" % (c['batchsize'], c['batchsize_labeled'], c['samples'],
+                                                         c['peak_rss_mb'])
+        if 'largest' in c:
+            s += ";largest %0.1fMB %s" % (c['largest'][0]['mb'], c['largest'][0]['op'])
+        print s
+    print "profile saved in %s." % memory.save_profile(profile)
+    if args.budget_mb is not None:
+        c = memory.pick_config(args.budget_mb, profile)
+        if c is None:
+            print "no configuration fits %0.1fMB." % args.budget_mb
+        else:
+            print "recommended for %0.1fMB: batchsize %i, batchsize_labeled %i, samples %i." % (
+                args.budget_mb, c['batchsize'], c['batchsize_labeled'], c['samples'])
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 4 and sys.argv[1] == '--worker':
+        import json
+        print json.dumps(profile_config(*[int(a) for a in sys.argv[2:5]], synthetic='--synthetic' in sys.argv,
+                                        intermediates='--intermediates' in sys.argv))
+    else:
+        run_memory_profile()
@@ -0,0 +1,64 @@
+from utils import runtime
+runtime.configure(floatX='float32')  # The thread counts and Theano flags must be set before Theano is imported.
+import argparse
+import time
+import numpy as np
+from data_preparation import mnist
+from lasagne_extensions.nonlinearities import rectify
+from models import ADGMSSL
+
+
+def train_mnist(mixed_precision, n_epochs, n_batches, n_labeled, n_samples, seed):
+    """
+    Train the mnist auxiliary deep generative model and collect the lower bound and test error for each epoch.
+    """
+    mnist_data = mnist.load_semi_supervised_split(n_labeled=n_labeled, filter_std=0.0, seed=123456,
+                                                  train_valid_combine=True)
+    n_u, n_x = mnist_data[0][0].shape
+    bs = n_u / n_batches + n_samples
+
+    model = ADGMSSL(n_x=n_x, n_a=100, n_z=100, n_y=10, a_hidden=[500, 500],
+                    z_hidden=[500, 500], xhat_hidden=[500, 500], y_hidden=[500, 500],
+                    trans_func=rectify, x_dist='bernoulli', mixed_precision=mixed_precision)
+    f_train, f_test, f_validate, train_args, test_args, validate_args = model.build_model(*mnist_data)
+    model.reset(seed)
+    train_args['inputs']['batchsize'] = bs
+    train_args['inputs']['batchsize_labeled'] = n_samples
+    train_args['inputs']['beta'] = 0.01 * bs * n_batches
+
+    history = []
+    for epoch in xrange(n_epochs):
+        start_time = time.time()
+        lb = np.mean([f_train(i, *train_args['inputs'].values())[0] for i in xrange(n_batches)])
+        err = float(f_test(*test_args['inputs'].values())[0])
+        history.append({'epoch': epoch, 'lb': float(lb), 'err': err, 'time': time.time() - start_time,
+                        'loss_scale': float(model.sh_loss_scale.get_value()) if mixed_precision else 1.})
+    data_mb = sum(sh.get_value(borrow=True).nbytes for sh in [model.sh_train_x, model.sh_train_x_l]) / 2. ** 20
+    return history, data_mb
+
+
+def run_mixed_precision_parity():
+    """
+    Train the mnist auxiliary deep generative model in float32 and in mixed precision from the same initialization
+    and compare the convergence of the lower bound and the test error.
+    """
+    parser = argparse.ArgumentParser(description=run_mixed_precision_parity.__doc__)
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--batches', type=int, default=600)
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--tolerance', type=float, default=1.0, help="The maximum difference of the test error.")
+    args = parser.parse_args()
+
+    results = {}
+    for mixed_precision in [False, True]:
+        results[mixed_precision] = train_mnist(mixed_precision, args.epochs, args.batches, 100, 100, args.seed)
+    print "training data float32 %0.1fMB;mixed %0.1fMB." % (results[False][1], results[True][1])
+    for h32, h16 in zip(results[False][0], results[True][0]):
+        print "epoch %i;lb %0.4f/%0.4f;err %0.2f%%/%0.2f%%;time %0.2fs/%0.2fs;loss scale %i" % (
+            h32['epoch'], h32['lb'], h16['lb'], h32['err'], h16['err'], h32['time'], h16['time'], h16['loss_scale'])
+    diff = abs(results[False][0][-1]['err'] - results[True][0][-1]['err'])
+    print "parity %s: final test error difference %0.2f%%." % ("ok" if diff <= args.tolerance else "FAILED", diff)
+
+
+if __name__ == "__main__":
+    run_mixed_precision_parity()
@@ -0,0 +1,61 @@
+import time
+import argparse
+import threading
+import numpy as np
+from serving.server import PredictionClient
+
+
+def run_prediction_load():
+    """
+    Generate load on a local prediction server with concurrent clients sending random inputs, and report the
+    client side p50/p99 latency and throughput as well as the statistics of the server.
+    """
+    parser = argparse.ArgumentParser(description=run_prediction_load.__doc__)
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--socket', default=None)
+    parser.add_argument('--clients', type=int, default=32, help="The number of concurrent clients.")
+    parser.add_argument('--requests', type=int, default=100, help="The number of requests per client.")
+    parser.add_argument('--rows', type=int, default=1, help="The number of data points per request.")
+    parser.add_argument('--n_x', type=int, default=784)
+    args = parser.parse_args()
+
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def client(seed):
+        rng = np.random.RandomState(seed)
+        c = PredictionClient(args.port, args.socket)
+        try:
+            for _ in range(args.requests):
+                x = rng.uniform(size=(args.rows, args.n_x))
+                start_time = time.time()
+                try:
+                    c.predict(x)
+                except Exception as e:
+                    with lock:
+                        errors.append(str(e))
+                    continue
+                with lock:
+                    latencies.append(time.time() - start_time)
+        finally:
+            c.close()
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(args.clients)]
+    start_time = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.time() - start_time
+
+    latencies = np.asarray(latencies) * 1000.
+    print "clients %i;requests %i;errors %i;time %0.2fs." % (args.clients, len(latencies), len(errors), elapsed)
+    if len(latencies) > 0:
+        print "p50 %0.2fms;p99 %0.2fms;%0.1f requests/s;%0.1f rows/s." % (
+            np.percentile(latencies, 50), np.percentile(latencies, 99), len(latencies) / elapsed,
+            len(latencies) * args.rows / elapsed)
+    print "server %s." % str(PredictionClient(args.port, args.socket).stats())
+
+
+if __name__ == "__main__":
+    run_prediction_load()
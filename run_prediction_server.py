@@ -0,0 +1,51 @@
+from utils import runtime
+runtime.configure()  # The thread counts and Theano flags must be set before Theano is imported.
+import argparse
+import theano
+from lasagne_extensions.nonlinearities import rectify
+from models import ADGMSSL
+from serving.batcher import MicroBatcher
+from serving.server import create_server
+
+
+def run_prediction_server():
+    """
+    Serve the q(y|a,x) predictions of a trained mnist auxiliary deep generative model. The checkpoint is loaded
+    once and concurrent requests are gathered into micro-batches for f_y.
+    """
+    parser = argparse.ArgumentParser(description=run_prediction_server.__doc__)
+    parser.add_argument('id', help="The id of the trained model.")
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--socket', default=None, help="Serve on a Unix socket instead of the port.")
+    parser.add_argument('--max_batch_size', type=int, default=256)
+    parser.add_argument('--max_wait_ms', type=float, default=5.)
+    parser.add_argument('--samples', type=int, default=1, help="The number of MC samples of the auxiliary a.")
+    parser.add_argument('--n_x', type=int, default=784)
+    args = parser.parse_args()
+
+    model = ADGMSSL(n_x=args.n_x, n_a=100, n_z=100, n_y=10, a_hidden=[500, 500],
+                    z_hidden=[500, 500], xhat_hidden=[500, 500], y_hidden=[500, 500],
+                    trans_func=rectify, x_dist='bernoulli')
+    model.load_model(args.id)
+
+    def predict(x):
+        if model.column_mask is not None:
+            x = x[:, model.column_mask]
+        return model.f_y(x.astype(theano.config.floatX), args.samples)
+
+    n_x = len(model.column_mask) if model.column_mask is not None else model.n_x  # before the column mask.
+    batcher = MicroBatcher(predict, args.max_batch_size, args.max_wait_ms / 1000., n_x=n_x)
+    server = create_server(batcher, args.port, args.socket)
+    print "serving model %s on %s." % (args.id, args.socket if args.socket is not None else 'port %i' % args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.stop()
+        print "stats %s." % str(batcher.stats())
+
+
+if __name__ == "__main__":
+    run_prediction_server()
@@ -0,0 +1,74 @@
+from utils import runtime
+runtime.configure()  # The thread counts and Theano flags must be set before Theano is imported.
+import argparse
+import time
+import numpy as np
+import theano
+from data_preparation import mnist
+from lasagne_extensions.nonlinearities import rectify
+from models import ADGMSSL
+from serving.quantized import QuantizedClassifier
+
+
+def evaluate(predict, x, t):
+    """
+    :return: The classification error in percent and the rows per second of a prediction function.
+    """
+    start_time = time.time()
+    y = predict(x)
+    rows_per_sec = x.shape[0] / (time.time() - start_time)
+    return 100. * np.mean(y.argmax(axis=1) != t.argmax(axis=1)), rows_per_sec
+
+
+def run_quantized_accuracy():
+    """
+    Quantize the classifier of a trained mnist auxiliary deep generative model to int8 and compare the test error,
+    the scoring throughput and the size of the weights of the int8 path against the float32 paths at the same
+    number of MC samples. The int8 weights are dequantized once when loaded, so the int8 path reduces the size of
+    the shipped classifier and is expected to score at the speed of the numpy float32 path.
+    """
+    parser = argparse.ArgumentParser(description=run_quantized_accuracy.__doc__)
+    parser.add_argument('id', help="The id of the trained model.")
+    parser.add_argument('--samples', type=int, default=100, help="The number of MC samples of the auxiliary a.")
+    parser.add_argument('--batch_size', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--n_x', type=int, default=784)
+    parser.add_argument('--output', default=None, help="Path of the .npz file of the int8 classifier.")
+    args = parser.parse_args()
+
+    model = ADGMSSL(n_x=args.n_x, n_a=100, n_z=100, n_y=10, a_hidden=[500, 500],
+                    z_hidden=[500, 500], xhat_hidden=[500, 500], y_hidden=[500, 500],
+                    trans_func=rectify, x_dist='bernoulli')
+    model.load_model(args.id)
+    x_test, t_test = mnist.load_supervised(filter_std=0.0, column_mask=model.column_mask)[1]
+    x_test = x_test.astype(theano.config.floatX)
+
+    float32 = QuantizedClassifier.from_model(model, quantized=False)
+    int8 = QuantizedClassifier.from_model(model)
+    if args.output is not None:
+        int8.save(args.output)
+
+    def f_y(x):
+        return np.concatenate([model.f_y(x[i:i + args.batch_size], args.samples)
+                               for i in xrange(0, x.shape[0], args.batch_size)])
+
+    results = [('theano float32', f_y, None)]
+    for name, classifier in [('numpy float32', float32), ('numpy int8', int8)]:
+        results.append((name, lambda x, c=classifier: c.predict(x, args.samples, args.batch_size, args.seed),
+                        classifier.nbytes))
+    errors, throughputs = {}, {}
+    for name, predict, nbytes in results:
+        errors[name], rows_per_sec = evaluate(predict, x_test, t_test)
+        throughputs[name] = rows_per_sec
+        size = "weights %0.2fMB" % (nbytes / 2. ** 20) if nbytes is not None else "weights -"
+        print "%s;test err %0.2f%%;%0.1f rows/sec;%s;samples %i" % (name, errors[name], rows_per_sec, size,
+                                                                   args.samples)
+    print "quantization error difference %+0.2f%% (int8 - float32, same samples)." % (
+        errors['numpy int8'] - errors['numpy float32'])
+    speedups = [throughputs['numpy int8'] / throughputs[name] for name in ['numpy float32', 'theano float32']]
+    print "int8 speedup %0.2fx over numpy float32, %0.2fx over theano float32; weights %0.2fx smaller." % (
+        speedups[0], speedups[1], float(float32.nbytes) / int8.nbytes)
+
+
+if __name__ == "__main__":
+    run_quantized_accuracy()
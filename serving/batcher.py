@@ -0,0 +1,149 @@
+import time
+import Queue
+import threading
+import numpy as np
+from collections import deque
+
+
+class _Request(object):
+    def __init__(self, x):
+        self.x = x
+        self.y = None
+        self.error = None
+        self.time = time.time()
+        self.done = threading.Event()
+
+
+class MicroBatcher(object):
+    """
+    Gather concurrent prediction requests into micro-batches that are run through a single call of a compiled
+    prediction function on a worker thread. A batch is run as soon as it holds max_batch_size rows, or when
+    max_wait seconds have passed since its first request arrived.
+    """
+
+    def __init__(self, predict, max_batch_size=256, max_wait=0.005, n_latencies=10000, n_x=None):
+        """
+        :param predict: Function mapping a batch of inputs (n x n_x) to outputs (n x n_y), e.g. ADGMSSL.f_y.
+        :param max_batch_size: The maximum number of rows per batch, a single larger request is run on its own.
+        :param max_wait: The maximum time in seconds a request waits for other requests to join its batch.
+        :param n_latencies: The number of recent request latencies kept for the percentiles.
+        :param n_x: The number of inputs of a row. Requests of another width are rejected before they are queued,
+        so that they cannot fail the batch of other requests. None takes the width of the first request.
+        """
+        self.predict = predict
+        self.n_x = n_x
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue = Queue.Queue()
+        self.latencies = deque(maxlen=n_latencies)
+        self.n_requests = 0
+        self.n_batches = 0
+        self.n_rows = 0
+        self.start_time = time.time()
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='micro-batcher')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def check(self, x):
+        """
+        Check the shape of the inputs of a request.
+        :param x: Inputs of the request (n x n_x).
+        :return: The inputs as a 2d array.
+        """
+        x = np.atleast_2d(x)
+        if x.ndim != 2 or x.shape[0] == 0:
+            raise ValueError("Expected inputs of shape (n, n_x), got %s." % str(x.shape))
+        with self._lock:
+            if self.n_x is None:
+                self.n_x = x.shape[1]
+        if x.shape[1] != self.n_x:
+            raise ValueError("Expected %i inputs per row, got %i." % (self.n_x, x.shape[1]))
+        return x
+
+    def submit(self, x):
+        """
+        Predict the outputs of a request, blocking until its batch has been run.
+        :param x: Inputs of the request (n x n_x).
+        :return: Outputs of the request (n x n_y).
+        """
+        request = _Request(self.check(x))
+        with self._lock:
+            # The queue is drained after the worker has stopped, so no request can be queued afterwards.
+            if self._stopped.is_set():
+                raise RuntimeError("The micro-batcher is stopped.")
+            self.queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.y
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                first = self.queue.get(timeout=0.1)
+            except Queue.Empty:
+                continue
+            batch, n = [first], first.x.shape[0]
+            deadline = first.time + self.max_wait
+            while n < self.max_batch_size:
+                # Wait for requests until the deadline, afterwards only take the requests already queued.
+                remaining = deadline - time.time()
+                try:
+                    request = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+                except Queue.Empty:
+                    break
+                batch.append(request)
+                n += request.x.shape[0]
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        try:
+            y = self.predict(np.concatenate([r.x for r in batch]))
+            offset = 0
+            for r in batch:
+                r.y = y[offset:offset + r.x.shape[0]]
+                offset += r.x.shape[0]
+        except Exception as e:
+            for r in batch:
+                r.error = e
+        now = time.time()
+        with self._lock:
+            self.n_batches += 1
+            for r in batch:
+                self.n_requests += 1
+                self.n_rows += r.x.shape[0]
+                self.latencies.append(now - r.time)
+        for r in batch:
+            r.done.set()
+
+    def stats(self):
+        """
+        :return: Dict of the number of requests and batches, the mean batch size, the throughput in requests and
+        rows per second since the start and the p50/p99 latencies of the recent requests in milliseconds.
+        """
+        with self._lock:
+            latencies = np.asarray(self.latencies) * 1000.
+            elapsed = time.time() - self.start_time
+            stats = {'requests': self.n_requests, 'batches': self.n_batches,
+                     'mean_batch_rows': self.n_rows / float(max(self.n_batches, 1)),
+                     'requests_per_sec': self.n_requests / elapsed, 'rows_per_sec': self.n_rows / elapsed}
+        if len(latencies) > 0:
+            stats['p50_ms'], stats['p99_ms'] = [float(p) for p in np.percentile(latencies, [50, 99])]
+        return stats
+
+    def stop(self):
+        """
+        Stop the worker thread and fail the requests that are still queued.
+        """
+        with self._lock:
+            self._stopped.set()
+        self._thread.join()
+        while True:
+            try:
+                request = self.queue.get_nowait()
+            except Queue.Empty:
+                break
+            request.error = RuntimeError("The micro-batcher is stopped.")
+            request.done.set()
@@ -0,0 +1,164 @@
+import numpy as np
+from collections import OrderedDict
+
+
+def quantize(W):
+    """
+    Symmetric int8 quantization of a weight matrix with a scale per output channel, i.e. per column.
+    :param W: Weights (n_in x n_out).
+    :return: The int8 weights (n_in x n_out) and the float32 scales (n_out), W ~ W_q * scale.
+    """
+    W = np.asarray(W, dtype='float32')
+    scale = np.abs(W).max(axis=0) / 127.
+    scale[scale == 0] = 1.
+    W_q = np.clip(np.rint(W / scale), -127, 127).astype('int8')
+    return W_q, scale.astype('float32')
+
+
+def dequantize(W_q, scale):
+    return W_q.astype('float32') * scale
+
+
+def _relu(x):
+    return np.maximum(x, 0, out=x)
+
+
+def _softmax(x):
+    e = np.exp(x - x.max(axis=1, keepdims=True))
+    return e / e.sum(axis=1, keepdims=True)
+
+
+class QuantizedClassifier(object):
+    """
+    Numpy inference path of the q(a|x) -> q(y|a,x) classifier of ADGMSSL for scoring nodes without Theano.
+    The weights are stored and shipped as int8 with a float32 scale per output channel, a quarter of the float32
+    size. Numpy has no fast integer matrix product, so the weights are dequantized once when the classifier is
+    built and scoring runs float32 products at the speed of the float32 path. The dense layers on the same input
+    are concatenated into one product, as in lasagne_extensions.layers.DenseGroup.
+    """
+
+    def __init__(self, layers, column_mask=None):
+        """
+        :param layers: OrderedDict of layer name to (W, scale, b), where scale is None for float32 weights.
+        The names are 'a_hidden_<i>', 'a_mu', 'a_logvar', 'a_to_y', 'x_to_y', 'y_hidden_<i>' and 'y_out'.
+        :param column_mask: Optional column mask of the inputs (cf. mnist.load_semi_supervised_split).
+        """
+        self.layers = layers
+        self.column_mask = column_mask
+        self.a_hidden = sorted([k for k in layers if k.startswith('a_hidden_')], key=lambda k: int(k.split('_')[-1]))
+        self.y_hidden = sorted([k for k in layers if k.startswith('y_hidden_')], key=lambda k: int(k.split('_')[-1]))
+        self.n_x = layers['x_to_y'][0].shape[0]
+        self.n_a = layers['a_mu'][0].shape[1]
+        # The float32 weights used for scoring, dequantized once instead of on every batch.
+        self._weights = dict((name, (W if scale is None else dequantize(W, scale), b))
+                             for name, (W, scale, b) in layers.items())
+        first = self.a_hidden[:1] if len(self.a_hidden) > 0 else ['a_mu', 'a_logvar']
+        self._groups = {}
+        for names in [tuple(first + ['x_to_y']), ('a_mu', 'a_logvar')]:
+            self._groups[names] = self._concatenate(names)
+
+    @classmethod
+    def from_model(cls, model, quantized=True):
+        """
+        Build the classifier from the current params of a model, e.g. after ADGMSSL.load_model.
+        :param model: ADGMSSL instance of a single model with rectify hidden units.
+        :param quantized: Quantize the weights to int8, or keep the float32 weights as a reference.
+        """
+        from lasagne_extensions.nonlinearities import rectify
+        if model.n_replicas > 1:
+            raise ValueError("The quantized classifier does not support ensembles of replicas.")
+        if model.transf is not rectify:
+            raise ValueError("The quantized classifier only supports rectify hidden units.")
+        values = dict(zip(model.model_params, model.get_param_values()))
+        named = [('a_hidden_%i' % i, l) for i, l in enumerate(model.classifier_layers['a_hidden'])]
+        named += [(k, model.classifier_layers[k]) for k in ['a_mu', 'a_logvar', 'a_to_y', 'x_to_y']]
+        named += [('y_hidden_%i' % i, l) for i, l in enumerate(model.classifier_layers['y_hidden'])]
+        named += [('y_out', model.classifier_layers['y_out'])]
+        layers = OrderedDict()
+        for name, l in named:
+            W, b = values[l.W], np.asarray(values[l.b], dtype='float32')
+            layers[name] = quantize(W) + (b,) if quantized else (np.asarray(W, dtype='float32'), None, b)
+        return cls(layers, model.column_mask)
+
+    def save(self, path):
+        arrays = {}
+        for name, (W, scale, b) in self.layers.items():
+            arrays[name + '_W'], arrays[name + '_b'] = W, b
+            if scale is not None:
+                arrays[name + '_scale'] = scale
+        if self.column_mask is not None:
+            arrays['column_mask'] = self.column_mask
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        f = np.load(path)
+        names = sorted([k[:-2] for k in f.files if k.endswith('_W')])
+        layers = OrderedDict((name, (f[name + '_W'], f[name + '_scale'] if name + '_scale' in f.files else None,
+                                     f[name + '_b'])) for name in names)
+        return cls(layers, f['column_mask'] if 'column_mask' in f.files else None)
+
+    @property
+    def nbytes(self):
+        """
+        The number of bytes of the stored weights, scales and biases, i.e. the size of the saved classifier.
+        """
+        return sum(a.nbytes for W, scale, b in self.layers.values() for a in [W, scale, b] if a is not None)
+
+    def _concatenate(self, names):
+        Ws, bs = zip(*[self._weights[name] for name in names])
+        splits = np.cumsum([W.shape[1] for W in Ws])[:-1]
+        return np.concatenate(Ws, axis=1), np.concatenate(bs), splits
+
+    def _layer(self, x, name):
+        W, b = self._weights[name]
+        return np.dot(x, W) + b
+
+    def _group(self, x, names):
+        W, b, splits = self._groups[names]
+        return np.split(np.dot(x, W) + b, splits, axis=1)
+
+    def _predict_batch(self, x, samples, rng):
+        n = x.shape[0]
+        if len(self.a_hidden) > 0:
+            h, x_to_y = self._group(x, tuple(self.a_hidden[:1] + ['x_to_y']))
+            h = _relu(h)
+            for name in self.a_hidden[1:]:
+                h = _relu(self._layer(h, name))
+            a_mu, a_logvar = self._group(h, ('a_mu', 'a_logvar'))
+        else:
+            a_mu, a_logvar, x_to_y = self._group(x, ('a_mu', 'a_logvar', 'x_to_y'))
+        # Sample a for each data point as in the SampleLayer, with the samples of a data point in consecutive rows.
+        eps = rng.standard_normal((n, samples, self.n_a)).astype('float32')
+        a = (a_mu[:, None, :] + np.exp(0.5 * a_logvar)[:, None, :] * eps).reshape((n * samples, self.n_a))
+        h = self._layer(a, 'a_to_y').reshape((n, samples, -1)) + x_to_y[:, None, :]
+        h = _relu(h.reshape((n * samples, -1)))
+        for name in self.y_hidden:
+            h = _relu(self._layer(h, name))
+        y = _softmax(self._layer(h, 'y_out'))
+        return y.reshape((n, samples, -1))
+
+    def _iter_batches(self, x, samples, batch_size, seed):
+        rng = np.random.RandomState(seed)
+        mask = self.column_mask if self.column_mask is not None and x.shape[1] == self.column_mask.shape[0] else None
+        for i in xrange(0, x.shape[0], batch_size):
+            x_batch = x[i:i + batch_size] if mask is None else x[i:i + batch_size][:, mask]
+            yield self._predict_batch(np.asarray(x_batch, dtype='float32'), samples, rng)
+
+    def predict(self, x, samples=1, batch_size=1000, seed=None):
+        """
+        The mean of q(y|a,x) over the MC samples of a, as ADGMSSL.f_y.
+        :param x: Inputs (n x n_x), or unfiltered inputs if the classifier has a column mask.
+        :param samples: The number of MC samples of a.
+        :param batch_size: The number of rows per batch.
+        :param seed: The seed of the samples, the same seed and batch size give the same samples.
+        :return: Class probabilities (n x n_y).
+        """
+        return np.concatenate([y.mean(axis=1) for y in self._iter_batches(x, samples, batch_size, seed)])
+
+    def predict_samples(self, x, samples=1, batch_size=1000, seed=None):
+        """
+        The q(y|a,x) of each MC sample of a, e.g. for the mutual information between y and a.
+        :return: Class probabilities (n x samples x n_y).
+        """
+        return np.concatenate(list(self._iter_batches(x, samples, batch_size, seed)))
@@ -0,0 +1,124 @@
+import os
+import json
+import socket
+import httplib
+import SocketServer
+import BaseHTTPServer
+import numpy as np
+
+
+def make_handler(batcher):
+    """
+    HTTP handler serving POST /predict with a JSON body {"x": [[...], ...]} answered by {"y": [[...], ...]},
+    and GET /stats with the statistics of the micro-batcher.
+    """
+
+    class PredictionHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive connections.
+
+        def _respond(self, code, body):
+            body = json.dumps(body)
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            if self.path != '/predict':
+                return self._respond(404, {'error': 'unknown path %s' % self.path})
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.getheader('Content-Length'))))
+                x = batcher.check(np.asarray(request['x'], dtype='float32'))
+            except (ValueError, KeyError, TypeError) as e:
+                return self._respond(400, {'error': str(e)})
+            try:
+                y = batcher.submit(x)
+            except Exception as e:
+                return self._respond(500, {'error': str(e)})
+            self._respond(200, {'y': y.tolist()})
+
+        def do_GET(self):
+            if self.path != '/stats':
+                return self._respond(404, {'error': 'unknown path %s' % self.path})
+            self._respond(200, batcher.stats())
+
+        def address_string(self):
+            return str(self.client_address)  # client_address is not a (host, port) pair on Unix sockets.
+
+        def log_message(self, format, *args):
+            pass  # logging every request dominates the latency.
+
+    return PredictionHandler
+
+
+class ThreadedHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # the default backlog of 5 refuses bursts of concurrent connections.
+
+
+class ThreadedUnixHTTPServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        SocketServer.UnixStreamServer.server_bind(self)
+        self.server_name, self.server_port = 'localhost', 0
+
+
+def create_server(batcher, port=8000, socket_path=None):
+    """
+    Create a threaded HTTP server for a micro-batcher on a local TCP port or a Unix socket. Each connection is
+    handled on its own thread, so concurrent requests are gathered by the micro-batcher.
+    :param batcher: The MicroBatcher.
+    :param port: The TCP port on localhost.
+    :param socket_path: The path of a Unix socket, used instead of the port if given.
+    :return: The server, call serve_forever to start serving.
+    """
+    handler = make_handler(batcher)
+    if socket_path is not None:
+        return ThreadedUnixHTTPServer(socket_path, handler)
+    return ThreadedHTTPServer(('127.0.0.1', port), handler)
+
+
+class UnixHTTPConnection(httplib.HTTPConnection):
+    def __init__(self, socket_path, timeout=60):
+        httplib.HTTPConnection.__init__(self, 'localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class PredictionClient(object):
+    """
+    Client of the prediction server keeping a single connection open.
+    """
+
+    def __init__(self, port=8000, socket_path=None, timeout=60):
+        if socket_path is not None:
+            self.connection = UnixHTTPConnection(socket_path, timeout)
+        else:
+            self.connection = httplib.HTTPConnection('127.0.0.1', port, timeout=timeout)
+
+    def _request(self, method, path, body=None):
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        self.connection.request(method, path, body, headers)
+        response = self.connection.getresponse()
+        result = json.loads(response.read())
+        if response.status != 200:
+            raise RuntimeError("The prediction server returned %i: %s." % (response.status, result.get('error')))
+        return result
+
+    def predict(self, x):
+        return np.asarray(self._request('POST', '/predict', json.dumps({'x': np.atleast_2d(x).tolist()}))['y'])
+
+    def stats(self):
+        return self._request('GET', '/stats')
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,65 @@
+import numpy as np
+import lasagne
+from lasagne_extensions.nonlinearities import rectify
+from models import ADGMSSL
+
+# A small architecture, so that the models of the tests compile and train quickly.
+CONFIG = dict(n_x=20, n_a=4, n_z=4, n_y=3, a_hidden=[8], z_hidden=[8], xhat_hidden=[8], y_hidden=[8],
+              trans_func=rectify, x_dist='bernoulli')
+
+
+def build_model(seed=1234, **kwargs):
+    """
+    Build a seeded model of the small architecture, kwargs override the architecture.
+    """
+    lasagne.random.set_rng(np.random.RandomState(seed))
+    config = dict(CONFIG)
+    config.update(kwargs)
+    model = ADGMSSL(**config)
+    model.reseed(seed)
+    return model
+
+
+def semi_supervised(n_batches=4, batchsize=12, n_x=20, n_y=3, seed=1234):
+    """
+    A random train and test set in the interleaved format of mnist.load_semi_supervised, with x in [0, 1].
+    """
+    rng = np.random.RandomState(seed)
+    n = n_batches * batchsize
+    x = rng.uniform(size=(n, n_x)).astype('float32')
+    t = np.eye(n_y)[rng.randint(0, n_y, n)].astype('float32')
+    x_test = rng.uniform(size=(30, n_x)).astype('float32')
+    t_test = np.eye(n_y)[rng.randint(0, n_y, 30)].astype('float32')
+    return (x, t), (x_test, t_test), None
+
+
+def semi_supervised_split(n_batches=4, batchsize_unlabeled=8, n_labeled=4, n_x=20, n_y=3, seed=1234):
+    """
+    A random train and test set in the split format (x_u, x_l, t_l) of mnist.load_semi_supervised_split. The
+    labeled data points are copies of a single data point, so the steps do not depend on which of them are
+    sampled into a batch.
+    """
+    rng = np.random.RandomState(seed)
+    x_u = rng.uniform(size=(n_batches * batchsize_unlabeled, n_x)).astype('float32')
+    x_l = np.repeat(rng.uniform(size=(1, n_x)), n_labeled, axis=0).astype('float32')
+    t_l = np.repeat(np.eye(n_y)[rng.randint(0, n_y, 1)], n_labeled, axis=0).astype('float32')
+    x_test = rng.uniform(size=(30, n_x)).astype('float32')
+    t_test = np.eye(n_y)[rng.randint(0, n_y, 30)].astype('float32')
+    return (x_u, x_l, t_l), (x_test, t_test), None
+
+
+def set_inputs(train_args, batchsize=12, batchsize_labeled=4, samples=2):
+    train_args['inputs']['batchsize'] = batchsize
+    train_args['inputs']['batchsize_labeled'] = batchsize_labeled
+    train_args['inputs']['samples'] = samples
+    return train_args['inputs'].values()
+
+
+def suppress_latent_noise(model):
+    """
+    Set the log-variances of q(a|x) and q(z|x,y) to a constant -30, so that the samples of a and z equal their
+    means up to a negligible noise and training steps are deterministic.
+    """
+    for layer in [model.classifier_layers['a_logvar'], model.l_z_logvar.input_layer]:
+        layer.W.set_value(np.zeros_like(layer.W.get_value()))
+        layer.b.set_value(np.full_like(layer.b.get_value(), -30.))
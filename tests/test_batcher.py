@@ -0,0 +1,66 @@
+import threading
+import numpy as np
+import pytest
+from serving.batcher import MicroBatcher
+
+
+def test_micro_batches_concurrent_requests():
+    batcher = MicroBatcher(lambda x: x * 2, max_batch_size=64, max_wait=0.05, n_x=3)
+    results = {}
+
+    def request(i):
+        results[i] = batcher.submit(np.full((2, 3), i, dtype='float32'))
+
+    threads = [threading.Thread(target=request, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    batcher.stop()
+    for i in range(8):
+        np.testing.assert_array_equal(results[i], np.full((2, 3), 2 * i))
+    assert batcher.stats()['batches'] < 8
+
+
+def test_wrong_width_is_rejected_before_queueing():
+    batcher = MicroBatcher(lambda x: x, n_x=3)
+    with pytest.raises(ValueError):
+        batcher.submit(np.zeros((1, 4)))
+    np.testing.assert_array_equal(batcher.submit(np.ones((1, 3))), np.ones((1, 3)))
+    batcher.stop()
+    assert batcher.stats()['requests'] == 1
+
+
+def test_stop_fails_queued_requests():
+    release = threading.Event()
+
+    def predict(x):
+        release.wait()
+        return x
+
+    batcher = MicroBatcher(predict, max_batch_size=1, max_wait=0., n_x=1)
+    errors = []
+
+    def request():
+        try:
+            batcher.submit(np.zeros((1, 1)))
+        except RuntimeError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=request) for _ in range(3)]
+    for t in threads:
+        t.start()
+    while batcher.queue.qsize() < 2:  # The first request is held by predict, the others are queued.
+        threading.Event().wait(0.01)
+    stopper = threading.Thread(target=batcher.stop)
+    stopper.start()
+    while not batcher._stopped.is_set():
+        threading.Event().wait(0.01)
+    release.set()
+    stopper.join()
+    for t in threads:
+        t.join(5.)
+        assert not t.is_alive()
+    assert len(errors) == 2
+    with pytest.raises(RuntimeError):
+        batcher.submit(np.zeros((1, 1)))
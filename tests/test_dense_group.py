@@ -0,0 +1,38 @@
+import numpy as np
+import theano
+import theano.tensor as T
+from lasagne.layers import InputLayer, get_output
+from lasagne_extensions.layers import DenseLayer, DenseGroup
+
+
+def _layers():
+    l_in = InputLayer((None, 6))
+    layers = [DenseLayer(l_in, n, nonlinearity=None) for n in [3, 4, 5]]
+    return layers, DenseGroup(layers)
+
+
+def _product_width(group, layer, x):
+    # The number of columns of the matrix product that the activation of the layer is sliced from.
+    activation = group.get_activation(layer, x)
+    if isinstance(activation.owner.op, T.Subtensor):
+        activation = activation.owner.inputs[0]
+    return activation.eval({x: np.zeros((2, 6), dtype=theano.config.floatX)}).shape[1]
+
+
+def test_fused_activations_match_the_separate_products():
+    layers, group = _layers()
+    x = T.matrix('x')
+    group.fuse(x, layers[:2])
+    f = theano.function([x], get_output(layers, x))
+    x_value = np.random.RandomState(1234).uniform(size=(7, 6)).astype(theano.config.floatX)
+    for y, l in zip(f(x_value), layers):
+        np.testing.assert_allclose(y, np.dot(x_value, l.W.get_value()) + l.b.get_value(), rtol=1e-5)
+
+
+def test_only_the_declared_layers_share_a_product():
+    layers, group = _layers()
+    x, other = T.matrix('x'), T.matrix('other')
+    group.fuse(x, layers[:2])
+    assert [_product_width(group, l, x) for l in layers] == [7, 7, 5]
+    # Variables without a declaration, e.g. of a get_output outside the model, are not fused.
+    assert [_product_width(group, l, other) for l in layers] == [3, 4, 5]
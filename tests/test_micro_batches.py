@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+from tests.helpers import build_model, semi_supervised, semi_supervised_split, set_inputs, suppress_latent_noise
+
+
+def _train(n_micro_batches, dataset):
+    # Gaussian inputs are not binarized, so the step does not depend on the random streams.
+    model = build_model(x_dist='gaussian')
+    suppress_latent_noise(model)
+    f_train, _, _, train_args, _, _ = model.build_model(*dataset(), n_micro_batches=n_micro_batches)
+    inputs = set_inputs(train_args)
+    # A few steps, since the first Adam step only depends on the signs of the gradients.
+    outputs = [f_train(i, *inputs) for i in range(3)]
+    return np.array(outputs)[:, :2], model.get_param_values()
+
+
+@pytest.mark.parametrize('dataset', [semi_supervised, semi_supervised_split])
+def test_micro_batches_match_the_single_shot_steps(dataset):
+    outputs, params = _train(1, dataset)
+    micro_outputs, micro_params = _train(4, dataset)
+    np.testing.assert_allclose(micro_outputs, outputs, rtol=1e-4)  # lb and gnorm.
+    for micro_param, param in zip(micro_params, params):
+        np.testing.assert_allclose(micro_param, param, rtol=1e-4, atol=1e-6)
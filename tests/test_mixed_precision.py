@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+import theano
+from tests.helpers import build_model, semi_supervised, set_inputs, suppress_latent_noise
+
+pytestmark = pytest.mark.skipif(theano.config.floatX != 'float32', reason="Mixed precision requires float32.")
+
+
+def _train(**kwargs):
+    # Gaussian inputs are not binarized, so both models draw no random bits from the float16 data.
+    model = build_model(x_dist='gaussian', **kwargs)
+    suppress_latent_noise(model)
+    initial = np.concatenate([v.flatten() for v in model.get_param_values()])
+    f_train, _, _, train_args, _, _ = model.build_model(*semi_supervised())
+    inputs = set_inputs(train_args)
+    lb = np.array([f_train(i, *inputs)[0] for i in range(3)])
+    update = np.concatenate([v.flatten() for v in model.get_param_values()]) - initial
+    return model, lb, update
+
+
+def test_mixed_precision_matches_float32():
+    _, lb, update = _train()
+    model, lb_mixed, update_mixed = _train(mixed_precision=True)
+    assert model.sh_train_x.dtype == 'float16'
+    np.testing.assert_allclose(lb_mixed, lb, rtol=1e-2)
+    # The first Adam steps are close to the gradient signs, which may differ for gradients close to zero.
+    assert np.linalg.norm(update_mixed - update) < 0.1 * np.linalg.norm(update)
+
+
+def test_flat_params_keep_the_float16_storage():
+    model = build_model(mixed_precision=True, flat_params=True)
+    model.build_model(*semi_supervised())
+    assert model.sh_train_x.dtype == 'float16'
+    assert model.sh_flat_params.dtype == 'float32'
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+import theano
+from lasagne_extensions.random import CounterRandomStreams, counter_seed
+from tests.helpers import build_model, semi_supervised, set_inputs
+
+
+def _draw(n_calls_before, seed, epoch, batch, worker):
+    # A run with its own streams, that has drawn n_calls_before times before the batch.
+    srng = CounterRandomStreams()
+    f = theano.function([], [srng.normal((5, 3)), srng.uniform((4,)), srng.binomial((6,), p=0.5),
+                             srng.random_integers((6,), low=0, high=9)])
+    for _ in range(n_calls_before):
+        f()
+    srng.seed(counter_seed(seed, epoch, batch, worker))
+    return f()
+
+
+def test_counter_streams_reproduce_the_samples_of_a_batch():
+    samples = _draw(0, 1, 2, 3, 0)
+    for x, y in zip(samples, _draw(5, 1, 2, 3, 0)):
+        np.testing.assert_array_equal(x, y)
+    other_worker = _draw(0, 1, 2, 3, 1)
+    assert not np.array_equal(samples[0], other_worker[0])
+
+
+def _train_step(model, seed, epoch, batch, worker):
+    f_train, _, _, train_args, _, _ = model.build_model(*semi_supervised())
+    inputs = set_inputs(train_args)
+    model.reseed_counter(seed, epoch, batch, worker)
+    return np.array(f_train(batch, *inputs))
+
+
+@pytest.mark.parametrize('rng_backend', ['shared', 'counter'])
+def test_reseeded_runs_draw_the_same_samples(rng_backend):
+    outputs = _train_step(build_model(rng_backend=rng_backend), 1, 2, 3, 0)
+    # Another run whose streams were in another state before the batch.
+    model = build_model(rng_backend=rng_backend)
+    model.reseed(4321)
+    np.testing.assert_array_equal(_train_step(model, 1, 2, 3, 0), outputs)
+    assert not np.array_equal(_train_step(build_model(rng_backend=rng_backend), 1, 2, 3, 1), outputs)
+
+
+def test_uniform_samples_are_in_the_open_unit_interval():
+    bits = theano.tensor.lvector('bits')
+    u = theano.function([bits], CounterRandomStreams._uniform01(bits, 'float32'))
+    values = u(np.array([0, 0xFFFFFFFF, 0xFFFFFF00, 0x80000000], dtype='int64'))
+    assert values.dtype == np.float32
+    assert values.min() > 0. and values.max() < 1.
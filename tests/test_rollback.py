@@ -0,0 +1,81 @@
+import numpy as np
+from collections import OrderedDict
+from utils import run_registry
+from training.train import TrainModel
+
+
+class _CounterModel(object):
+    """
+    Stand-in for a model with a single param that every training step increases by the learning rate.
+    """
+
+    def __init__(self, root_path):
+        self.root_path = root_path
+        self.param = 0.
+
+    def get_root_path(self):
+        return self.root_path
+
+    def model_info(self):
+        return "counter"
+
+    def snapshot(self):
+        return self.param
+
+    def restore(self, snapshot):
+        self.param = snapshot
+
+    def after_epoch(self):
+        pass
+
+
+def test_rollback_restores_the_snapshot_of_a_previous_epoch(tmpdir, monkeypatch):
+    monkeypatch.setattr(run_registry, 'get_registry_path', lambda: str(tmpdir.join('runs.sqlite')))
+    model = _CounterModel(str(tmpdir))
+    nan_steps, calls = [4], []
+
+    def f_train(i, learningrate):
+        calls.append(model.param)
+        if len(calls) - 1 in nan_steps:
+            model.param = np.nan  # the diverged step writes non-finite params.
+            return [model.param, 0.]
+        model.param += learningrate
+        return [model.param, 1.]
+
+    train_args = {'inputs': OrderedDict([('learningrate', 1.)]),
+                  'outputs': OrderedDict([('param', '%0.4f'), ('finite', '%0.2f')])}
+    test_args = {'inputs': OrderedDict(), 'outputs': OrderedDict([('test', '%0.4f')])}
+    validation_args = {'inputs': OrderedDict(), 'outputs': OrderedDict([('valid', '%0.4f')])}
+    train = TrainModel(model, anneal_lr_freq=100, snapshot_freq=3, rollback_lr=0.5)
+    # Epochs of 2 batches are shorter than snapshot_freq, the snapshot after the third step is taken in epoch 2.
+    train.train_model(f_train, train_args, lambda: [0.], test_args, None, validation_args,
+                      n_train_batches=2, n_epochs=3)
+
+    assert train.n_rollbacks == 1
+    assert calls == [0., 1., 2., 3., 4., 3.]
+    assert model.param == 3.5
+    assert train_args['inputs']['learningrate'] == 0.5
+
+
+def test_rolled_back_steps_do_not_count_as_examples(tmpdir, monkeypatch):
+    monkeypatch.setattr(run_registry, 'get_registry_path', lambda: str(tmpdir.join('runs.sqlite')))
+    model = _CounterModel(str(tmpdir))
+    calls = []
+
+    def f_train(i, batchsize, learningrate):
+        calls.append(model.param)
+        if len(calls) == 2:
+            return [np.nan, 0.]
+        model.param += learningrate
+        return [model.param, 1.]
+
+    train_args = {'inputs': OrderedDict([('batchsize', 10), ('learningrate', 1.)]),
+                  'outputs': OrderedDict([('param', '%0.4f'), ('finite', '%0.2f')])}
+    test_args = {'inputs': OrderedDict(), 'outputs': OrderedDict([('test', '%0.4f')])}
+    validation_args = {'inputs': OrderedDict(), 'outputs': OrderedDict([('valid', '%0.4f')])}
+    train = TrainModel(model, anneal_lr_freq=100, max_examples=40)
+    train.train_model(f_train, train_args, lambda: [0.], test_args, None, validation_args,
+                      n_train_batches=2, n_epochs=10)
+
+    # 10 examples in epoch 1 after the rollback, 30 after epoch 2 and the budget is spent in epoch 3.
+    assert len(calls) == 6
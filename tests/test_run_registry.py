@@ -0,0 +1,29 @@
+import os
+from utils import run_registry
+
+
+def test_rebuild_only_registers_pickled_models(tmpdir):
+    root = tmpdir.mkdir('id_20151209002003_ADGMSSL_784_[500, 500]_200')
+    pickle_path = root.mkdir('pickled model')
+    for name in ['ADGMSSL_784_[500, 500]_200.pkl', 'ADGMSSL_784_[500, 500]_200.pkl_epoch_10',
+                 'ADGMSSL_784_[500, 500]_200.pkl_best', 'column_mask.npy']:
+        pickle_path.join(name).write('')
+    db = str(tmpdir.join('runs.sqlite'))
+    assert run_registry.rebuild(str(tmpdir), db) == 1
+    run = run_registry.find_run('20151209002003', path=db)
+    checkpoints = sorted((os.path.basename(c['path']), c['epoch'], c['tag']) for c in run['checkpoints'])
+    assert checkpoints == [('ADGMSSL_784_[500, 500]_200.pkl', None, None),
+                           ('ADGMSSL_784_[500, 500]_200.pkl_best', None, 'best'),
+                           ('ADGMSSL_784_[500, 500]_200.pkl_epoch_10', 10, None)]
+
+
+def test_rebuild_keeps_the_config_of_indexed_runs(tmpdir):
+    root = str(tmpdir.mkdir('id_20151209002003_ADGMSSL_784_[500, 500]_200'))
+    db = str(tmpdir.join('runs.sqlite'))
+    run_registry.register_run(root, '20151209002003', 'ADGMSSL', 784, [500, 500], 200, {'seed': 1}, path=db)
+    run_registry.update_config(root, {'train_inputs': {'batchsize': 200}}, path=db)
+    created = run_registry.get_run(root, path=db)['created']
+    assert run_registry.rebuild(str(tmpdir), db) == 1
+    run = run_registry.get_run(root, path=db)
+    assert run['config'] == {'seed': 1, 'train_inputs': {'batchsize': 200}}
+    assert run['created'] == created
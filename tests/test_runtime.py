@@ -0,0 +1,37 @@
+import os
+from utils import runtime
+
+
+def _clear(monkeypatch):
+    for var in runtime.THREAD_VARIABLES + ['THEANO_FLAGS']:
+        monkeypatch.delenv(var, raising=False)
+
+
+def test_configure_without_settings_leaves_the_environment(monkeypatch, tmpdir):
+    _clear(monkeypatch)
+    monkeypatch.setenv('OMP_NUM_THREADS', '3')
+    monkeypatch.setenv('THEANO_FLAGS', 'floatX=float64')
+    runtime.configure(config_path=str(tmpdir.join('missing.json')))
+    assert os.environ['OMP_NUM_THREADS'] == '3'
+    assert 'MKL_NUM_THREADS' not in os.environ
+    assert os.environ['THEANO_FLAGS'] == 'floatX=float64'
+
+
+def test_configure_config_file_does_not_override_the_environment(monkeypatch, tmpdir):
+    _clear(monkeypatch)
+    monkeypatch.setenv('OMP_NUM_THREADS', '3')
+    monkeypatch.setenv('THEANO_FLAGS', 'floatX=float64,device=cpu')
+    path = runtime.save_config({'n_threads': 8, 'floatX': 'float32'}, str(tmpdir.join('runtime.json')))
+    runtime.configure(config_path=path)
+    assert os.environ['OMP_NUM_THREADS'] == '3'
+    assert os.environ['MKL_NUM_THREADS'] == '8'
+    assert os.environ['THEANO_FLAGS'] == 'floatX=float64,device=cpu,openmp=True'
+
+
+def test_configure_arguments_override_the_environment(monkeypatch, tmpdir):
+    _clear(monkeypatch)
+    monkeypatch.setenv('OMP_NUM_THREADS', '3')
+    monkeypatch.setenv('THEANO_FLAGS', 'openmp=True')
+    runtime.configure(n_threads=1, config_path=str(tmpdir.join('missing.json')))
+    assert all(os.environ[var] == '1' for var in runtime.THREAD_VARIABLES)
+    assert os.environ['THEANO_FLAGS'] == 'openmp=False'
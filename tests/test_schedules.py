@@ -0,0 +1,25 @@
+from training.schedules import Linear, Piecewise, StepDecay
+
+
+def test_per_batch_and_per_epoch_schedules_agree_at_the_epoch_start():
+    for make in [lambda per_batch: Linear(0., 1., 10, per_batch=per_batch),
+                 lambda per_batch: Piecewise({0: 1, 3: 5}, per_batch=per_batch),
+                 lambda per_batch: StepDecay(1., 0.5, 2, per_batch=per_batch)]:
+        per_epoch, per_batch = make(False), make(True)
+        for epoch in range(1, 6):
+            assert per_batch(epoch, 0, 10) == per_epoch(epoch)
+
+
+def test_per_batch_schedule_is_continuous_over_epochs():
+    schedule = Linear(0., 1., 10, per_batch=True)
+    values = [schedule(epoch, batch, 4) for epoch in range(1, 4) for batch in range(4)]
+    assert all(b > a for a, b in zip(values, values[1:]))
+    assert abs(schedule(2, 0, 4) - (schedule(1, 3, 4) + 0.1 / 4)) < 1e-12
+
+
+def test_schedules_start_at_zero_completed_epochs():
+    assert Linear(0., 1., 10)(1) == 0.
+    assert Linear(0., 1., 10, per_batch=True)(1, 0, 4) == 0.
+    assert Linear(0., 1., 10)(11) == 1.
+    assert Piecewise({0: 1, 3: 5})(3) == 1 and Piecewise({0: 1, 3: 5})(4) == 5
+    assert StepDecay(1., 0.5, 2)(2) == 1. and StepDecay(1., 0.5, 2)(3) == 0.5
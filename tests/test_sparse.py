@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+import scipy.sparse as sp
+from tests.helpers import build_model, semi_supervised, set_inputs
+
+
+def _sparse(x, seed=1234):
+    # Binary bag-of-words like data with about 20% nonzeros.
+    rng = np.random.RandomState(seed)
+    return sp.csr_matrix((rng.uniform(size=x.shape) < 0.2).astype('float32'))
+
+
+@pytest.mark.parametrize('split', [False, True])
+def test_sparse_train_step(split):
+    (x, t), (x_test, t_test), _ = semi_supervised()
+    x, x_test = _sparse(x), _sparse(x_test)
+    train_set = (x, x[:6], t[:6]) if split else (x, t)
+    model = build_model(sparse_x=True)
+    f_train, f_test, _, train_args, _, _ = model.build_model(train_set, (x_test, t_test))
+    outputs = f_train(0, *set_inputs(train_args, samples=2))
+    assert np.all(np.isfinite(outputs[:2]))
+    assert 0 <= f_test(1)[0] <= 100
+
+
+def test_sparse_counts_are_rejected():
+    (x, t), test_set, _ = semi_supervised()
+    x = _sparse(x) * 3
+    with pytest.raises(ValueError):
+        build_model(sparse_x=True).build_model((x, t), (_sparse(test_set[0]), test_set[1]))
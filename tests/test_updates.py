@@ -0,0 +1,47 @@
+import numpy as np
+import theano
+import theano.tensor as T
+from lasagne_extensions.updates import fused_adam, adam_kingma
+
+
+def _reference_adam_kingma(grads, lr, b1, b2, e, gamma):
+    """
+    The Adam steps of [Kingma2014] in numpy, with epsilon added to the bias corrected second moment.
+    """
+    theta, m, v = np.zeros_like(grads[0]), np.zeros_like(grads[0]), np.zeros_like(grads[0])
+    for t, g in enumerate(grads, 1):
+        b1_t = b1 * gamma ** (t - 1)
+        m = b1_t * m + (1 - b1_t) * g
+        v = b2 * v + (1 - b2) * g ** 2
+        theta = theta - lr * (m / (1 - b1 ** t)) / (np.sqrt(v / (1 - b2 ** t)) + e)
+    return theta
+
+
+def _run(make_updates, grads):
+    param = theano.shared(np.zeros(grads[0].shape, dtype=theano.config.floatX))
+    g = T.matrix('g')
+    f = theano.function([g], [], updates=make_updates(g, param))
+    for value in grads:
+        f(value.astype(theano.config.floatX))
+    return param.get_value()
+
+
+def test_fused_adam_matches_adam_kingma():
+    rng = np.random.RandomState(1234)
+    grads = [rng.standard_normal((3, 4)) * 10 ** rng.uniform(-3, 0) for _ in range(5)]
+    lr, b1, b2, e, gamma = 0.01, 0.9, 0.999, 1e-2, 0.99  # A large epsilon so that its correction matters.
+    expected = _reference_adam_kingma(grads, lr, b1, b2, e, gamma)
+
+    fused = _run(lambda g, p: fused_adam([g], [p], lr, b1, b2, e, gamma=gamma, correct_epsilon=True), grads)
+    kingma = _run(lambda g, p: adam_kingma([g], [p], lr, b1, b2, e, gamma=gamma), grads)
+    np.testing.assert_allclose(fused, expected, rtol=1e-4, atol=1e-7)
+    np.testing.assert_allclose(kingma, expected, rtol=1e-4, atol=1e-7)
+
+
+def test_fused_adam_preprocessing():
+    rng = np.random.RandomState(1234)
+    grads = [rng.standard_normal((3, 4)) for _ in range(3)]
+    scaled = [np.clip(g * 4. / 2., -1., 1.) for g in grads]
+    expected = _run(lambda g, p: fused_adam([g], [p], 0.01), scaled)
+    actual = _run(lambda g, p: fused_adam([g], [p], 0.01, grad_scale=4., grad_divisor=2., clip_grad=1.), grads)
+    np.testing.assert_allclose(actual, expected, rtol=1e-5, atol=1e-7)
@@ -0,0 +1,150 @@
+import os
+import glob
+import hashlib
+import numpy as np
+import scipy.sparse as sp
+import theano
+import theano.tensor as T
+from collections import OrderedDict
+from lasagne_extensions.layers import get_output
+from lasagne_extensions.objectives import categorical_crossentropy
+from lasagne_extensions.updates import fused_adam
+from parmesan.distributions import log_normal
+
+
+def _update_hash(h, chunk):
+    if sp.issparse(chunk):
+        for a in [chunk.data, chunk.indices, chunk.indptr]:
+            h.update(np.ascontiguousarray(a))
+    else:
+        h.update(np.ascontiguousarray(chunk))
+
+
+def param_fingerprint(model):
+    """
+    Checksum of the q(a|x) params of a model.
+    """
+    h = hashlib.sha1()
+    values = dict(zip(model.model_params, model.get_param_values()))
+    for param in model.a_params:
+        _update_hash(h, np.asarray(values[param], dtype='float32'))
+    return h.hexdigest()[:16]
+
+
+def data_fingerprint(x, chunk_size=10000):
+    """
+    Checksum of a dataset, computed chunk by chunk, e.g. over a memory-mapped array.
+    """
+    h = hashlib.sha1(str(x.shape))
+    for i in xrange(0, x.shape[0], chunk_size):
+        _update_hash(h, x[i:i + chunk_size])
+    return h.hexdigest()[:16]
+
+
+class EncoderCache(object):
+    """
+    Memory-mapped cache of the q(a|x) means and log-variances of a dataset, computed once with the frozen encoder
+    of a model. The file name holds the checksums of the encoder params and of the data, so a cache is invalidated
+    when the encoder changes, and the caches of older encoder params of the same data are removed.
+    """
+
+    def __init__(self, model, cache_path, chunk_size=10000):
+        """
+        :param model: ADGMSSL instance of a single model.
+        :param cache_path: The directory of the cache files, e.g. env_paths.get_cache_path().
+        :param chunk_size: The number of rows per encoder call.
+        """
+        if model.n_replicas > 1:
+            raise ValueError("The encoder cache does not support ensembles of replicas.")
+        self.model = model
+        self.cache_path = cache_path
+        self.chunk_size = chunk_size
+        outputs = get_output([model.classifier_layers['a_mu'], model.classifier_layers['a_logvar']], model.sym_x_l,
+                             deterministic=True)
+        self.f_moments = model.compile_function([model.sym_x_l], outputs)
+
+    def get_path(self, x):
+        return os.path.join(self.cache_path, 'qa_moments_%s_%s.npy' % (data_fingerprint(x, self.chunk_size),
+                                                                       param_fingerprint(self.model)))
+
+    def load(self, x):
+        """
+        Load the moments of a dataset, running the encoder over the dataset if they are not cached.
+        :param x: The inputs (n x n_x), e.g. memory-mapped or CSR for a model with sparse_x. The moments are
+        computed from x as given, i.e. without sampling binary inputs, as in ADGMSSL.f_y.
+        :return: Memory-mapped moments (n x 2 * n_a), the means followed by the log-variances.
+        """
+        path = self.get_path(x)
+        if not os.path.exists(path):
+            # Remove the caches of the data computed with other encoder params.
+            for stale in glob.glob(path[:path.rfind('_')] + '_*.npy'):
+                os.remove(stale)
+            tmp = path[:-len('.npy')] + '.tmp.npy'
+            out = np.lib.format.open_memmap(tmp, mode='w+', dtype='float32', shape=(x.shape[0], 2 * self.model.n_a))
+            for i in xrange(0, x.shape[0], self.chunk_size):
+                chunk = x[i:i + self.chunk_size]
+                chunk = chunk.astype(theano.config.floatX) if sp.issparse(chunk) else np.asarray(
+                    chunk, dtype=theano.config.floatX)
+                mu, logvar = self.f_moments(chunk)
+                out[i:i + self.chunk_size] = np.concatenate([mu, logvar], axis=1)
+            out.flush()
+            del out
+            os.rename(tmp, path)  # The cache only appears once it is complete.
+        return np.load(path, mmap_mode='r')
+
+
+def build_finetune(model, x, t, moments):
+    """
+    Compile a training function of the q(y|a,x) params only, where a is sampled from the cached moments of the
+    frozen q(a|x) instead of running the encoder. The cost is the negative log-likelihood of the labels under
+    q(y|a,x) plus the weight priors of the y params.
+    :param model: ADGMSSL instance of a single model without flat params.
+    :param x: The labeled inputs (n x n_x).
+    :param t: The one-hot labels (n x n_y).
+    :param moments: The cached moments of x (n x 2 * n_a), cf. EncoderCache.load.
+    :return: train function and dict of arguments.
+    """
+    if model.sh_flat_params is not None:
+        raise ValueError("Fine-tuning does not support flat params.")
+    sh_x = model._shared_data(x)
+    sh_t = theano.shared(np.asarray(t, dtype=theano.config.floatX), borrow=True)
+    sh_moments = theano.shared(np.asarray(moments, dtype=theano.config.floatX), borrow=True)
+    sym_index = T.iscalar('index')
+    sym_batchsize = T.iscalar('batchsize')
+    sym_lr = T.scalar('learningrate')
+    sym_beta1 = T.scalar('beta1')
+    sym_beta2 = T.scalar('beta2')
+
+    batch_slice = slice(sym_index * sym_batchsize, (sym_index + 1) * sym_batchsize)
+    x_batch = model._as_input(sh_x[batch_slice])
+    t_batch = sh_t[batch_slice]
+    a_mu, a_logvar = sh_moments[batch_slice][:, :model.n_a], sh_moments[batch_slice][:, model.n_a:]
+    # Sample a with the samples of a data point in consecutive rows, as the SampleLayer.
+    eps = model._srng.normal((a_mu.shape[0], model.sym_samples, model.n_a), dtype=theano.config.floatX)
+    a = a_mu.dimshuffle(0, 'x', 1) + T.exp(0.5 * a_logvar).dimshuffle(0, 'x', 1) * eps
+    inputs = {model.l_a_sample: a.reshape((-1, model.n_a)), model.l_x_in: x_batch}
+    y = get_output(model.l_y, inputs).mean(axis=(1, 2))  # Mean over samples.
+
+    n = sh_x.shape[0].astype(theano.config.floatX)
+    log_qy = -categorical_crossentropy(T.clip(y, 1e-8, 1.), t_batch)
+    weight_priors = 0.0
+    for p in model.y_params:
+        if 'W' not in str(p):
+            continue
+        weight_priors += log_normal(p, 0, 1).sum()
+    cost = -(log_qy.mean() + weight_priors / n)
+    err = T.mean(T.neq(T.argmax(y, axis=1), T.argmax(t_batch, axis=1))) * 100.
+    updates = fused_adam(T.grad(cost, model.y_params), model.y_params, sym_lr, sym_beta1, sym_beta2,
+                         max_norm=5, clip_grad=1)
+    inputs = [sym_index, sym_batchsize, sym_lr, sym_beta1, sym_beta2, model.sym_samples]
+    f_train = model.compile_function(inputs, [cost, err], updates=updates)
+
+    train_args = {'inputs': OrderedDict(), 'outputs': OrderedDict()}
+    train_args['inputs']['batchsize'] = 100
+    train_args['inputs']['learningrate'] = 3e-4
+    train_args['inputs']['beta1'] = 0.9
+    train_args['inputs']['beta2'] = 0.999
+    train_args['inputs']['samples'] = 10
+    train_args['outputs']['cost'] = '%0.4f'
+    train_args['outputs']['err'] = '%0.2f%%'
+    return f_train, train_args
@@ -0,0 +1,105 @@
+import numpy as np
+
+
+class Schedule(object):
+    """
+    The :class:'Schedule' class represents the value of a training input, e.g. the learning rate or the
+    number of samples, as a function of the training progress. The value is fed into the existing
+    compiled training function, so changing it does not require any recompilation.
+    It should be subclassed when implementing new types of schedules.
+    """
+
+    def __init__(self, per_batch=False):
+        """
+        :param per_batch: If the value is updated before every batch, otherwise before every epoch.
+        """
+        self.per_batch = per_batch
+
+    def __call__(self, epoch, batch=0, n_batches=1):
+        """
+        Evaluate the schedule. Per epoch and per batch schedules share the time t = epoch - 1 + batch / n_batches,
+        the number of completed epochs, so both give the same value at the first batch of an epoch and start at
+        t = 0 in the first epoch.
+        :param epoch: The current epoch, starting from 1.
+        :param batch: The current batch index within the epoch.
+        :param n_batches: The number of batches in the epoch.
+        :return: The value of the input.
+        """
+        if self.per_batch:
+            return self.value(epoch - 1 + float(batch) / n_batches)
+        return self.value(epoch - 1)
+
+    def value(self, t):
+        """
+        :param t: The training progress measured in completed epochs, starting from 0 at the first batch.
+        """
+        raise NotImplementedError
+
+    def __repr__(self):
+        args = ", ".join("%s=%s" % (k, v) for k, v in sorted(self.__dict__.items()))
+        return "%s(%s)" % (self.__class__.__name__, args)
+
+
+class Constant(Schedule):
+    def __init__(self, value, per_batch=False):
+        super(Constant, self).__init__(per_batch)
+        self.v = value
+
+    def value(self, t):
+        return self.v
+
+
+class StepDecay(Schedule):
+    """
+    Multiply the initial value with a factor after every step completed epochs.
+    """
+
+    def __init__(self, value, factor, step, per_batch=False):
+        super(StepDecay, self).__init__(per_batch)
+        self.v, self.factor, self.step = value, factor, step
+
+    def value(self, t):
+        return self.v * self.factor ** np.floor(t / self.step)
+
+
+class Exponential(Schedule):
+    def __init__(self, value, rate, per_batch=False):
+        super(Exponential, self).__init__(per_batch)
+        self.v, self.rate = value, rate
+
+    def value(self, t):
+        return self.v * self.rate ** t
+
+
+class Linear(Schedule):
+    """
+    Linear interpolation from start to end over length epochs beginning after offset completed epochs, e.g. a
+    KL warm-up Linear(0., 1., 200, per_batch=True) of the warmup input, which is 0 at the first batch.
+    """
+
+    def __init__(self, start, end, length, offset=0, per_batch=False):
+        super(Linear, self).__init__(per_batch)
+        self.start, self.end, self.length, self.offset = start, end, length, offset
+
+    def value(self, t):
+        frac = np.clip((t - self.offset) / float(self.length), 0., 1.)
+        return self.start + frac * (self.end - self.start)
+
+
+class Piecewise(Schedule):
+    """
+    Piecewise constant schedule, e.g. the number of samples Piecewise({0: 1, 500: 5, 1000: 10}).
+    The value of a key is used once that number of epochs is completed. The values are returned as given, so integers stay integers.
+    """
+
+    def __init__(self, points, per_batch=False):
+        super(Piecewise, self).__init__(per_batch)
+        self.points = sorted(points.items())
+
+    def value(self, t):
+        v = self.points[0][1]
+        for start, point_value in self.points:
+            if t < start:
+                break
+            v = point_value
+        return v
@@ -0,0 +1,166 @@
+import os
+import csv
+import time
+import multiprocessing
+import numpy as np
+from collections import OrderedDict
+
+# Models compiled in the current (worker) process, keyed by their architecture.
+_compiled = {}
+_dataset = None
+
+
+def share_dataset(data, path):
+    """
+    Save a dataset as .npy files, so that it can be shared read-only between processes through memory-mapping.
+    :param data: The train, test and validation sets, each a tuple of x, t. A split train set is x_u, x_l, t_l.
+    :param path: The directory to save the dataset in.
+    :return: The path of the shared dataset.
+    """
+    if not os.path.exists(path):
+        os.makedirs(path)
+    for name, xy in zip(['train', 'test', 'valid'], data):
+        if xy is None:
+            continue
+        for i, arr in enumerate(xy):
+            np.save(os.path.join(path, '%s_%i.npy' % (name, i)), np.asarray(arr, dtype='float32'))
+    return path
+
+
+def load_shared_dataset(path):
+    """
+    Load a dataset saved by share_dataset as memory-mapped arrays.
+    :param path: The directory of the shared dataset.
+    :return: The train, test and validation sets.
+    """
+    data = []
+    for name in ['train', 'test', 'valid']:
+        p = os.path.join(path, '%s_0.npy' % name)
+        if not os.path.exists(p):
+            data.append(None)
+            continue
+        arrs, i = [], 0
+        while os.path.exists(os.path.join(path, '%s_%i.npy' % (name, i))):  # x, t, or x_u, x_l, t_l.
+            arrs.append(np.load(os.path.join(path, '%s_%i.npy' % (name, i)), mmap_mode='r'))
+            i += 1
+        data.append(tuple(arrs))
+    return tuple(data)
+
+
+def _arch_key(arch):
+    return repr(sorted(arch.items()))
+
+
+def _init_worker(data_path):
+    global _dataset
+    _dataset = load_shared_dataset(data_path)
+
+
+def _get_compiled(model_class, arch):
+    """
+    Build and compile the model for an architecture once per process.
+    """
+    key = (model_class.__name__, _arch_key(arch))
+    if key not in _compiled:
+        model = model_class(**arch)
+        f_train, f_test, f_validate, train_args, test_args, validate_args = model.build_model(*_dataset)
+        _compiled[key] = (model, f_train, f_test, OrderedDict(train_args['inputs']), OrderedDict(test_args['inputs']))
+    return _compiled[key]
+
+
+def run_trial(model_class, trial):
+    """
+    Run a single trial. The params, optimizer state and random streams of the compiled model are reset in place.
+    :param model_class: The model class, e.g. ADGMSSL.
+    :param trial: Dict with 'arch' (model kwargs), 'inputs' (train_args['inputs'] overrides), 'seed', 'n_epochs'
+    and optionally 'id' and 'n_train_batches'.
+    :return: Dict with the trial results.
+    """
+    start_time = time.time()
+    model, f_train, f_test, train_inputs, test_inputs = _get_compiled(model_class, trial['arch'])
+    model.reset(trial.get('seed', 1234))
+    inputs = OrderedDict(train_inputs)
+    for k, v in trial.get('inputs', {}).items():
+        if k not in inputs:
+            raise KeyError("Unknown training input: %s." % k)
+        inputs[k] = v
+    # The batches of a split train set (x_u, x_l, t_l) slice batchsize - batchsize_labeled unlabeled data points.
+    bs_u = inputs['batchsize'] - inputs['batchsize_labeled'] if len(_dataset[0]) == 3 else inputs['batchsize']
+    n_train_batches = trial.get('n_train_batches', _dataset[0][0].shape[0] // bs_u)
+
+    lb = np.nan
+    for epoch in xrange(trial.get('n_epochs', 1)):
+        lb = np.mean([f_train(i, *inputs.values())[0] for i in xrange(n_train_batches)])
+    err = float(f_test(*test_inputs.values())[0])
+
+    result = OrderedDict()
+    result['id'] = trial.get('id', None)
+    result['seed'] = trial.get('seed', 1234)
+    result['arch'] = _arch_key(trial['arch'])
+    for k, v in inputs.items():
+        result[k] = v
+    result['n_epochs'] = trial.get('n_epochs', 1)
+    result['lb'] = float(lb)
+    result['err'] = err
+    result['time'] = time.time() - start_time
+    result['pid'] = os.getpid()
+    return result
+
+
+def _run_trial_star(args):
+    return run_trial(*args)
+
+
+def run_sweep(model_class, trials, data_path, results_path, n_processes=1, logger=None):
+    """
+    Run a sweep of trials over a pool of processes. Each process compiles the training function once per
+    architecture and reuses it for all trials of that architecture. The trials are ordered by architecture,
+    so that consecutive trials in a process share the compiled functions.
+    :param model_class: The model class, e.g. ADGMSSL.
+    :param trials: List of trial dicts (cf. run_trial).
+    :param data_path: The path of the dataset saved by share_dataset.
+    :param results_path: The path of the CSV results table.
+    :param n_processes: The number of processes.
+    :param logger: Optional function taking a string, e.g. print or Train.write_to_logger.
+    :return: List of result dicts.
+    """
+    for i, trial in enumerate(trials):
+        trial.setdefault('id', i)
+    trials = sorted(trials, key=lambda trial: _arch_key(trial['arch']))
+    start_time = time.time()
+    results = []
+    args = [(model_class, trial) for trial in trials]
+    if n_processes == 1:
+        _init_worker(data_path)
+        iterator = (_run_trial_star(a) for a in args)
+    else:
+        pool = multiprocessing.Pool(n_processes, initializer=_init_worker, initargs=(data_path,))
+        iterator = pool.imap_unordered(_run_trial_star, args)
+    for result in iterator:
+        results.append(result)
+        if logger is not None:
+            logger("trial %s;%0.2fs;lb %0.4f;err %0.2f%%" % (str(result['id']), result['time'], result['lb'],
+                                                             result['err']))
+    if n_processes > 1:
+        pool.close()
+        pool.join()
+
+    hours = (time.time() - start_time) / 3600.
+    if logger is not None:
+        logger("%i trials in %0.2f hours: %0.2f trials/hour." % (len(results), hours, len(results) / hours))
+    write_results(sorted(results, key=lambda r: r['id']), results_path)
+    return results
+
+
+def write_results(results, path):
+    """
+    Write the results of a sweep into a single CSV table.
+    """
+    keys = []
+    for result in results:
+        keys += [k for k in result.keys() if k not in keys]
+    with open(path, 'wb') as f:
+        writer = csv.DictWriter(f, fieldnames=keys)
+        writer.writeheader()
+        for result in results:
+            writer.writerow(result)
@@ -1,16 +1,122 @@
+import os
+import csv
 import numpy as np
 from utils import env_paths as paths
+from utils import runtime
+from utils import run_registry
 from base import Train
 import time
 
 
 class TrainModel(Train):
+    # The inputs that change the number of unlabeled data points per batch.
+    resizing_keys = ('batchsize', 'batchsize_labeled')
+
     def __init__(self, model, anneal_lr=1., anneal_lr_freq=np.inf, output_freq=1, pickle_f_custom_freq=None,
-                 f_custom_eval=None):
+                 f_custom_eval=None, schedules=None, patience=None, monitor=None, monitor_mode='min',
+                 min_delta=0., max_hours=None, max_examples=None, restore_best=False, snapshot_freq=100,
+                 rollback_lr=0.5, max_rollbacks=10, batch_seed=None, worker=0):
+        """
+        :param schedules: Dict mapping names of train_args['inputs'] to a Schedule (cf. schedules.py) that
+        sets the input before every epoch or batch, e.g. {'samples': Piecewise({0: 1, 500: 10})}.
+        :param patience: Stop after this number of epochs without improvement of the monitored validation output.
+        The best params are kept in memory and checkpointed on improvement if patience or restore_best is set.
+        :param monitor: The key in validate_args['outputs'] to monitor, defaults to the first output.
+        :param monitor_mode: 'min' or 'max', if the monitored output improves by decreasing or increasing.
+        :param min_delta: The minimum change of the monitored output that counts as an improvement.
+        :param max_hours: Stop after this number of hours of training.
+        :param max_examples: Stop after this number of training examples of finite steps, rolled back steps do not
+        count.
+        :param restore_best: Set the model params to the best params when the training ends.
+        :param snapshot_freq: The number of finite batches, counted across epochs, between in-memory snapshots of
+        the params and the optimizer state. If f_train has a 'finite' output and a batch is not finite, the model
+        is rolled back to the last snapshot and the learning rate is multiplied by rollback_lr. None disables the
+        rollback.
+        :param rollback_lr: The factor of the learning rate after a rollback.
+        :param max_rollbacks: Stop after this number of rollbacks.
+        :param batch_seed: Seed the random streams of the model before every batch from (batch_seed, epoch, batch,
+        worker), so the samples of a batch are reproducible regardless of the batches run before it. This is cheap
+        for the 'counter' rng_backend of the model. None keeps the streams running.
+        :param worker: The index of the training process, to draw different samples in each process.
+        """
         super(TrainModel, self).__init__(model, pickle_f_custom_freq, f_custom_eval)
         self.anneal_lr = anneal_lr
         self.output_freq = output_freq
         self.anneal_lr_freq = anneal_lr_freq
+        self.schedules = schedules if schedules is not None else {}
+        if any(self.schedules[key].per_batch for key in self.resizing_keys if key in self.schedules):
+            raise ValueError("The batchsize can only be scheduled per epoch.")
+        if monitor_mode not in ('min', 'max'):
+            raise ValueError("monitor_mode must be 'min' or 'max'.")
+        self.patience = patience
+        self.monitor = monitor
+        self.monitor_mode = monitor_mode
+        self.min_delta = min_delta
+        self.max_hours = max_hours
+        self.max_examples = max_examples
+        self.restore_best = restore_best
+        self.best_params = None
+        self.best_value = None
+        self.best_epoch = None
+        self.snapshot_freq = snapshot_freq
+        self.rollback_lr = rollback_lr
+        self.max_rollbacks = max_rollbacks
+        self.lr_scale = 1.  # The product of the learning rate cuts of the rollbacks.
+        self.n_rollbacks = 0
+        self.batch_seed = batch_seed
+        self.worker = worker
+
+    def is_improvement(self, value):
+        """
+        Check if the monitored value is an improvement of the best value.
+        """
+        if self.best_value is None:
+            return True
+        if self.monitor_mode == 'min':
+            return value < self.best_value - self.min_delta
+        return value > self.best_value + self.min_delta
+
+    def track_best(self, epoch, value):
+        """
+        Keep an in-memory copy of the model params and checkpoint them if the monitored value improved.
+        :return: True if the value improved.
+        """
+        if not self.is_improvement(value):
+            return False
+        self.best_value, self.best_epoch = value, epoch
+        self.best_params = [np.copy(v) for v in self.model.get_param_values()]
+        if self.pickle_f_custom_freq is not None:
+            self.model.dump_model(tag='best')
+        return True
+
+    def apply_schedules(self, inputs, epoch, batch=0, n_batches=1, per_batch=False):
+        """
+        Set the scheduled inputs for the given point of training.
+        :param inputs: The OrderedDict of inputs to the training function.
+        :param per_batch: If the per batch or the per epoch schedules are applied.
+        """
+        for key, schedule in self.schedules.items():
+            if schedule.per_batch == per_batch:
+                inputs[key] = schedule(epoch, batch, n_batches)
+                if key == 'learningrate':
+                    inputs[key] *= self.lr_scale
+
+    def rollback(self, train_args, snapshot, epoch, batch):
+        """
+        Restore the model from the last snapshot after a non-finite training step and cut the learning rate.
+        :return: True if the training must stop, i.e. after max_rollbacks rollbacks.
+        """
+        self.n_rollbacks += 1
+        if self.n_rollbacks > self.max_rollbacks:
+            self.write_to_logger("Stopping: non-finite training step in epoch %i batch %i after %i rollbacks." %
+                                 (epoch, batch, self.max_rollbacks))
+            return True
+        self.model.restore(snapshot)
+        self.lr_scale *= self.rollback_lr
+        train_args['inputs']['learningrate'] *= self.rollback_lr
+        self.write_to_logger("Rollback %i: non-finite training step in epoch %i batch %i, learning rate %s." %
+                             (self.n_rollbacks, epoch, batch, str(train_args['inputs']['learningrate'])))
+        return False
 
     def train_model(self, f_train, train_args, f_test, test_args, f_validate, validation_args,
                     n_train_batches=600, n_valid_batches=1, n_test_batches=1, n_epochs=100):
@@ -20,20 +126,67 @@ class TrainModel(Train):
         self.write_to_logger("Train -> %s: %s" % (";".join(train_args['inputs'].keys()), str(train_args['inputs'].values())))
         self.write_to_logger("Test -> %s: %s" % (";".join(test_args['inputs'].keys()), str(test_args['inputs'].values())))
         self.write_to_logger("Anneal LR %0.4f after %i."%(self.anneal_lr, int(self.anneal_lr_freq)))
+        self.write_to_logger("Runtime -> %s" % runtime.describe())
+        if self.batch_seed is not None:
+            self.write_to_logger("Random streams -> %s, batch seed %i, worker %i." %
+                                 (getattr(self.model, 'rng_backend', 'shared'), self.batch_seed, self.worker))
+        for key, schedule in self.schedules.items():
+            self.write_to_logger("Schedule %s -> %s." % (key, repr(schedule)))
         self.write_to_logger("### TRAINING MODEL ###")
 
+        resized = any(key in self.schedules for key in self.resizing_keys)
+        if resized and getattr(self.model, 'sh_train_x_l', None) is None:
+            # The interleaved train set holds the labeled data points at the start of every block of a fixed
+            # batchsize (cf. mnist.load_semi_supervised), so another batchsize would misalign them.
+            raise ValueError("The batchsize can only be scheduled with a separate labeled store "
+                             "(cf. mnist.load_semi_supervised_split).")
+        per_batch_schedules = any(schedule.per_batch for schedule in self.schedules.values())
+
+        if self.patience is not None and f_validate is None:
+            raise ValueError("Early stopping requires a validation function.")
+        monitor = self.monitor if self.monitor is not None else validation_args['outputs'].keys()[0]
+        monitor_idx = validation_args['outputs'].keys().index(monitor)
+        train_start_time = time.time()
+        examples_seen = 0
+        finite_idx = None
+        if self.snapshot_freq is not None and 'finite' in train_args['outputs']:
+            finite_idx = train_args['outputs'].keys().index('finite')
+            snapshot = self.model.snapshot()
+        n_steps = 0  # The number of finite training steps across epochs, which sets the snapshot times.
+
         done_looping = False
         epoch = 0
         while (epoch < n_epochs) and (not done_looping):
             epoch += 1
             if epoch % self.anneal_lr_freq == 0:
                 train_args['inputs']['learningrate'] *= self.anneal_lr
+            self.apply_schedules(train_args['inputs'], epoch)
+            if resized:
+                # Every batch slices batchsize - batchsize_labeled data points of the unlabeled store.
+                n_u = self.model.sh_train_x.get_value(borrow=True).shape[0]
+                bs_u = train_args['inputs']['batchsize'] - train_args['inputs']['batchsize_labeled']
+                n_train_batches = int(n_u // bs_u)
 
             start_time = time.time()
             train_outputs = []
             for i in xrange(n_train_batches):
+                if per_batch_schedules:
+                    self.apply_schedules(train_args['inputs'], epoch, i, n_train_batches, per_batch=True)
+                if self.batch_seed is not None:
+                    self.model.reseed_counter(self.batch_seed, epoch, i, self.worker)
                 train_output = f_train(i, *train_args['inputs'].values())
+                if finite_idx is not None and not train_output[finite_idx]:
+                    done_looping = self.rollback(train_args, snapshot, epoch, i)
+                    if done_looping:
+                        break
+                    continue
                 train_outputs.append(train_output)
+                examples_seen += train_args['inputs'].get('batchsize', 1)  # Only the finite steps count.
+                n_steps += 1
+                if finite_idx is not None and n_steps % self.snapshot_freq == 0:
+                    snapshot = self.model.snapshot()
+            if len(train_outputs) == 0:
+                continue  # Every batch of the epoch was rolled back.
             self.eval_train[epoch] = np.mean(np.array(train_outputs), axis=0)
             self.model.after_epoch()
             end_time = time.time() - start_time
@@ -72,6 +225,14 @@ class TrainModel(Train):
                 outputs += [float(o) for o in self.eval_validation[epoch]]
                 output_str %= tuple(outputs)
                 self.write_to_logger(output_str)
+                self.write_metrics(epoch, end_time, train_args, test_args, validation_args)
+
+                if f_validate is not None and (self.patience is not None or self.restore_best):
+                    self.track_best(epoch, float(self.eval_validation[epoch][monitor_idx]))
+                    if self.patience is not None and epoch - self.best_epoch >= self.patience:
+                        self.write_to_logger("Early stopping: no improvement of valid %s since epoch %i." %
+                                             (monitor, self.best_epoch))
+                        done_looping = True
 
             if self.pickle_f_custom_freq is not None and epoch % self.pickle_f_custom_freq == 0:
                 if self.custom_eval_func is not None:
@@ -81,5 +242,56 @@ class TrainModel(Train):
                 self.plot_eval(self.eval_validation, validation_args['outputs'].keys(), "_validation")
                 self.dump_dicts()
                 self.model.dump_model()
+
+            if self.max_hours is not None and time.time() - train_start_time >= self.max_hours * 3600.:
+                self.write_to_logger("Stopping: the time budget of %0.2f hours is spent." % self.max_hours)
+                done_looping = True
+            if self.max_examples is not None and examples_seen >= self.max_examples:
+                self.write_to_logger("Stopping: the budget of %i training examples is spent." % self.max_examples)
+                done_looping = True
+
+        if self.restore_best and self.best_params is not None:
+            self.write_to_logger("Restoring the best params from epoch %i (valid %s: %s)." %
+                                 (self.best_epoch, monitor, str(self.best_value)))
+            self.model.set_param_values(self.best_params)
         if self.pickle_f_custom_freq is not None:
             self.model.dump_model()
+        self.record_run(train_args, test_args, validation_args)
+
+    def write_metrics(self, epoch, epoch_time, train_args, test_args, validation_args):
+        """
+        Append the epoch means of the train outputs, e.g. the terms of the lower bound, and the test and
+        validation outputs to the metrics CSV of the run.
+        """
+        path = paths.get_metrics_path(self.model.get_root_path())
+        header = ['epoch', 'time']
+        row = [epoch, epoch_time]
+        for prefix, eval_dict, args in [('train', self.eval_train, train_args), ('test', self.eval_test, test_args),
+                                        ('valid', self.eval_validation, validation_args)]:
+            header += ['%s_%s' % (prefix, key) for key in args['outputs'].keys()]
+            row += [float(o) for o in eval_dict[epoch]]
+        write_header = not os.path.exists(path)
+        with open(path, 'ab') as f:
+            writer = csv.writer(f)
+            if write_header:
+                writer.writerow(header)
+            writer.writerow(row)
+
+    def record_run(self, train_args, test_args, validation_args):
+        """
+        Record the training arguments and the final metrics of the run in the run registry.
+        """
+        root_path = self.model.get_root_path()
+        config = {'train_inputs': dict(train_args['inputs']), 'test_inputs': dict(test_args['inputs'])}
+        run_registry.record(run_registry.update_config, root_path, config)
+        metrics = {}
+        for prefix, eval_dict, args in [('train', self.eval_train, train_args), ('test', self.eval_test, test_args),
+                                        ('valid', self.eval_validation, validation_args)]:
+            if len(eval_dict) == 0:
+                continue
+            for key, value in zip(args['outputs'].keys(), eval_dict[max(eval_dict.keys())]):
+                metrics['%s_%s' % (prefix, key)] = float(value)
+        if self.best_epoch is not None:
+            metrics['best_epoch'] = self.best_epoch
+            metrics['best_valid'] = self.best_value
+        run_registry.record(run_registry.set_metrics, root_path, metrics)
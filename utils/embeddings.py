@@ -0,0 +1,61 @@
+import numpy as np
+import theano
+from lasagne_extensions.layers import get_output
+
+
+class EmbeddingExporter(object):
+    """
+    Compute the q(a|x) and q(z|x,y) means of a model as embeddings. The z means of unlabeled data are computed
+    with the most probable class of q(y|a,x).
+    """
+
+    def __init__(self, model, kind='a', samples=10):
+        """
+        :param model: ADGMSSL instance of a single model.
+        :param kind: 'a' for the q(a|x) means, 'z' for the q(z|x,y) means or 'az' for both concatenated.
+        :param samples: The number of MC samples of a for the class of unlabeled data.
+        """
+        if kind not in ['a', 'z', 'az']:
+            raise ValueError("Unknown embedding %s, expected 'a', 'z' or 'az'." % kind)
+        if model.n_replicas > 1:
+            raise ValueError("The embedding export does not support ensembles of replicas.")
+        self.model = model
+        self.kind = kind
+        self.samples = samples
+        self.n_out = (model.n_a if 'a' in kind else 0) + (model.n_z if 'z' in kind else 0)
+        outputs = get_output(model.classifier_layers['a_mu'], model.sym_x_l, deterministic=True)
+        self.f_a = model.compile_function([model.sym_x_l], outputs)
+        inputs = {model.l_x_in: model.sym_x_l, model.l_y_in: model.sym_y}
+        outputs = get_output(model.l_z_mu, inputs, deterministic=True)[:, 0, 0, :]
+        self.f_z = model.compile_function([model.sym_x_l, model.sym_y], outputs)
+
+    def __call__(self, x, y=None):
+        """
+        :param x: The inputs (n x n_x).
+        :param y: Optional one-hot labels (n x n_y) for the z means.
+        :return: The embeddings (n x n_out).
+        """
+        x = x.astype(theano.config.floatX)
+        out = []
+        if 'a' in self.kind:
+            out.append(self.f_a(x))
+        if 'z' in self.kind:
+            if y is None:
+                y = np.eye(self.model.n_y)[self.model.f_y(x, self.samples).argmax(axis=1)]
+            out.append(self.f_z(x, y.astype(theano.config.floatX)))
+        return np.concatenate(out, axis=1).astype('float32')
+
+    def export(self, x, path, y=None, chunk_size=10000):
+        """
+        Write the embeddings of a dataset chunk by chunk into a memory-mapped .npy file.
+        :param x: The inputs (n x n_x), e.g. memory-mapped.
+        :param path: The path of the .npy file.
+        :param y: Optional one-hot labels (n x n_y) for the z means.
+        :param chunk_size: The number of rows per chunk.
+        :return: The memory-mapped embeddings (n x n_out).
+        """
+        out = np.lib.format.open_memmap(path, mode='w+', dtype='float32', shape=(x.shape[0], self.n_out))
+        for i in xrange(0, x.shape[0], chunk_size):
+            out[i:i + chunk_size] = self(x[i:i + chunk_size], None if y is None else y[i:i + chunk_size])
+        out.flush()
+        return out
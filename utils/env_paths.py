@@ -48,13 +48,32 @@ def get_model_path(root_path, type, n_in, n_hidden, n_out):
     return join(get_pickle_path(root_path), '%s_%s_%s_%s.pkl' % (type, str(n_in), str(n_hidden), str(n_out)))
 
 
+def get_column_mask_path(root_path):
+    return join(get_pickle_path(root_path), 'column_mask.npy')
+
+
+def get_metrics_path(root_path):
+    return join(root_path, 'metrics.csv')
+
+
+def get_cache_path():
+    return path_exists(join(get_output_path(), 'cache'))
+
+
 # Logging
 def get_logging_path(root_path):
+    from utils import run_registry
     t = time.time()
     n = "_logging_%s.log" % datetime.datetime.fromtimestamp(t).strftime('%Y-%m-%d-%H%M%S')
+    run_registry.record(run_registry.set_log_path, root_path, join(root_path, n))
     return join(root_path, n)
 
 def find_logging_path(id):
+    # Look up the run in the registry before scanning the output directory.
+    from utils import run_registry
+    run = run_registry.record(run_registry.find_run, id)
+    if run is not None and run['log_path'] is not None and exists(run['log_path']):
+        return run['log_path']
     out = get_output_path()
     dirs = listdir(out)
     path = ''
@@ -62,7 +81,7 @@ def find_logging_path(id):
         if str(id) in d:
             path = join(out, d)
     if path == '':
-        raise 'The ID couldn\'t be found'
+        raise ValueError('The ID couldn\'t be found')
     for f in listdir(path):
         if 'log' in f:
             return join(path, f)
@@ -80,7 +99,10 @@ def create_root_output_path(type, n_in, n_hidden, n_out):
     root = 'id_%s_%s_%s_%s_%s' % (str(d), type, str(n_in), str(n_hidden), str(n_out))
     path = join(get_output_path(), root)
     if exists(path): path += "_(%s)" % str(uuid.uuid4())
-    return path_exists(path)
+    path = path_exists(path)
+    from utils import run_registry
+    run_registry.record(run_registry.register_run, path, d, type, n_in, n_hidden, n_out)
+    return path
 
 
 def path_exists(path):
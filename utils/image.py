@@ -0,0 +1,15 @@
+import numpy as np
+
+
+def tile_images(x, n_rows, n_cols, shape=(28, 28)):
+    """
+    Arrange flattened images in a grid without copying them tile by tile.
+    :param x: Matrix of flattened images (n x h*w), n >= n_rows * n_cols.
+    :param n_rows: Number of rows in the grid.
+    :param n_cols: Number of columns in the grid.
+    :param shape: The (height, width) of each image.
+    :return: The grid image (n_rows*h x n_cols*w), filled row by row.
+    """
+    h, w = shape
+    x = np.asarray(x)[:n_rows * n_cols]
+    return x.reshape((n_rows, n_cols, h, w)).transpose(0, 2, 1, 3).reshape((n_rows * h, n_cols * w))
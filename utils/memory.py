@@ -0,0 +1,101 @@
+import sys
+import json
+import resource
+import itertools
+import subprocess
+from os.path import join, exists
+from utils import env_paths as paths
+
+
+def get_profile_path():
+    return join(paths.get_output_path(), 'memory_profile.json')
+
+
+def peak_rss_mb():
+    """
+    :return: The peak resident set size of the process in MB.
+    """
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024. ** 2 if sys.platform == 'darwin' else rss / 1024.  # bytes on OS X, KB on Linux.
+
+
+def largest_intermediates(f, n=10):
+    """
+    Find the largest tensors computed by a Theano function in its last call. The function must be compiled
+    with allow_gc=False, so that the intermediate results are kept in the storage map. This inflates the memory
+    of the process, so the peak RSS must be measured in a separate process with the training flags.
+    :param f: The compiled Theano function.
+    :param n: The number of tensors to return.
+    :return: List of dicts with the size in MB, the shape and the op computing each tensor.
+    """
+    tensors = []
+    for var, storage in f.fn.storage_map.items():
+        value = storage[0]
+        if value is None or not hasattr(value, 'nbytes') or var.owner is None:
+            continue
+        tensors.append({'mb': value.nbytes / 1024. ** 2, 'shape': list(value.shape), 'op': str(var.owner.op)})
+    return sorted(tensors, key=lambda t: t['mb'], reverse=True)[:n]
+
+
+def config_size(config, n_y=10):
+    """
+    The number of rows in the widest tensors of the lower bound, (bs_u * n_y + bs_l) * samples.
+    """
+    bs_l = config['batchsize_labeled']
+    return ((config['batchsize'] - bs_l) * n_y + bs_l) * config['samples']
+
+
+def profile_grid(batchsizes, batchsizes_labeled, samples, script, n_y=10, flags=(), intermediates=False):
+    """
+    Profile f_train for a grid of configurations. Each configuration is run in a separate process, since the
+    peak RSS of a process never decreases.
+    :param script: The script profiling a single configuration when called with --worker bs bs_l samples.
+    :param flags: Additional flags of the script, e.g. ['--synthetic'].
+    :param intermediates: Also find the largest intermediate tensors of each configuration, in another process
+    with allow_gc=False that does not count for the peak RSS.
+    :return: List of profile dicts.
+    """
+    def run(bs, bs_l, s, *extra):
+        out = subprocess.check_output([sys.executable, script, '--worker', str(bs), str(bs_l), str(s)] +
+                                      list(flags) + list(extra))
+        return json.loads(out.strip().split('\n')[-1])
+
+    profile = []
+    for bs, bs_l, s in itertools.product(batchsizes, batchsizes_labeled, samples):
+        if bs_l >= bs:
+            continue
+        result = run(bs, bs_l, s)
+        if intermediates:
+            result['largest'] = run(bs, bs_l, s, '--intermediates')['largest']
+        result['size'] = config_size(result, n_y)
+        profile.append(result)
+    return profile
+
+
+def save_profile(profile, path=None):
+    path = get_profile_path() if path is None else path
+    with open(path, 'w') as f:
+        json.dump(profile, f, indent=2)
+    return path
+
+
+def load_profile(path=None):
+    path = get_profile_path() if path is None else path
+    if not exists(path):
+        return []
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def pick_config(budget_mb, profile, **fixed):
+    """
+    Pick the largest profiled configuration that fits a memory budget.
+    :param budget_mb: The memory budget in MB.
+    :param profile: The profile, cf. profile_grid.
+    :param fixed: Inputs that must match, e.g. batchsize=200.
+    :return: The configuration dict or None if no configuration fits.
+    """
+    fits = [c for c in profile if c['peak_rss_mb'] <= budget_mb and all(c[k] == v for k, v in fixed.items())]
+    if len(fits) == 0:
+        return None
+    return max(fits, key=lambda c: (c['size'], -c['peak_rss_mb']))
@@ -0,0 +1,183 @@
+import numpy as np
+
+
+def _sq_norms(x):
+    return np.einsum('ij,ij->i', x, x)
+
+
+def _normalize(x):
+    return x / np.maximum(np.sqrt(_sq_norms(x)), 1e-12)[:, None]
+
+
+def _sq_distances(queries, x, q_norms, x_norms):
+    """
+    The squared euclidean distances ||q||^2 - 2 q x^T + ||x||^2 as one matrix product (n_q x n).
+    """
+    d = np.dot(queries, x.T)
+    d *= -2
+    d += q_norms[:, None]
+    d += x_norms[None, :]
+    return np.maximum(d, 0, out=d)
+
+
+def _merge(best_d, best_i, d, i, k):
+    """
+    Merge candidate distances d (n_q x m) with indices i (n_q x m) into the running top k of each query.
+    """
+    d = np.concatenate([best_d, d], axis=1)
+    i = np.concatenate([best_i, i], axis=1)
+    if d.shape[1] > k:
+        top = np.argpartition(d, k - 1, axis=1)[:, :k]
+        rows = np.arange(d.shape[0])[:, None]
+        d, i = d[rows, top], i[rows, top]
+    return d, i
+
+
+def _sort(d, i):
+    order = np.argsort(d, axis=1)
+    rows = np.arange(d.shape[0])[:, None]
+    return np.sqrt(d[rows, order]), i[rows, order]
+
+
+def brute_force(queries, x, k=10):
+    """
+    Exact k nearest neighbours from the full distance matrix, as reference for the index.
+    :return: Euclidean distances and indices (n_q x k), sorted by distance.
+    """
+    queries, x = np.asarray(queries, dtype='float32'), np.asarray(x, dtype='float32')
+    d = _sq_distances(queries, x, _sq_norms(queries), _sq_norms(x))
+    i = np.argpartition(d, k - 1, axis=1)[:, :k]
+    return _sort(d[np.arange(d.shape[0])[:, None], i], i)
+
+
+def recall(indices, exact_indices):
+    """
+    The fraction of the exact k nearest neighbours found.
+    """
+    return np.mean([len(np.intersect1d(a, b)) / float(len(b)) for a, b in zip(indices, exact_indices)])
+
+
+class NearestNeighbourIndex(object):
+    """
+    Nearest neighbour index of embeddings, e.g. the q(a|x) or q(z|x,y) means written by utils.embeddings. The
+    distances are computed as matrix products over blocks of the embeddings, so the memory is bounded by the
+    block size. Optionally the embeddings are partitioned into lists, either by the sign pattern of random
+    projections or by k-means centroids (IVF), and a query is only compared to the embeddings in the lists it
+    probes.
+    """
+
+    def __init__(self, x, metric='euclidean', partitioning=None, n_lists=256, n_bits=8, n_probe=8,
+                 block_size=4096, n_iterations=10, seed=1234):
+        """
+        :param x: The embeddings (n x d), e.g. memory-mapped.
+        :param metric: 'euclidean' or 'cosine'.
+        :param partitioning: None for an exact blocked search, 'random_projection' or 'ivf'.
+        :param n_lists: The number of k-means centroids of 'ivf'.
+        :param n_bits: The number of random projections of 'random_projection', i.e. 2 ** n_bits lists.
+        :param n_probe: The number of nearest centroids probed by 'ivf'. 'random_projection' probes the list of
+        the query and the lists that differ in one bit.
+        :param block_size: The number of embeddings per matrix product.
+        :param n_iterations: The number of k-means iterations of 'ivf'.
+        :param seed: The seed of the projections and the k-means initialization.
+        """
+        if metric not in ['euclidean', 'cosine']:
+            raise ValueError("Unknown metric %s." % metric)
+        if partitioning not in [None, 'random_projection', 'ivf']:
+            raise ValueError("Unknown partitioning %s." % partitioning)
+        self.metric = metric
+        self.partitioning = partitioning
+        self.n_probe = n_probe
+        self.block_size = block_size
+        self.x = x if partitioning is None else self._prepare(x)
+        rng = np.random.RandomState(seed)
+        if partitioning is None:
+            self.x_norms = np.concatenate([_sq_norms(self._prepare(self.x[i:i + block_size]))
+                                           for i in xrange(0, self.x.shape[0], block_size)])
+            return
+        if partitioning == 'random_projection':
+            self.projections = rng.standard_normal((self.x.shape[1], n_bits)).astype('float32')
+            lists = self._codes(self.x)
+        else:
+            self.centroids = self._kmeans(self.x, n_lists, n_iterations, rng)
+            lists = self._nearest_centroids(self.x, 1)[:, 0]
+        # Store the embeddings ordered by list, so the embeddings of a list are contiguous.
+        self.order = np.argsort(lists, kind='mergesort')
+        self.x = self.x[self.order]
+        self.x_norms = _sq_norms(self.x)
+        self.offsets = np.searchsorted(lists[self.order], np.arange(self._n_lists() + 1))
+
+    def _prepare(self, x):
+        x = np.asarray(x, dtype='float32')
+        return _normalize(x) if self.metric == 'cosine' else x
+
+    def _n_lists(self):
+        return 2 ** self.projections.shape[1] if self.partitioning == 'random_projection' else len(self.centroids)
+
+    def _codes(self, x):
+        bits = np.dot(x, self.projections) > 0
+        return np.dot(bits, 2 ** np.arange(bits.shape[1]))
+
+    def _nearest_centroids(self, x, n):
+        d = _sq_distances(x, self.centroids, _sq_norms(x), _sq_norms(self.centroids))
+        if n >= d.shape[1]:
+            return np.argsort(d, axis=1)
+        return np.argpartition(d, n - 1, axis=1)[:, :n]
+
+    def _kmeans(self, x, n_lists, n_iterations, rng):
+        self.centroids = x[rng.choice(x.shape[0], n_lists, replace=False)].copy()
+        for _ in xrange(n_iterations):
+            assignment = np.concatenate([self._nearest_centroids(x[i:i + self.block_size], 1)[:, 0]
+                                         for i in xrange(0, x.shape[0], self.block_size)])
+            counts = np.bincount(assignment, minlength=n_lists)
+            sums = np.array([np.bincount(assignment, x[:, j], n_lists) for j in xrange(x.shape[1])]).T
+            nonempty = counts > 0
+            self.centroids[nonempty] = sums[nonempty] / counts[nonempty, None]
+        return self.centroids
+
+    def _probes(self, queries):
+        """
+        :return: The lists probed by each query (n_q x n_probes).
+        """
+        if self.partitioning == 'ivf':
+            return self._nearest_centroids(queries, self.n_probe)
+        codes = self._codes(queries)
+        flips = np.concatenate([[0], 2 ** np.arange(self.projections.shape[1])])
+        return codes[:, None] ^ flips[None, :]
+
+    def search(self, queries, k=10):
+        """
+        :param queries: The query embeddings (n_q x d).
+        :param k: The number of neighbours.
+        :return: Distances and indices of the embeddings (n_q x k), sorted by distance. For the cosine metric the
+        distances are euclidean distances of the normalized embeddings. Missing neighbours of a partitioned
+        search have an infinite distance and index -1.
+        """
+        queries = self._prepare(queries)
+        q_norms = _sq_norms(queries)
+        best_d = np.empty((queries.shape[0], 0), dtype='float32')
+        best_i = np.empty((queries.shape[0], 0), dtype='int64')
+        if self.partitioning is None:
+            for start in xrange(0, self.x.shape[0], self.block_size):
+                block = self._prepare(self.x[start:start + self.block_size])
+                d = _sq_distances(queries, block, q_norms, self.x_norms[start:start + self.block_size])
+                i = np.broadcast_to(np.arange(start, start + block.shape[0]), d.shape)
+                best_d, best_i = _merge(best_d, best_i, d, i, k)
+            return _sort(best_d, best_i)
+
+        best_d = np.full((queries.shape[0], k), np.inf, dtype='float32')
+        best_i = np.full((queries.shape[0], k), -1, dtype='int64')
+        probes = self._probes(queries)
+        # Group the queries by the lists they probe, so each list is compared to its queries in one product.
+        q_idx = np.repeat(np.arange(queries.shape[0]), probes.shape[1])
+        lists = probes.ravel()
+        order = np.argsort(lists, kind='mergesort')
+        q_idx, lists = q_idx[order], lists[order]
+        bounds = np.flatnonzero(np.diff(lists)) + 1
+        for qs, l in zip(np.split(q_idx, bounds), lists[np.concatenate([[0], bounds])]):
+            a, b = self.offsets[l], self.offsets[l + 1]
+            for start in xrange(a, b, self.block_size):
+                stop = min(start + self.block_size, b)
+                d = _sq_distances(queries[qs], self.x[start:stop], q_norms[qs], self.x_norms[start:stop])
+                i = np.broadcast_to(self.order[start:stop], d.shape)
+                best_d[qs], best_i[qs] = _merge(best_d[qs], best_i[qs], d, i, k)
+        return _sort(best_d, best_i)
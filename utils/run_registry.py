@@ -0,0 +1,219 @@
+import os
+import json
+import time
+import sqlite3
+from os.path import join, exists, isdir
+from utils import env_paths as paths
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (root_path TEXT PRIMARY KEY, id TEXT, model TEXT, n_in TEXT, n_hidden TEXT,
+                                 n_out TEXT, log_path TEXT, config TEXT, created REAL);
+CREATE INDEX IF NOT EXISTS runs_id ON runs (id);
+CREATE TABLE IF NOT EXISTS checkpoints (path TEXT PRIMARY KEY, root_path TEXT, epoch INTEGER, tag TEXT,
+                                        created REAL);
+CREATE INDEX IF NOT EXISTS checkpoints_root_path ON checkpoints (root_path);
+CREATE TABLE IF NOT EXISTS metrics (root_path TEXT, name TEXT, value REAL, PRIMARY KEY (root_path, name));
+CREATE INDEX IF NOT EXISTS metrics_name_value ON metrics (name, value);
+"""
+
+
+def get_registry_path():
+    return join(paths.get_output_path(), 'runs.sqlite')
+
+
+def connect(path=None):
+    """
+    Open the run registry, an SQLite database in the output root indexing the runs by id, the checkpoints by run
+    and the final metrics by name and value.
+    :param path: The path of the database, defaults to get_registry_path().
+    :return: sqlite3 connection.
+    """
+    db = sqlite3.connect(get_registry_path() if path is None else path, timeout=30.)
+    db.row_factory = sqlite3.Row
+    db.executescript(_SCHEMA)
+    return db
+
+
+def _execute(sql, args, path=None):
+    db = connect(path)
+    try:
+        with db:
+            db.execute(sql, args)
+    finally:
+        db.close()
+
+
+def parse_root_path(root_path):
+    """
+    Parse a root output path 'id_<id>_<model>_<n_in>_<n_hidden>_<n_out>' (cf. env_paths.create_root_output_path).
+    :return: Dict of id, model, n_in, n_hidden and n_out, or None if the path is not a root output path.
+    """
+    name = os.path.basename(os.path.normpath(root_path))
+    if name.endswith(')') and '_(' in name:  # uuid suffix of a duplicate root path.
+        name = name[:name.rfind('_(')]
+    parts = name.split('_')
+    if len(parts) < 6 or parts[0] != 'id':
+        return None
+    return {'id': parts[1], 'model': '_'.join(parts[2:-3]), 'n_in': parts[-3], 'n_hidden': parts[-2],
+            'n_out': parts[-1]}
+
+
+def register_run(root_path, run_id, model, n_in, n_hidden, n_out, config=None, path=None):
+    """
+    Record a run when its root output path is created. A run that is already recorded is kept as it is, so that
+    rebuild does not reset the configuration and the creation time of the indexed runs.
+    :param config: Optional dict of the configuration of the run.
+    """
+    _execute("INSERT OR IGNORE INTO runs (root_path, id, model, n_in, n_hidden, n_out, config, created) "
+             "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+             (root_path, str(run_id), model, str(n_in), str(n_hidden), str(n_out),
+              json.dumps(config or {}, default=str), time.time()), path)
+
+
+def set_log_path(root_path, log_path, path=None):
+    _execute("UPDATE runs SET log_path = ? WHERE root_path = ?", (log_path, root_path), path)
+
+
+def update_config(root_path, config, path=None):
+    """
+    Merge a dict into the recorded configuration of a run, e.g. the training arguments.
+    """
+    run = get_run(root_path, path)
+    if run is None:
+        return
+    merged = run['config']
+    merged.update(config)
+    _execute("UPDATE runs SET config = ? WHERE root_path = ?", (json.dumps(merged, default=str), root_path), path)
+
+
+def register_checkpoint(root_path, checkpoint_path, epoch=None, tag=None, path=None):
+    _execute("INSERT OR REPLACE INTO checkpoints (path, root_path, epoch, tag, created) VALUES (?, ?, ?, ?, ?)",
+             (checkpoint_path, root_path, epoch, tag, time.time()), path)
+
+
+def set_metrics(root_path, metrics, path=None):
+    """
+    Record the final metrics of a run.
+    :param metrics: Dict of metric name and float value, e.g. {'test_err': 1.2}.
+    """
+    db = connect(path)
+    try:
+        with db:
+            db.executemany("INSERT OR REPLACE INTO metrics (root_path, name, value) VALUES (?, ?, ?)",
+                           [(root_path, name, float(value)) for name, value in metrics.items()])
+    finally:
+        db.close()
+
+
+def _run_dict(db, row):
+    run = dict(row)
+    run['config'] = json.loads(run['config'] or '{}')
+    run['checkpoints'] = [dict(r) for r in db.execute(
+        "SELECT path, epoch, tag FROM checkpoints WHERE root_path = ? ORDER BY created", (run['root_path'],))]
+    run['metrics'] = dict((r['name'], r['value']) for r in db.execute(
+        "SELECT name, value FROM metrics WHERE root_path = ?", (run['root_path'],)))
+    return run
+
+
+def get_run(root_path, path=None):
+    """
+    :return: Dict of the run recorded for a root output path including config, checkpoints and metrics, or None.
+    """
+    db = connect(path)
+    try:
+        row = db.execute("SELECT * FROM runs WHERE root_path = ?", (root_path,)).fetchone()
+        return None if row is None else _run_dict(db, row)
+    finally:
+        db.close()
+
+
+def find_run(run_id, model=None, path=None):
+    """
+    Look up the latest run with an id through the index of the registry.
+    :param run_id: The run id, i.e. the timestamp of the root output path.
+    :param model: Optional model name, e.g. 'ADGMSSL'.
+    :return: Dict of the run or None.
+    """
+    db = connect(path)
+    try:
+        if model is None:
+            row = db.execute("SELECT * FROM runs WHERE id = ? ORDER BY created DESC LIMIT 1", (str(run_id),))
+        else:
+            row = db.execute("SELECT * FROM runs WHERE id = ? AND model = ? ORDER BY created DESC LIMIT 1",
+                             (str(run_id), model))
+        row = row.fetchone()
+        return None if row is None else _run_dict(db, row)
+    finally:
+        db.close()
+
+
+def best_runs(metric, mode='min', limit=1, path=None):
+    """
+    Query the runs with the best final value of a metric through the (name, value) index.
+    :param metric: The metric name, e.g. 'test_err'.
+    :param mode: 'min' or 'max'.
+    :param limit: The number of runs.
+    :return: List of run dicts.
+    """
+    order = 'ASC' if mode == 'min' else 'DESC'
+    db = connect(path)
+    try:
+        rows = db.execute("SELECT runs.* FROM metrics JOIN runs ON runs.root_path = metrics.root_path "
+                          "WHERE metrics.name = ? ORDER BY metrics.value %s LIMIT ?" % order, (metric, limit))
+        return [_run_dict(db, row) for row in rows.fetchall()]
+    finally:
+        db.close()
+
+
+def rebuild(output_path=None, path=None):
+    """
+    Index the existing root output paths, their log files and pickled models, e.g. for runs created before the
+    registry. The final metrics are not recovered.
+    :param output_path: The output root, defaults to env_paths.get_output_path().
+    :return: The number of indexed runs.
+    """
+    output_path = paths.get_output_path() if output_path is None else output_path
+    n = 0
+    for d in sorted(os.listdir(output_path)):
+        root_path = join(output_path, d)
+        info = parse_root_path(root_path)
+        if info is None or not isdir(root_path):
+            continue
+        register_run(root_path, info['id'], info['model'], info['n_in'], info['n_hidden'], info['n_out'], path=path)
+        logs = [f for f in sorted(os.listdir(root_path)) if 'log' in f]
+        if len(logs) > 0:
+            set_log_path(root_path, join(root_path, logs[-1]), path)
+        pickle_path = join(root_path, 'pickled model')
+        if exists(pickle_path):
+            for f in sorted(os.listdir(pickle_path)):
+                if '.pkl' not in f:
+                    continue  # e.g. the column mask saved next to the pickled models.
+                register_checkpoint(root_path, join(pickle_path, f), *_parse_checkpoint(f), path=path)
+        n += 1
+    return n
+
+
+def _parse_checkpoint(name):
+    """
+    Parse the epoch and tag from a pickled model name '<model>_..._epoch_<epoch>_<tag>' (cf. Model.dump_model).
+    """
+    epoch, tag = None, None
+    rest = name.split('.pkl', 1)[-1].strip('_')
+    if rest.startswith('epoch_'):
+        parts = rest[len('epoch_'):].split('_', 1)
+        epoch = int(parts[0])
+        rest = parts[1] if len(parts) > 1 else ''
+    if len(rest) > 0:
+        tag = rest
+    return epoch, tag
+
+
+def record(fn, *args, **kwargs):
+    """
+    Call a registry function from the training and serialization code, where a locked or unavailable registry,
+    e.g. on shared storage, must not interrupt the run.
+    """
+    try:
+        return fn(*args, **kwargs)
+    except sqlite3.Error as e:
+        print "The run registry could not be updated: %s." % str(e)
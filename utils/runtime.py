@@ -0,0 +1,95 @@
+import os
+import sys
+import json
+from collections import OrderedDict
+from os.path import join, exists
+from utils import env_paths as paths
+
+# The thread count environment variables of the common BLAS and OpenMP implementations.
+THREAD_VARIABLES = ['OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'GOTO_NUM_THREADS',
+                    'VECLIB_MAXIMUM_THREADS']
+
+_settings = None
+
+
+def get_config_path():
+    return join(paths.get_output_path(), 'runtime.json')
+
+
+def load_config(path=None):
+    """
+    Load the runtime settings saved by e.g. the thread calibration.
+    :param path: The path of the config file, defaults to runtime.json in the output path.
+    :return: Dict of settings, empty if no config file exists.
+    """
+    path = get_config_path() if path is None else path
+    if not exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def save_config(settings, path=None):
+    path = get_config_path() if path is None else path
+    with open(path, 'w') as f:
+        json.dump(settings, f, indent=2, sort_keys=True)
+    return path
+
+
+def configure(n_threads=None, openmp=None, openmp_elemwise_minsize=None, floatX=None, config_path=None):
+    """
+    Set the BLAS and OpenMP thread counts and the Theano flags. This must be called before Theano is imported,
+    since neither BLAS nor Theano read the settings afterwards. Only the settings passed as arguments or saved in
+    the config file are applied. The arguments override the environment, while the settings of the config file
+    leave environment variables and THEANO_FLAGS that are already set untouched, e.g. limits of a scheduler.
+    :param n_threads: The number of BLAS and OpenMP threads.
+    :param openmp: If Theano parallelizes elementwise operations with OpenMP, defaults to n_threads > 1.
+    :param openmp_elemwise_minsize: The minimum size of an elementwise operation to run in parallel.
+    :param floatX: The Theano floatX.
+    :param config_path: The path of the config file.
+    :return: Dict of the applied settings.
+    """
+    global _settings
+    config = load_config(config_path)
+    explicit = dict((key, value) for key, value in [('n_threads', n_threads), ('openmp', openmp),
+                                                    ('openmp_elemwise_minsize', openmp_elemwise_minsize),
+                                                    ('floatX', floatX)] if value is not None)
+    settings = dict((key, config[key]) for key in ['n_threads', 'openmp', 'openmp_elemwise_minsize', 'floatX']
+                    if config.get(key) is not None)
+    settings.update(explicit)
+    if 'n_threads' in settings and 'openmp' not in settings:
+        settings['openmp'] = settings['n_threads'] > 1
+        if 'n_threads' in explicit:
+            explicit['openmp'] = settings['openmp']
+
+    if 'theano' in sys.modules:
+        print "Theano is already imported, the runtime settings are not applied."
+    if 'n_threads' in settings:
+        for var in THREAD_VARIABLES:
+            if 'n_threads' in explicit or var not in os.environ:
+                os.environ[var] = str(settings['n_threads'])
+    flags = OrderedDict(f.split('=', 1) for f in os.environ.get('THEANO_FLAGS', '').split(',') if '=' in f)
+    for key, value in [('floatX', settings.get('floatX')), ('openmp', settings.get('openmp')),
+                       ('openmp_elemwise_minsize', settings.get('openmp_elemwise_minsize'))]:
+        if value is not None and (key in explicit or key not in flags):
+            flags[key] = str(bool(value)) if key == 'openmp' else str(value)
+    if len(flags) > 0:
+        os.environ['THEANO_FLAGS'] = ','.join('%s=%s' % item for item in flags.items())
+    _settings = settings
+    return settings
+
+
+def describe():
+    """
+    Describe the runtime settings, e.g. for the training log.
+    :return: The description string.
+    """
+    s = ";".join("%s=%s" % (var, os.environ.get(var, '')) for var in THREAD_VARIABLES[:3])
+    if 'theano' in sys.modules:
+        import theano
+        s += ";floatX=%s;openmp=%s;openmp_elemwise_minsize=%i;blas.ldflags=%s" % (
+            theano.config.floatX, str(theano.config.openmp), theano.config.openmp_elemwise_minsize,
+            theano.config.blas.ldflags)
+    if _settings is None:
+        s += ";not configured"
+    return s